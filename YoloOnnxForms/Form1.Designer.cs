@@ -33,6 +33,7 @@
             btnDetect = new Button();
             lbResults = new ListBox();
             lblStatus = new Label();
+            lblMetrics = new Label();
             textBoxConf = new TextBox();
             labelConfianca = new Label();
             btnOpenCamera = new Button();
@@ -87,6 +88,14 @@
             lblStatus.TabIndex = 5;
             lblStatus.Text = "Pronto";
             // 
+            // lblMetrics
+            // 
+            lblMetrics.AutoSize = true;
+            lblMetrics.Location = new Point(638, 135);
+            lblMetrics.Name = "lblMetrics";
+            lblMetrics.Size = new Size(0, 20);
+            lblMetrics.TabIndex = 11;
+            // 
             // textBoxConf
             // 
             textBoxConf.Location = new Point(1004, 89);
@@ -144,6 +153,7 @@
             Controls.Add(btnOpenCamera);
             Controls.Add(labelConfianca);
             Controls.Add(textBoxConf);
+            Controls.Add(lblMetrics);
             Controls.Add(lblStatus);
             Controls.Add(lbResults);
             Controls.Add(btnDetect);
@@ -163,6 +173,7 @@
         private Button btnDetect;
         private ListBox lbResults;
         private Label lblStatus;
+        private Label lblMetrics;
         private TextBox textBoxConf;
         private Label labelConfianca;
         private Button btnOpenCamera;
@@ -25,10 +25,53 @@ namespace YoloOnnxForms
         private const string YoloPtModelPath =
             @"C:\Users\epuhl\source\repos\YoloOnnxForms\YoloOnnxForms\Models\best.pt";  // AJUSTAR
 
+        // Formato do stdout do Python:
+        // false = uma linha JSON por frame (imagem em base64)
+        // true  = frames binários com tamanho prefixado (--protocol binary), sem base64/JSON
+        private static readonly bool UseBinaryProtocol = false;
+
+        // true = o Python grava os frames num ring buffer em memória compartilhada (--shm)
+        // e o stdout leva só o índice do slot + detecções (sem encode/base64 da imagem)
+        private static readonly bool UseSharedMemoryRing = false;
+
+        private static readonly string RingBufferPath =
+            Path.Combine(Path.GetTempPath(), "YoloOnnxForms_frames.ring");
+
+        // true = o Python mede o tempo de cada estágio (--metrics) e manda linhas
+        // "[METRICS] {json}" no stderr; FPS e gargalo aparecem em lblMetrics
+        private static readonly bool ShowPipelineMetrics = false;
+        private const string MetricsPrefix = "[METRICS] ";
+
+        // true = o Python não roda o YOLO enquanto a cena está parada (--motion-gate),
+        // repetindo as últimas caixas; economiza CPU com a esteira parada
+        private static readonly bool UseMotionGate = false;
+
+        // Prévia: true = o Python reduz o frame anotado para o tamanho do pictureBox1 antes do
+        // JPEG (--preview-size); as detecções continuam em todos os frames, em coordenadas do
+        // vídeo. Os padrões mantêm a prévia de antes (resolução cheia, qualidade 95); reduzir
+        // o tamanho ou a qualidade alivia o pipe e a CPU em troca de uma imagem mais pobre
+        private static readonly bool FitPreviewToPictureBox = false;
+        private const int PreviewJpegQuality = 95;
+        private const double PreviewMaxFps = 0;   // 0 = prévia em todos os frames
+
+        // O que o Python faz quando esta tela não lê o stdout a tempo (--output-policy):
+        // "block" (padrão) segura a detecção e a prévia mostra todos os frames;
+        // "drop-images"/"coalesce" descartam só imagens e mantêm as detecções de todos
+        // os frames, sem frear o YOLO por causa da UI, mas a prévia pula frames
+        private const string OutputPolicy = "block";
+
+        // true = --fast-start: o Python aquece o modelo enquanto abre a câmera e guarda um
+        // modelo pré-processado ao lado do best.pt (precisa de escrita na pasta do modelo);
+        // a linha "[READY] {json}" do stderr avisa quando está tudo pronto (com os tempos
+        // de cada etapa)
+        private static readonly bool UseFastStart = false;
+        private const string ReadyPrefix = "[READY] ";
+
         // Processo Python em execução (vídeo ou câmera)
         private Process? _pythonProcess;
         private bool _cameraRunning = false;     // se true, botão "Abrir Câmera" passa a "Fechar Câmera"
         private bool _cancelRequested = false;   // flag para cancelar leitura do streaming
+        private FrameRingReader? _frameRing;     // aberto no 1º frame quando UseSharedMemoryRing = true
 
         // LOG EM CSV
         private string? _currentLogFilePath;     // caminho do CSV atual
@@ -247,6 +290,12 @@ namespace YoloOnnxForms
         {
             _cancelRequested = false;
 
+            string previewArgs =
+                (FitPreviewToPictureBox ? $" --preview-size {pictureBox1.Width}x{pictureBox1.Height}" : "") +
+                $" --jpeg-quality {PreviewJpegQuality}" +
+                $" --output-policy {OutputPolicy}" +
+                (PreviewMaxFps > 0 ? $" --preview-fps {PreviewMaxFps.ToString(CultureInfo.InvariantCulture)}" : "");
+
             var psi = new ProcessStartInfo
             {
                 FileName = PythonExePath,
@@ -254,7 +303,13 @@ namespace YoloOnnxForms
                     $"-u \"{PythonScriptPath}\" " +
                     $"--model \"{YoloPtModelPath}\" " +
                     $"--video \"{mediaPath}\" " +
-                    $"--conf {conf.ToString(CultureInfo.InvariantCulture)}",
+                    $"--conf {conf.ToString(CultureInfo.InvariantCulture)}" +
+                    (UseBinaryProtocol ? " --protocol binary" : "") +
+                    (UseSharedMemoryRing ? $" --shm \"{RingBufferPath}\"" : "") +
+                    (ShowPipelineMetrics ? " --metrics" : "") +
+                    (UseMotionGate ? " --motion-gate" : "") +
+                    (UseFastStart ? " --fast-start" : "") +
+                    previewArgs,
                 UseShellExecute = false,
                 RedirectStandardOutput = true,
                 RedirectStandardError = true,
@@ -266,9 +321,34 @@ namespace YoloOnnxForms
             var proc = new Process { StartInfo = psi };
             _pythonProcess = proc;
 
+            // stderr lido em paralelo: com --metrics o Python escreve nele o tempo todo
+            // e um pipe cheio travaria o processo
+            var stderrText = new StringBuilder();
+            proc.ErrorDataReceived += (s, e) =>
+            {
+                if (e.Data == null)
+                    return;
+
+                if (e.Data.StartsWith(MetricsPrefix, StringComparison.Ordinal))
+                {
+                    ExibirMetricas(e.Data.Substring(MetricsPrefix.Length));
+                    return;
+                }
+
+                if (e.Data.StartsWith(ReadyPrefix, StringComparison.Ordinal))
+                {
+                    ExibirProntidao(e.Data.Substring(ReadyPrefix.Length));
+                    return;
+                }
+
+                lock (stderrText)
+                    stderrText.AppendLine(e.Data);
+            };
+
             try
             {
                 proc.Start();
+                proc.BeginErrorReadLine();
             }
             catch (Exception ex)
             {
@@ -278,120 +358,275 @@ namespace YoloOnnxForms
 
             try
             {
-                string? line;
+                if (UseBinaryProtocol)
+                    LerFramesBinarios(proc);
+                else
+                    LerFramesJson(proc);
 
-                while (!_cancelRequested && (line = proc.StandardOutput.ReadLine()) != null)
+                if (_cancelRequested)
                 {
-                    if (string.IsNullOrWhiteSpace(line))
-                        continue;
-
-                    FrameResult? frame;
                     try
                     {
-                        frame = JsonSerializer.Deserialize<FrameResult>(line);
-                    }
-                    catch
-                    {
-                        continue;
+                        if (!proc.HasExited)
+                        {
+                            proc.Kill();
+                            proc.WaitForExit(2000);
+                        }
                     }
+                    catch { }
+                    return;
+                }
 
-                    if (frame == null)
-                        continue;
+                proc.WaitForExit();   // também espera o stderr assíncrono terminar
 
-                    Bitmap? bmp = null;
-                    try
+                string stderr;
+                lock (stderrText)
+                    stderr = stderrText.ToString();
+
+                if (proc.ExitCode != 0)
+                {
+                    throw new Exception(
+                        $"Python retornou código {proc.ExitCode}.\nSTDERR:\n{stderr}");
+                }
+            }
+            finally
+            {
+                _frameRing?.Dispose();
+                _frameRing = null;
+
+                proc.Dispose();
+                _pythonProcess = null;
+            }
+        }
+
+        private void LerFramesJson(Process proc)
+        {
+            string? line;
+
+            while (!_cancelRequested && (line = proc.StandardOutput.ReadLine()) != null)
+            {
+                if (string.IsNullOrWhiteSpace(line))
+                    continue;
+
+                FrameResult? frame;
+                try
+                {
+                    frame = JsonSerializer.Deserialize<FrameResult>(line);
+                }
+                catch
+                {
+                    continue;
+                }
+
+                if (frame == null)
+                    continue;
+
+                byte[]? bytes = null;
+                try
+                {
+                    bytes = Convert.FromBase64String(frame.image);
+                }
+                catch
+                {
+                }
+
+                if (!ExibirFrame(frame, CarregarImagem(frame, bytes)))
+                    break;
+            }
+        }
+
+        private void LerFramesBinarios(Process proc)
+        {
+            var reader = new FrameProtocolReader(proc.StandardOutput.BaseStream);
+            BinaryFrame? binFrame;
+
+            while (!_cancelRequested && (binFrame = reader.ReadFrame()) != null)
+            {
+                var frame = new FrameResult
+                {
+                    frame_index = binFrame.FrameIndex,
+                    time_seconds = binFrame.TimeSeconds,
+                    slot = binFrame.Slot,
+                    detected = binFrame.Detected,
+                    @static = binFrame.Static,
+                    source = binFrame.Source
+                };
+
+                foreach (var d in binFrame.Detections)
+                {
+                    frame.detections.Add(new DetectionDto
                     {
-                        byte[] bytes = Convert.FromBase64String(frame.image);
-                        using (var ms = new MemoryStream(bytes))
-                        {
-                            bmp = new Bitmap(ms);
-                        }
-                    }
-                    catch
+                        track_id = d.TrackId,
+                        class_id = d.ClassId,
+                        score = d.Score,
+                        x = d.X,
+                        y = d.Y,
+                        w = d.W,
+                        h = d.H,
+                        is_new = d.IsNew
+                    });
+                }
+
+                if (!ExibirFrame(frame, CarregarImagem(frame, binFrame.Jpeg)))
+                    break;
+            }
+        }
+
+        // Imagem do frame: do ring buffer (slot >= 0) ou dos bytes JPEG que vieram no stdout.
+        private Bitmap? CarregarImagem(FrameResult frame, byte[]? jpegBytes)
+        {
+            try
+            {
+                if (frame.slot >= 0)
+                {
+                    _frameRing ??= new FrameRingReader(RingBufferPath);
+
+                    // null = slot já sobrescrito (UI atrasada) -> mostra só as detecções
+                    return _frameRing.ReadFrame(frame.slot, frame.frame_index);
+                }
+
+                if (jpegBytes != null && jpegBytes.Length > 0)
+                {
+                    using (var ms = new MemoryStream(jpegBytes))
                     {
+                        return new Bitmap(ms);
                     }
+                }
+            }
+            catch
+            {
+            }
 
-                    if (bmp != null)
-                    {
-                        if (IsDisposed) break;
+            return null;
+        }
 
-                        Invoke(new Action(() =>
-                        {
-                            if (IsDisposed) return;
+        // Mostra a imagem e as detecções de um frame. Retorna false se o form já foi fechado.
+        private bool ExibirFrame(FrameResult frame, Bitmap? bmp)
+        {
+            if (bmp != null)
+            {
+                if (IsDisposed) return false;
 
-                            pictureBox1.Image?.Dispose();
-                            pictureBox1.Image = (Bitmap)bmp.Clone();
-                        }));
-                        bmp.Dispose();
-                    }
+                Invoke(new Action(() =>
+                {
+                    if (IsDisposed) return;
 
-                    if (IsDisposed) break;
+                    pictureBox1.Image?.Dispose();
+                    pictureBox1.Image = (Bitmap)bmp.Clone();
+                }));
+                bmp.Dispose();
+            }
 
-                    Invoke(new Action(() =>
-                    {
-                        if (IsDisposed) return;
+            if (IsDisposed) return false;
 
-                        foreach (var d in frame.detections)
-                        {
-                            if (!d.is_new)
-                                continue;
+            Invoke(new Action(() =>
+            {
+                if (IsDisposed) return;
 
-                            string linha =
-                                $"[t={frame.time_seconds:0.0}s F{frame.frame_index}] " +
-                                $"Track {d.track_id} | Classe {d.class_id} | Score {d.score:0.00}";
+                foreach (var d in frame.detections)
+                {
+                    if (!d.is_new)
+                        continue;
 
-                            lbResults.Items.Insert(0, linha);
+                    string linha =
+                        $"[t={frame.time_seconds:0.0}s F{frame.frame_index}] " +
+                        $"Track {d.track_id} | Classe {d.class_id} | Score {d.score:0.00}";
 
-                            RegistrarDeteccaoCsv(_currentSourceLabel, frame, d);
-                        }
+                    lbResults.Items.Insert(0, linha);
 
-                        if (frame.detections != null && frame.detections.Count > 0)
-                        {
-                            var partes = new List<string>();
-                            foreach (var d in frame.detections)
-                            {
-                                partes.Add($"T{d.track_id}-C{d.class_id}({d.score:0.00})");
-                            }
-
-                            string resumo = string.Join("  ", partes);
-                            lblStatus.Text =
-                                $"Frame {frame.frame_index} (t={frame.time_seconds:0.0}s) | {resumo}";
-                        }
-                        else
-                        {
-                            lblStatus.Text =
-                                $"Frame {frame.frame_index} (t={frame.time_seconds:0.0}s) | sem detecções";
-                        }
-                    }));
+                    RegistrarDeteccaoCsv(_currentSourceLabel, frame, d);
                 }
 
-                if (_cancelRequested)
+                string origem = frame.@static ? " [parado]" : frame.detected ? "" : " [previsto]";
+
+                if (frame.detections != null && frame.detections.Count > 0)
                 {
-                    try
+                    var partes = new List<string>();
+                    foreach (var d in frame.detections)
                     {
-                        if (!proc.HasExited)
-                        {
-                            proc.Kill();
-                            proc.WaitForExit(2000);
-                        }
+                        partes.Add($"T{d.track_id}-C{d.class_id}({d.score:0.00})");
                     }
-                    catch { }
-                    return;
+
+                    string resumo = string.Join("  ", partes);
+                    lblStatus.Text =
+                        $"Frame {frame.frame_index} (t={frame.time_seconds:0.0}s){origem} | {resumo}";
                 }
+                else
+                {
+                    lblStatus.Text =
+                        $"Frame {frame.frame_index} (t={frame.time_seconds:0.0}s){origem} | sem detecções";
+                }
+            }));
 
-                string stderr = proc.StandardError.ReadToEnd();
-                proc.WaitForExit();
+            return true;
+        }
 
-                if (proc.ExitCode != 0)
+        // Registro do --metrics: FPS e estágio mais lento (ver Python/stage_metrics.py).
+        // Handshake [READY]: modelo carregado e fontes abertas, antes do 1º frame.
+        private void ExibirProntidao(string json)
+        {
+            ReadyRecord? record;
+            try
+            {
+                record = JsonSerializer.Deserialize<ReadyRecord>(json);
+            }
+            catch
+            {
+                return;
+            }
+
+            if (record == null || IsDisposed)
+                return;
+
+            string texto =
+                $"Modelo pronto em {record.total_s:0.0}s (import {record.imports_s:0.0}s, " +
+                $"modelo {record.model_s:0.0}s{(record.model_cached ? " do cache" : "")}, " +
+                $"aquecimento {record.warmup_s:0.0}s, fonte {record.capture_s:0.0}s). Aguardando o 1º frame...";
+
+            try
+            {
+                BeginInvoke(new Action(() =>
                 {
-                    throw new Exception(
-                        $"Python retornou código {proc.ExitCode}.\nSTDERR:\n{stderr}");
-                }
+                    if (!IsDisposed)
+                        lblStatus.Text = texto;
+                }));
             }
-            finally
+            catch (InvalidOperationException)
             {
-                proc.Dispose();
-                _pythonProcess = null;
+                // form fechando
+            }
+        }
+
+        private void ExibirMetricas(string json)
+        {
+            MetricsRecord? record;
+            try
+            {
+                record = JsonSerializer.Deserialize<MetricsRecord>(json);
+            }
+            catch
+            {
+                return;
+            }
+
+            if (record == null || IsDisposed)
+                return;
+
+            string texto = $"{(record.type == "summary" ? "Final: " : "")}{record.fps:0.0} FPS";
+            if (record.bottleneck != null && record.stages.TryGetValue(record.bottleneck, out var etapa))
+                texto += $" | gargalo: {record.bottleneck} (p50 {etapa.p50_ms:0.0} ms, p95 {etapa.p95_ms:0.0} ms)";
+
+            try
+            {
+                BeginInvoke(new Action(() =>
+                {
+                    if (!IsDisposed)
+                        lblMetrics.Text = texto;
+                }));
+            }
+            catch (InvalidOperationException)
+            {
+                // form fechando
             }
         }
 
@@ -594,9 +829,42 @@ namespace YoloOnnxForms
             public int frame_index { get; set; }
             public double time_seconds { get; set; }
             public string image { get; set; } = "";
+            public int slot { get; set; } = -1;   // slot do ring buffer (--shm), -1 = imagem em "image"
+            public bool detected { get; set; } = true;   // false = frame sem YOLO, caixas previstas (--stride)
+            public bool @static { get; set; }   // true = cena parada, caixas repetidas (--motion-gate)
+            public int source { get; set; }   // índice da fonte quando o Python recebe várias --video
             public List<DetectionDto> detections { get; set; } = new List<DetectionDto>();
         }
 
+        private class ReadyRecord
+        {
+            public string backend { get; set; } = "";
+            public bool model_cached { get; set; }
+            public double imports_s { get; set; }
+            public double model_s { get; set; }
+            public double warmup_s { get; set; }
+            public double capture_s { get; set; }
+            public double total_s { get; set; }
+        }
+
+        private class MetricsRecord
+        {
+            public string type { get; set; } = "";
+            public double fps { get; set; }
+            public double fps_total { get; set; }
+            public string? bottleneck { get; set; }
+            public Dictionary<string, StageMetricsDto> stages { get; set; } = new Dictionary<string, StageMetricsDto>();
+        }
+
+        private class StageMetricsDto
+        {
+            public int count { get; set; }
+            public double mean_ms { get; set; }
+            public double p50_ms { get; set; }
+            public double p95_ms { get; set; }
+            public double p99_ms { get; set; }
+        }
+
         private class CameraItem
         {
             public int Index { get; set; }
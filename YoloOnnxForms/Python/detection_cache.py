@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+detection_cache.py
+
+Cache em disco do process_video.py (--cache-dir), para não reprocessar o
+mesmo vídeo com o mesmo modelo:
+
+    res-<chave>.npz   saída final (colunas de todos os frames com detecção).
+                      Chave: hash do conteúdo do vídeo, hash do modelo,
+                      conf, backend, ROI/tiles e parâmetros do ByteTrack.
+                      Num acerto a saída é regravada direto, sem carregar o
+                      modelo nem abrir o vídeo.
+    det-<chave>.npz   detecções do YOLO de cada frame, antes do ByteTrack.
+                      Mesma chave, sem os parâmetros do ByteTrack: mudando
+                      só o tracking, o ByteTrack roda de novo sobre elas, sem
+                      decodificar o vídeo nem rodar o YOLO.
+    hashes.json       sha256 já calculados, por caminho + tamanho + mtime:
+                      um vídeo de vários GB só é lido inteiro uma vez
+
+Como as chaves usam o conteúdo dos arquivos, um vídeo copiado ou renomeado
+continua acertando, e um modelo retreinado com o mesmo nome não. O tamanho
+do cache é limitado (--cache-max-mb): passando do limite, os arquivos usados
+há mais tempo (mtime, renovado a cada acerto) são apagados primeiro.
+
+Enquanto o vídeo é processado, as detecções e as colunas da saída vão sendo
+anexadas a arquivos temporários (ArraySpool, como no ColumnarWriter do
+detection_columns.py): a memória não cresce com o tamanho do vídeo, e o
+.npz só é montado no fim, a partir desses arquivos.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+
+from lazy_import import lazy_module
+
+sv = lazy_module("supervision")
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_MAX_MB = 2048
+_HASH_CHUNK = 1 << 20
+_HASH_INDEX = "hashes.json"
+_COPY_CHUNK = 1 << 20
+
+
+def _digest(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _split(array, counts):
+    return np.split(array, np.cumsum(counts)[:-1]) if len(counts) else []
+
+
+def detection_frames(arrays):
+    """Gera um sv.Detections por frame a partir dos arrays de um det-*.npz."""
+    counts = arrays["counts"]
+    for xyxy, confidence, class_id, count in zip(_split(arrays["xyxy"], counts),
+                                                 _split(arrays["confidence"], counts),
+                                                 _split(arrays["class_id"], counts), counts):
+        if count == 0:
+            yield sv.Detections.empty()
+        else:
+            yield sv.Detections(xyxy=xyxy, confidence=confidence, class_id=class_id)
+
+
+class ArraySpool:
+    """
+    Arrays por frame anexados a arquivos temporários, um por nome, mais a
+    contagem de linhas de cada frame ("counts"). O dtype e o formato de cada
+    array são os do primeiro frame anexado. save() grava tudo como um .npz
+    (mesmo layout do np.savez) sem carregar os arquivos na memória.
+    """
+
+    def __init__(self, prefix="yolo_cache_"):
+        self._tmp_dir = tempfile.mkdtemp(prefix=prefix)
+        self._files = {}
+        self._layout = {}   # nome -> (dtype, formato de uma linha)
+        self._rows = {}
+        try:
+            self._counts = open(os.path.join(self._tmp_dir, "counts"), "wb")
+        except BaseException:
+            self.abort()
+            raise
+        self.frames = 0
+
+    @property
+    def names(self):
+        """Nomes dos arrays anexados até agora, na ordem em que apareceram."""
+        return list(self._files)
+
+    def append(self, arrays, count):
+        """Anexa `arrays` ({nome: array com `count` linhas}) como um frame."""
+        for name, array in arrays.items():
+            array = np.asarray(array)
+            if name not in self._files:
+                self._layout[name] = (array.dtype, array.shape[1:])
+                self._rows[name] = 0
+                self._files[name] = open(os.path.join(self._tmp_dir, f"{len(self._files)}.bin"), "wb")
+            dtype, _ = self._layout[name]
+            np.ascontiguousarray(array, dtype=dtype).tofile(self._files[name])
+            self._rows[name] += len(array)
+        np.array([count], dtype=np.int64).tofile(self._counts)
+        self.frames += 1
+
+    def save(self, f, **arrays):
+        """Grava os arrays anexados, "counts" e `arrays` no .npz aberto em `f` e apaga os temporários."""
+        try:
+            for handle in [self._counts, *self._files.values()]:
+                handle.close()
+            members = [("counts", os.path.join(self._tmp_dir, "counts"), np.dtype(np.int64), (self.frames,))]
+            for name, handle in self._files.items():
+                dtype, shape = self._layout[name]
+                members.append((name, handle.name, dtype, (self._rows[name], *shape)))
+
+            with zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for name, path, dtype, shape in members:
+                    with zf.open(name + ".npy", "w", force_zip64=True) as member:
+                        np.lib.format.write_array_header_2_0(member, {
+                            "descr": np.lib.format.dtype_to_descr(dtype),
+                            "fortran_order": False,
+                            "shape": shape,
+                        })
+                        with open(path, "rb") as src:
+                            shutil.copyfileobj(src, member, _COPY_CHUNK)
+                for name, array in arrays.items():
+                    with zf.open(name + ".npy", "w") as member:
+                        np.lib.format.write_array(member, np.asarray(array))
+        finally:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def abort(self):
+        """Descarta o que foi anexado (erro no meio do vídeo, ou a execução não vai para o cache)."""
+        for handle in [getattr(self, "_counts", None), *self._files.values()]:
+            if handle is not None:
+                handle.close()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+class DetectionCache:
+    """Diretório do cache: hashes dos arquivos, leitura/gravação dos .npz e descarte LRU."""
+
+    def __init__(self, root, max_mb=DEFAULT_CACHE_MAX_MB):
+        if max_mb <= 0:
+            raise ValueError("--cache-max-mb must be > 0")
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, _HASH_INDEX)
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                self.hashes = json.load(f)
+        except (OSError, ValueError):
+            self.hashes = {}
+
+    def file_hash(self, path):
+        """sha256 do conteúdo de `path`; recalculado só se o tamanho ou o mtime mudarem."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.hashes.get(path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                digest.update(chunk)
+        self.hashes[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        # arquivos que não existem mais saem do índice
+        self.hashes = {p: v for p, v in self.hashes.items() if os.path.isfile(p)}
+
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.hashes, f)
+        os.replace(temp_path, self.index_path)
+        return digest.hexdigest()
+
+    def entry(self, video_path, model_path, settings, tracker_params):
+        """
+        CacheEntry de um vídeo processado com `model_path`. `settings` são as
+        opções que mudam as detecções (conf, backend, ROI/tiles...);
+        `tracker_params` só mudam o tracking.
+        """
+        base = {
+            "version": CACHE_VERSION,
+            "video": self.file_hash(video_path),
+            "model": self.file_hash(model_path),
+            "settings": settings,
+        }
+        return CacheEntry(self, _digest(base), _digest({**base, "tracker": tracker_params}))
+
+    def path(self, kind, key):
+        return os.path.join(self.root, f"{kind}-{key}.npz")
+
+    def load(self, kind, key):
+        """Arrays de um .npz do cache (dict), ou None se não existir / estiver corrompido."""
+        path = self.path(kind, key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            return None
+        try:
+            os.utime(path)      # usado agora: vai para o fim da fila do LRU
+        except OSError:
+            pass
+        return arrays
+
+    def store(self, kind, key, spool, **arrays):
+        """Grava o .npz `kind`-`key` com os arrays de `spool` (ArraySpool) e `arrays`."""
+        # grava ao lado e troca: outro processo nunca lê um .npz pela metade
+        path = self.path(kind, key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                spool.save(f, **arrays)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self):
+        """Apaga os .npz usados há mais tempo até o total caber em max_bytes."""
+        files = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class CacheEntry:
+    """
+    Um vídeo + modelo + configuração no cache. lookup() carrega o que houver:
+    `results` (saída final) ou, na falta dela, `detections` (YOLO por frame).
+    """
+
+    def __init__(self, cache, detection_key, result_key):
+        self.cache = cache
+        self.detection_key = detection_key
+        self.result_key = result_key
+        self.results = None
+        self.detections = None
+
+    def lookup(self):
+        self.results = self.cache.load("res", self.result_key)
+        if self.results is None:
+            self.detections = self.cache.load("det", self.detection_key)
+        return self
+
+    @property
+    def needs_detector(self):
+        """False quando o cache dispensa o YOLO (o modelo nem precisa ser carregado)."""
+        return self.results is None and self.detections is None
+
+    @property
+    def fps(self):
+        return float((self.results if self.results is not None else self.detections)["fps"][0])
+
+    def result_frames(self):
+        """(nº de frames do vídeo, [colunas de cada frame com detecção]) da saída em cache."""
+        arrays = self.results
+        names = [str(name) for name in arrays["columns"]]
+        parts = {name: _split(arrays[name], arrays["counts"]) for name in names}
+        frames = [{name: parts[name][i] for name in names} for i in range(len(arrays["counts"]))]
+        return int(arrays["frames"][0]), frames
+
+    def detection_frames(self):
+        """Gera o sv.Detections do YOLO de cada frame do vídeo, na ordem."""
+        return detection_frames(self.detections)
+
+    def store_results(self, fps, frames, recorder):
+        """Grava a saída registrada em `recorder` (ResultRecorder); `frames` = nº de frames do vídeo."""
+        spool = recorder.spool
+        self.cache.store("res", self.result_key, spool,
+                         columns=np.array(spool.names, dtype=str),
+                         frames=np.array([frames], dtype=np.int64),
+                         fps=np.array([fps], dtype=np.float64))
+
+    def store_detections(self, fps, recorder):
+        """Grava as detecções do YOLO registradas em `recorder` (RecordingDetector), um frame por vez."""
+        if recorder.spool.frames == 0:
+            recorder.abort()
+            return
+        self.cache.store("det", self.detection_key, recorder.spool, fps=np.array([fps], dtype=np.float64))
+
+
+class RecordingDetector:
+    """
+    Repassa as chamadas para `detector` e anexa o resultado de cada frame, na
+    ordem, a um ArraySpool (vai para o det-*.npz com store_detections).
+    """
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.names = detector.names
+        self.imgsz = detector.imgsz
+        self.spool = ArraySpool("yolo_det_")
+
+    @property
+    def last_timings(self):
+        return getattr(self.detector, "last_timings", {})
+
+    def _record(self, detections):
+        self.spool.append({
+            "xyxy": np.asarray(detections.xyxy, dtype=np.float32).reshape(-1, 4),
+            "confidence": np.asarray(detections.confidence, dtype=np.float32),
+            "class_id": np.asarray(detections.class_id, dtype=np.int64),
+        }, len(detections))
+
+    def detect(self, frame, conf, imgsz=None):
+        detections = self.detector.detect(frame, conf, imgsz)
+        self._record(detections)
+        return detections
+
+    def detect_batch(self, frames, conf, imgsz=None):
+        results = self.detector.detect_batch(frames, conf, imgsz)
+        for detections in results:
+            self._record(detections)
+        return results
+
+    def abort(self):
+        self.spool.abort()
+
+
+class ResultRecorder:
+    """Colunas da saída dos frames com detecção, anexadas a um ArraySpool (vão para o res-*.npz)."""
+
+    def __init__(self):
+        self.spool = ArraySpool("yolo_res_")
+
+    def record(self, columns):
+        count = len(columns["TrackId"])
+        if count:
+            self.spool.append(columns, count)
+
+    def abort(self):
+        self.spool.abort()
+
+
+def create_cache(args):
+    """DetectionCache de --cache-dir, ou None se o cache estiver desligado."""
+    if not args.cache_dir:
+        return None
+    return DetectionCache(args.cache_dir, args.cache_max_mb)
+
+
+def add_cache_args(parser):
+    """Argumentos de linha de comando do cache."""
+    parser.add_argument("--cache-dir", default=None,
+                        help="Cache results and per-frame YOLO detections here, keyed by the video and "
+                             "model content; re-running the same video is instant and changing only the "
+                             "tracker parameters skips YOLO (default: off)")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_MAX_MB,
+                        help="Cache size limit in MB; least recently used entries are deleted first")
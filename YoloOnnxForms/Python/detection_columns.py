@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+detection_columns.py
+
+Formato colunar para as detecções do process_video.py (--format npz): um
+.npz sem compressão com um .npy por coluna, tipado, em vez de um array JSON
+com as chaves repetidas em cada detecção.
+
+    frame_index  int32      track_id  int32      class_id  int16
+    score, x, y, w, h  float32                   is_new    bool
+    fps          float64 (1 elemento; time_seconds = (frame_index - 1) / fps)
+
+Durante o processamento cada coluna é anexada a um arquivo temporário
+(memória constante), na pasta temporária do sistema: um processo morto no
+meio do vídeo não deixa lixo ao lado da saída. O .npz só é montado no
+close(). Como os membros ficam
+sem compressão, load_detections() mapeia as colunas direto do arquivo
+(np.memmap), sem parse nem cópia.
+
+Também ficam aqui os utilitários que os dois scripts usam para montar as
+detecções de um frame como arrays (uma coluna por campo) em vez de um dict
+por detecção: SeenIds (marcação de tracks novos) e columns_to_records.
+"""
+
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+
+import numpy as np
+
+# (coluna, dtype, chave no JSON do process_video.py)
+COLUMNS = (
+    ("frame_index", np.dtype("<i4"), "FrameIndex"),
+    ("track_id", np.dtype("<i4"), "TrackId"),
+    ("class_id", np.dtype("<i2"), "ClassId"),
+    ("score", np.dtype("<f4"), "Score"),
+    ("x", np.dtype("<f4"), "X"),
+    ("y", np.dtype("<f4"), "Y"),
+    ("w", np.dtype("<f4"), "W"),
+    ("h", np.dtype("<f4"), "H"),
+    ("is_new", np.dtype("?"), "IsNewObject"),
+)
+
+_COPY_CHUNK = 1 << 20
+_SEEN_INITIAL_SIZE = 1024
+_ZIP_LOCAL_HEADER = struct.Struct("<4s5H3I2H")
+
+
+class SeenIds:
+    """
+    Conjunto de IDs inteiros >= 0 (track IDs) com consulta e inserção
+    vetorizadas: uma tabela booleana indexada pelo próprio ID, que cresce
+    quando aparece um ID maior.
+    """
+
+    def __init__(self):
+        self.table = np.zeros(_SEEN_INITIAL_SIZE, dtype=bool)
+
+    def mark_new(self, ids):
+        """Marca `ids` como vistos e devolve a máscara dos que apareceram agora pela 1ª vez."""
+        ids = np.asarray(ids, dtype=np.int64)
+        new = np.zeros(len(ids), dtype=bool)
+
+        valid = np.flatnonzero(ids >= 0)
+        if len(valid) == 0:
+            return new
+
+        top = int(ids[valid].max())
+        if top >= len(self.table):
+            grown = np.zeros(max(top + 1, 2 * len(self.table)), dtype=bool)
+            grown[:len(self.table)] = self.table
+            self.table = grown
+
+        candidates = valid[~self.table[ids[valid]]]
+        # o mesmo ID duas vezes no frame: só a primeira ocorrência é "nova"
+        _, first = np.unique(ids[candidates], return_index=True)
+        new[candidates[first]] = True
+        self.table[ids[valid]] = True
+        return new
+
+
+class SeenPairs:
+    """Como SeenIds, mas para pares (class_id, track_id): uma tabela por classe."""
+
+    def __init__(self):
+        self.by_class = {}
+
+    def mark_new(self, class_ids, track_ids):
+        class_ids = np.asarray(class_ids)
+        track_ids = np.asarray(track_ids)
+        new = np.zeros(len(track_ids), dtype=bool)
+        for class_id in np.unique(class_ids).tolist():
+            rows = np.flatnonzero(class_ids == class_id)
+            seen = self.by_class.setdefault(class_id, SeenIds())
+            new[rows] = seen.mark_new(track_ids[rows])
+        return new
+
+
+def columns_to_records(columns):
+    """{campo: array} -> [{campo: valor python}, ...], para a saída JSON."""
+    keys = list(columns)
+    values = [np.asarray(columns[k]).tolist() for k in keys]
+    return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+class ColumnarWriter:
+    def __init__(self, path, fps):
+        self.path = path
+        self.fps = float(fps)
+        self.count = 0
+        self._tmp_dir = tempfile.mkdtemp(prefix="yolo_columns_")
+        self._files = {}
+        try:
+            for name, _, _ in COLUMNS:
+                self._files[name] = open(os.path.join(self._tmp_dir, name), "wb")
+        except BaseException:
+            self.abort()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write_frame(self, columns):
+        count = len(columns["TrackId"])
+        if count == 0:
+            return
+        for name, dtype, key in COLUMNS:
+            np.asarray(columns[key], dtype=dtype).tofile(self._files[name])
+        self.count += count
+
+    def close(self):
+        try:
+            for f in self._files.values():
+                f.close()
+
+            with zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for name, dtype, _ in COLUMNS:
+                    with zf.open(name + ".npy", "w", force_zip64=True) as member:
+                        _write_npy_header(member, dtype, self.count)
+                        with open(os.path.join(self._tmp_dir, name), "rb") as src:
+                            shutil.copyfileobj(src, member, _COPY_CHUNK)
+                with zf.open("fps.npy", "w") as member:
+                    np.lib.format.write_array(member, np.array([self.fps], dtype="<f8"))
+        finally:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+    def abort(self):
+        """Descarta as colunas já escritas sem gravar o .npz (erro no meio do processamento)."""
+        for f in self._files.values():
+            f.close()
+        shutil.rmtree(self._tmp_dir, ignore_errors=True)
+
+
+def _write_npy_header(fp, dtype, count):
+    header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (count,)}
+    np.lib.format.write_array_header_2_0(fp, header)
+
+
+def _member_data_offset(f, info):
+    # o offset do zip aponta para o header local, que tem tamanho variável
+    f.seek(info.header_offset)
+    fields = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+    name_len, extra_len = fields[-2], fields[-1]
+    return info.header_offset + _ZIP_LOCAL_HEADER.size + name_len + extra_len
+
+
+def load_detections(path, mmap_mode="r"):
+    """
+    Carrega um arquivo gerado com --format npz e devolve {coluna: ndarray}
+    (mais "fps" como float). Com `mmap_mode` (padrão "r") as colunas são
+    np.memmap sobre o próprio arquivo; None lê tudo para a memória.
+    """
+    if mmap_mode is None:
+        with np.load(path) as data:
+            columns = {name: data[name] for name, _, _ in COLUMNS}
+            columns["fps"] = float(data["fps"][0])
+        return columns
+
+    columns = {}
+    with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"Compressed member {info.filename} cannot be memory-mapped")
+
+            f.seek(_member_data_offset(f, info))
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len(".npy")]
+
+            if shape[0] == 0:
+                columns[name] = np.empty(shape, dtype=dtype)
+            else:
+                columns[name] = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=f.tell(), shape=shape)
+
+    columns["fps"] = float(columns["fps"][0])
+    return columns
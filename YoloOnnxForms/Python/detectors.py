@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+detectors.py
+
+Backends de inferência usados pelos scripts de vídeo. Todos expõem a mesma
+interface e devolvem sv.Detections, que é o que o ByteTrack consome:
+
+    detector.names                      -> {class_id: nome}
+    detector.imgsz                      -> lado nominal da entrada do modelo (ex.: 640)
+    detector.detect(frame, conf)        -> sv.Detections
+    detector.detect_batch(frames, conf, imgsz=None)
+                                        -> [sv.Detections, ...] (um por frame); `imgsz`
+                                           reduz a entrada só neste lote (recortes de ROI),
+                                           ignorado em .onnx com entrada de tamanho fixo
+    detector.last_timings               -> {"preprocess"/"infer"/"postprocess": segundos}
+                                           gastos na última chamada (usado pelo --metrics)
+
+- "ultralytics": YOLO(best.pt) como sempre foi.
+- "onnxruntime": modelo exportado (.onnx) rodando direto no ONNX Runtime (CPU),
+  com letterbox e NMS em NumPy; não importa torch nem ultralytics.
+"""
+
+import ast
+import os
+import sys
+import time
+
+import numpy as np
+
+from lazy_import import lazy_module
+
+cv2 = lazy_module("cv2")
+sv = lazy_module("supervision")
+
+BACKENDS = ("ultralytics", "onnxruntime")
+
+# mesmos padrões do predict() do Ultralytics, para as detecções baterem
+ONNX_DEFAULT_IOU = 0.7
+ONNX_MAX_DETECTIONS = 300
+ONNX_DEFAULT_IMGSZ = 640         # usado se o .onnx tiver entrada com tamanho dinâmico
+LETTERBOX_COLOR = (114, 114, 114)
+NMS_CLASS_OFFSET = 7680          # deslocamento por classe -> NMS por classe numa única passada
+TIMING_STAGES = ("preprocess", "infer", "postprocess")
+
+
+# ============================================================
+# ULTRALYTICS
+# ============================================================
+
+def cached_model_path(model_path, suffix):
+    """Artefato derivado ao lado do modelo: best.pt -> best<suffix>."""
+    return os.path.splitext(model_path)[0] + suffix
+
+
+def _cache_is_fresh(cache_path, model_path):
+    return os.path.isfile(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(model_path)
+
+
+def _cache_temp_path(cache_path):
+    # escrito com outro nome e renomeado no fim: vários processos (batch) podem gerar o cache juntos
+    root, ext = os.path.splitext(cache_path)
+    return f"{root}.{os.getpid()}.tmp{ext}"
+
+
+class UltralyticsDetector:
+    def __init__(self, model_path, intra_op_threads=0, cache=False):
+        from ultralytics import YOLO
+
+        if intra_op_threads > 0:
+            import torch
+
+            torch.set_num_threads(int(intra_op_threads))
+
+        # --model-cache: .pt com as camadas conv+bn já fundidas (o predict() funde na 1ª chamada)
+        self.cached = False
+        cache_path = cached_model_path(model_path, ".fused.pt")
+        if cache and str(model_path).lower().endswith(".pt") and _cache_is_fresh(cache_path, model_path):
+            self.model = YOLO(cache_path)
+            self.cached = True
+        else:
+            self.model = YOLO(model_path)
+            if cache and str(model_path).lower().endswith(".pt"):
+                try:
+                    self.model.fuse()
+                    temp_path = _cache_temp_path(cache_path)
+                    self.model.save(temp_path)
+                    os.replace(temp_path, cache_path)
+                except Exception as exc:   # cache é só otimização: segue com o modelo normal
+                    print(f"WARNING: could not write model cache {cache_path}: {exc}", file=sys.stderr)
+        self.names = self.model.model.names
+        self.imgsz = ONNX_DEFAULT_IMGSZ      # padrão do predict() do Ultralytics
+        # só o .pt aceita outro tamanho de entrada; exports (.onnx, .engine...) têm tamanho fixo
+        self.dynamic_shape = str(model_path).lower().endswith(".pt")
+        self.last_timings = {}
+
+    def _record_speed(self, results):
+        # results.speed = ms por imagem de cada fase (média do lote)
+        speed = results[0].speed
+        count = len(results)
+        self.last_timings = {
+            stage: (speed.get(key) or 0.0) * count / 1000
+            for stage, key in zip(TIMING_STAGES, ("preprocess", "inference", "postprocess"))
+        }
+
+    def _predict(self, source, conf, imgsz):
+        kwargs = {"imgsz": imgsz} if imgsz and self.dynamic_shape else {}
+        return self.model(source, conf=conf, verbose=False, **kwargs)
+
+    def detect(self, frame, conf, imgsz=None):
+        results = self._predict(frame, conf, imgsz)
+        self._record_speed(results)
+        return sv.Detections.from_ultralytics(results[0])
+
+    def detect_batch(self, frames, conf, imgsz=None):
+        if len(frames) == 1:
+            # mesmo caminho do modo frame a frame
+            return [self.detect(frames[0], conf, imgsz)]
+
+        results = self._predict(frames, conf, imgsz)
+        self._record_speed(results)
+        return [sv.Detections.from_ultralytics(r) for r in results]
+
+
+# ============================================================
+# ONNX RUNTIME
+# ============================================================
+
+def letterbox(frame, new_shape):
+    """
+    Redimensiona mantendo a proporção e completa com cinza até `new_shape`
+    (h, w), igual ao LetterBox do Ultralytics. Devolve a imagem, o ganho e o
+    padding (left, top) para desfazer a transformação depois.
+    """
+    h0, w0 = frame.shape[:2]
+    new_h, new_w = new_shape
+    gain = min(new_h / h0, new_w / w0)
+
+    unpad_w = int(round(w0 * gain))
+    unpad_h = int(round(h0 * gain))
+    dw = (new_w - unpad_w) / 2
+    dh = (new_h - unpad_h) / 2
+
+    if (w0, h0) != (unpad_w, unpad_h):
+        frame = cv2.resize(frame, (unpad_w, unpad_h), interpolation=cv2.INTER_LINEAR)
+
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    frame = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+
+    return frame, gain, (left, top)
+
+
+def nms(xyxy, scores, iou_threshold):
+    """NMS guloso; o IoU de cada caixa mantida contra as restantes é calculado de uma vez."""
+    x1, y1, x2, y2 = xyxy[:, 0], xyxy[:, 1], xyxy[:, 2], xyxy[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-7)
+
+        order = rest[iou <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+class OnnxDetector:
+    """
+    YOLOv8/YOLO11 exportado com `yolo export format=onnx` (saída
+    [batch, 4 + nº classes, nº âncoras], sem NMS embutido).
+    """
+
+    def __init__(self, model_path, intra_op_threads=0, inter_op_threads=0,
+                 iou=ONNX_DEFAULT_IOU, max_det=ONNX_MAX_DETECTIONS, cache=False):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(intra_op_threads)   # 0 = padrão do ONNX Runtime
+        options.inter_op_num_threads = int(inter_op_threads)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        # --model-cache: grafo já otimizado pelo ONNX Runtime, salvo na 1ª execução; as
+        # seguintes pulam a otimização. É específico da máquina (gerado para esta CPU).
+        self.cached = False
+        session_path = model_path
+        cache_path = temp_path = None
+        if cache:
+            cache_path = cached_model_path(model_path, ".optimized.onnx")
+            if _cache_is_fresh(cache_path, model_path):
+                session_path = cache_path
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+                self.cached = True
+            else:
+                temp_path = _cache_temp_path(cache_path)
+                options.optimized_model_filepath = temp_path
+
+        self.session = ort.InferenceSession(session_path, sess_options=options,
+                                            providers=["CPUExecutionProvider"])
+        if temp_path is not None and os.path.isfile(temp_path):
+            os.replace(temp_path, cache_path)
+        self.iou = iou
+        self.max_det = max_det
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, in_h, in_w = model_input.shape
+        self.input_shape = (
+            in_h if isinstance(in_h, int) else ONNX_DEFAULT_IMGSZ,
+            in_w if isinstance(in_w, int) else ONNX_DEFAULT_IMGSZ,
+        )
+        # batch fixo (export padrão) -> uma chamada por frame
+        self.dynamic_batch = not isinstance(batch, int)
+        # altura/largura dinâmicas (export com dynamic=True) -> aceita `imgsz` menor por lote
+        self.dynamic_shape = not isinstance(in_h, int) or not isinstance(in_w, int)
+        self.imgsz = max(self.input_shape)
+
+        self.names = self._read_names()
+        self.last_timings = {}
+
+    def _read_names(self):
+        # o Ultralytics grava {id: nome} nos metadados do .onnx como texto
+        meta = self.session.get_modelmeta().custom_metadata_map
+        try:
+            return {int(k): v for k, v in ast.literal_eval(meta["names"]).items()}
+        except (KeyError, ValueError, SyntaxError):
+            return {}
+
+    def preprocess(self, frames, input_shape=None):
+        input_shape = input_shape or self.input_shape
+        blobs = []
+        transforms = []
+        for frame in frames:
+            img, gain, pad = letterbox(frame, input_shape)
+            blobs.append(img[:, :, ::-1].transpose(2, 0, 1))   # BGR HWC -> RGB CHW
+            transforms.append((gain, pad, frame.shape[:2]))
+
+        blob = np.ascontiguousarray(np.stack(blobs), dtype=np.float32)
+        blob /= 255.0
+        return blob, transforms
+
+    def postprocess(self, prediction, conf, transform):
+        gain, (pad_x, pad_y), (h0, w0) = transform
+
+        pred = prediction.T                                   # [âncoras, 4 + nº classes]
+        class_scores = pred[:, 4:]
+        class_id = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_id)), class_id]
+
+        mask = scores > conf
+        if not mask.any():
+            return sv.Detections.empty()
+
+        boxes, scores, class_id = pred[mask, :4], scores[mask], class_id[mask]
+
+        cx, cy, bw, bh = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        xyxy = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+        keep = nms(xyxy + (class_id * NMS_CLASS_OFFSET)[:, None], scores, self.iou)[: self.max_det]
+        xyxy, scores, class_id = xyxy[keep], scores[keep], class_id[keep]
+
+        # desfaz o letterbox -> coordenadas do frame original
+        xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad_x) / gain).clip(0, w0)
+        xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad_y) / gain).clip(0, h0)
+
+        return sv.Detections(
+            xyxy=xyxy.astype(np.float32),
+            confidence=scores.astype(np.float32),
+            class_id=class_id.astype(int),
+        )
+
+    def _run(self, frames, conf, imgsz=None):
+        input_shape = (imgsz, imgsz) if imgsz and self.dynamic_shape else self.input_shape
+        t0 = time.perf_counter()
+        blob, transforms = self.preprocess(frames, input_shape)
+        t1 = time.perf_counter()
+        output = self.session.run(None, {self.input_name: blob})[0]
+        t2 = time.perf_counter()
+        results = [self.postprocess(output[i], conf, transforms[i]) for i in range(len(frames))]
+        self.last_timings = dict(zip(TIMING_STAGES, (t1 - t0, t2 - t1, time.perf_counter() - t2)))
+        return results
+
+    def detect(self, frame, conf, imgsz=None):
+        return self._run([frame], conf, imgsz)[0]
+
+    def detect_batch(self, frames, conf, imgsz=None):
+        if self.dynamic_batch:
+            return self._run(frames, conf, imgsz)
+
+        results = []
+        timings = dict.fromkeys(TIMING_STAGES, 0.0)
+        for frame in frames:
+            results.append(self.detect(frame, conf, imgsz))
+            for stage, seconds in self.last_timings.items():
+                timings[stage] += seconds
+        self.last_timings = timings
+        return results
+
+
+# ============================================================
+# FACTORY
+# ============================================================
+
+def load_detector(backend, model_path, intra_op_threads=0, inter_op_threads=0, cache=False):
+    if backend == "onnxruntime":
+        return OnnxDetector(model_path, intra_op_threads, inter_op_threads, cache=cache)
+    if backend == "ultralytics":
+        return UltralyticsDetector(model_path, intra_op_threads, cache=cache)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def warm_up(detector, conf):
+    """Uma inferência num frame preto: paga a inicialização preguiçosa do backend antes do 1º frame."""
+    detector.detect(np.zeros((detector.imgsz, detector.imgsz, 3), dtype=np.uint8), conf)
+
+
+def add_backend_args(parser):
+    """Argumentos de linha de comando comuns aos dois scripts."""
+    parser.add_argument("--backend", choices=BACKENDS, default="ultralytics",
+                        help="Inference backend (onnxruntime expects an exported .onnx model)")
+    parser.add_argument("--intra-op-threads", type=int, default=0,
+                        help="Intra-op threads: ONNX Runtime session, or torch.set_num_threads "
+                             "for ultralytics (0 = runtime default)")
+    parser.add_argument("--inter-op-threads", type=int, default=0,
+                        help="ONNX Runtime inter-op threads (0 = runtime default)")
+    parser.add_argument("--model-cache", action="store_true",
+                        help="Cache a pre-processed model next to the original for faster loads: "
+                             "'<name>.fused.pt' (ultralytics) or '<name>.optimized.onnx' (onnxruntime)")
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+frame_protocol.py
+
+Protocolo binário (opcional) entre o process_video_stream.py e o Form1.cs,
+no lugar de uma linha JSON com a imagem em base64 por frame.
+
+Cada frame é uma mensagem, tudo little-endian:
+
+    header (32 bytes)
+        4s   magic "YOF1"
+        u32  frame_index
+        f64  time_seconds
+        u32  n = nº de detecções
+        u32  tamanho do JPEG em bytes
+        i32  slot do ring buffer com a imagem (--shm), -1 se não houver
+        u32  flags       bit 0 = frame sem YOLO, caixas previstas pelo tracker (--stride)
+                         bit 1 = cena parada, caixas repetidas do frame anterior (--motion-gate)
+                         bits 16-31 = id da fonte (várias --video; 0 com uma só)
+    n registros de 8 x f32
+        track_id, class_id, score, x, y, w, h, is_new (0/1)
+    JPEG cru (vazio quando a imagem está no ring buffer)
+
+O leitor C# correspondente está em Services/FrameProtocolReader.cs.
+"""
+
+import struct
+
+import numpy as np
+
+MAGIC = b"YOF1"
+HEADER = struct.Struct("<4sIdIIiI")
+FLAG_PREDICTED = 0x1
+FLAG_STATIC = 0x2
+FLAG_SOURCE_SHIFT = 16
+DETECTION_FIELDS = ("track_id", "class_id", "score", "x", "y", "w", "h", "is_new")
+DETECTION_DTYPE = np.dtype("<f4")
+DETECTION_RECORD_SIZE = len(DETECTION_FIELDS) * DETECTION_DTYPE.itemsize
+
+
+def detections_to_records(columns):
+    """Converte as colunas de detecção ({campo: array}) em um array float32 [n, 8]."""
+    if len(columns["track_id"]) == 0:
+        return np.empty((0, len(DETECTION_FIELDS)), dtype=DETECTION_DTYPE)
+    return np.column_stack([columns[field] for field in DETECTION_FIELDS]).astype(DETECTION_DTYPE)
+
+
+def records_to_detections(records):
+    detections = []
+    for row in records:
+        det = dict(zip(DETECTION_FIELDS, row.tolist()))
+        det["track_id"] = int(det["track_id"])
+        det["class_id"] = int(det["class_id"])
+        det["is_new"] = bool(det["is_new"])
+        detections.append(det)
+    return detections
+
+
+def pack_frame(frame_index, time_seconds, records, jpeg_bytes, slot=-1, flags=0):
+    records = np.ascontiguousarray(records, dtype=DETECTION_DTYPE)
+    header = HEADER.pack(MAGIC, frame_index, time_seconds, len(records), len(jpeg_bytes), slot, flags)
+    return b"".join((header, records.tobytes(), jpeg_bytes))
+
+
+def write_frame(stream, frame_index, time_seconds, records, jpeg_bytes, slot=-1, flags=0):
+    """Escreve uma mensagem completa num stream binário (ex.: sys.stdout.buffer)."""
+    stream.write(pack_frame(frame_index, time_seconds, records, jpeg_bytes, slot, flags))
+    stream.flush()
+
+
+def _read_exact(stream, size):
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(stream):
+    """
+    Leitor de referência (usado para testar o protocolo em Python).
+    Devolve (frame_index, time_seconds, records [n, 8], jpeg_bytes, slot, flags) ou None no fim do stream.
+    """
+    header = _read_exact(stream, HEADER.size)
+    if header is None:
+        return None
+
+    magic, frame_index, time_seconds, count, jpeg_size, slot, flags = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f"Invalid frame header magic: {magic!r}")
+
+    payload = _read_exact(stream, count * DETECTION_RECORD_SIZE + jpeg_size)
+    if payload is None:
+        raise EOFError("Stream ended in the middle of a frame")
+
+    split = count * DETECTION_RECORD_SIZE
+    records = np.frombuffer(payload[:split], dtype=DETECTION_DTYPE).reshape(count, len(DETECTION_FIELDS))
+    return frame_index, time_seconds, records, payload[split:], slot, flags
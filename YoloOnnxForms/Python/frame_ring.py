@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+frame_ring.py
+
+Ring buffer de frames em arquivo mapeado em memória (mmap), compartilhado
+entre o process_video_stream.py (escreve) e o Form1.cs (lê). Com ele a
+imagem não passa mais pelo stdout: o Python grava o frame anotado num slot
+e manda só o índice do slot junto com as detecções.
+
+Layout do arquivo, tudo little-endian:
+
+    header global (64 bytes)
+        4s   magic "YOFR"
+        u32  versão (1)
+        u32  nº de slots
+        u32  capacidade de dados de cada slot (bytes)
+        ...  reservado
+    slots, um atrás do outro: header do slot (32 bytes) + dados
+        u64  seq         ímpar enquanto o slot está sendo escrito, par quando pronto
+        u32  frame_index
+        u32  width
+        u32  height
+        u32  channels
+        u32  formato     0 = BGR cru (height x width x channels), 1 = JPEG
+        u32  tamanho dos dados em bytes
+
+O leitor confere `seq` antes e depois de copiar o slot (seqlock) e compara o
+frame_index com o da mensagem de controle. Se o Python já sobrescreveu o
+slot (leitor atrasado demais), o frame é descartado e só as detecções
+daquela mensagem são usadas.
+
+O leitor C# correspondente está em Services/FrameRingReader.cs.
+"""
+
+import mmap
+import struct
+
+import numpy as np
+
+MAGIC = b"YOFR"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sIII48x")
+SLOT_HEADER = struct.Struct("<QIIIIII")
+
+FORMAT_BGR = 0
+FORMAT_JPEG = 1
+FORMATS = {"raw": FORMAT_BGR, "jpeg": FORMAT_JPEG}
+
+DEFAULT_SLOTS = 8
+JPEG_HEADER_ALLOWANCE = 2048    # tabelas de quantização/Huffman e marcadores de um JPEG baseline
+
+
+def slot_capacity(shape, fmt):
+    """
+    Capacidade dos slots para frames `shape` (h, w, c) no formato `fmt`. Um
+    JPEG não é sempre menor que o frame cru: numa prévia pequena só os
+    headers já passam do tamanho cru, e imagens com muito ruído em qualidade
+    alta chegam perto dele. Daí a folga de 1/8 mais os headers no formato
+    JPEG; o que ainda assim não couber vai pelo stdout.
+    """
+    raw = int(np.prod(shape))
+    if fmt == FORMAT_JPEG:
+        return raw + raw // 8 + JPEG_HEADER_ALLOWANCE
+    return raw
+
+
+class FrameRingBuffer:
+    def __init__(self, path, slot_count, slot_capacity, create):
+        self.path = path
+
+        if create:
+            total = FILE_HEADER.size + slot_count * (SLOT_HEADER.size + slot_capacity)
+            self._file = open(path, "w+b")
+            self._file.truncate(total)
+        else:
+            self._file = open(path, "r+b")
+
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+
+        if create:
+            FILE_HEADER.pack_into(self._mm, 0, MAGIC, VERSION, slot_count, slot_capacity)
+        else:
+            magic, version, slot_count, slot_capacity = FILE_HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Not a frame ring buffer file: {path}")
+
+        self.slot_count = slot_count
+        self.slot_capacity = slot_capacity
+        self._slot_stride = SLOT_HEADER.size + slot_capacity
+        self._data = np.frombuffer(self._mm, dtype=np.uint8)
+        self._next_slot = 0
+
+    @classmethod
+    def create(cls, path, slot_count, slot_capacity):
+        return cls(path, slot_count, slot_capacity, create=True)
+
+    @classmethod
+    def open(cls, path):
+        return cls(path, 0, 0, create=False)
+
+    def _slot_offset(self, slot):
+        return FILE_HEADER.size + slot * self._slot_stride
+
+    # --------------------------------------------------------
+    # escrita (Python detector)
+    # --------------------------------------------------------
+    def write(self, frame_index, data, fmt=FORMAT_BGR, shape=None):
+        """
+        Copia `data` (frame BGR uint8 ou bytes de JPEG) para o próximo slot e
+        devolve o índice do slot usado. `shape` é (h, w, c) do frame original
+        quando `data` é JPEG.
+        """
+        if fmt == FORMAT_BGR:
+            shape = data.shape
+        height, width = shape[:2]
+        channels = shape[2] if len(shape) > 2 else 1
+
+        payload = np.frombuffer(data, dtype=np.uint8) if fmt == FORMAT_JPEG else data.reshape(-1)
+        if payload.size > self.slot_capacity:
+            raise ValueError(f"Frame of {payload.size} bytes does not fit in a {self.slot_capacity}-byte slot")
+
+        slot = self._next_slot
+        self._next_slot = (slot + 1) % self.slot_count
+        offset = self._slot_offset(slot)
+
+        seq = SLOT_HEADER.unpack_from(self._mm, offset)[0]
+        seq += 1 if seq % 2 == 0 else 2          # ímpar = escrevendo
+        struct.pack_into("<Q", self._mm, offset, seq)
+
+        start = offset + SLOT_HEADER.size
+        self._data[start:start + payload.size] = payload
+
+        SLOT_HEADER.pack_into(self._mm, offset, seq + 1, frame_index, width, height, channels, fmt, payload.size)
+        return slot
+
+    # --------------------------------------------------------
+    # leitura (consumidor de referência, espelha o FrameRingReader.cs)
+    # --------------------------------------------------------
+    def read(self, slot, frame_index):
+        """
+        Devolve uma cópia do frame em `slot` se ele ainda for o `frame_index`
+        esperado: ndarray BGR (formato cru) ou bytes (JPEG). None se o slot já
+        foi sobrescrito ou está sendo escrito.
+        """
+        offset = self._slot_offset(slot)
+        seq, idx, width, height, channels, fmt, size = SLOT_HEADER.unpack_from(self._mm, offset)
+        if seq % 2 == 1 or idx != frame_index:
+            return None
+
+        start = offset + SLOT_HEADER.size
+        payload = self._data[start:start + size].copy()
+
+        if SLOT_HEADER.unpack_from(self._mm, offset)[0] != seq:
+            return None
+
+        if fmt == FORMAT_JPEG:
+            return payload.tobytes()
+        return payload.reshape(height, width, channels)
+
+    def close(self):
+        self._data = None
+        self._mm.close()
+        self._file.close()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+lazy_import.py
+
+Import adiado de módulos pesados. O `supervision` sozinho leva mais de 1 s
+para importar (puxa matplotlib/scipy) e o `ultralytics` puxa o torch; com
+
+    sv = lazy_module("supervision")
+
+o import só acontece no primeiro `sv.<atributo>`. O process_video_stream.py
+usa isso para fazer o import pesado na thread que carrega o modelo, em
+paralelo com a abertura da câmera, em vez de no topo do script.
+"""
+
+import importlib
+import threading
+
+
+class LazyModule:
+    """Proxy de um módulo: importa na primeira vez que um atributo é pedido."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Importa agora (se ainda não foi) e devolve o módulo de verdade."""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
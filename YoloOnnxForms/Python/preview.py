@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+preview.py
+
+Configuração da prévia (imagem anotada) que o process_video_stream.py manda
+para o Form1.cs. A prévia é só para exibição: pode ser menor que o frame,
+ter JPEG mais leve e sair em menos FPS que a detecção. As detecções
+continuam indo em todos os frames, em coordenadas do frame original.
+
+    --preview-size WxH      reduz o frame anotado para caber em WxH (nunca amplia)
+    --preview-fps N         no máximo N prévias por segundo de vídeo, por fonte
+    --jpeg-quality Q        qualidade do JPEG (1–100)
+    --jpeg-encoder          opencv (cv2.imencode) ou turbojpeg (PyTurboJPEG, opcional)
+
+Os frames sem prévia saem com a imagem vazia (e slot -1 com --shm); o Form1
+mantém a última imagem na tela.
+"""
+
+from lazy_import import lazy_module
+
+cv2 = lazy_module("cv2")
+
+DEFAULT_JPEG_QUALITY = 95        # mesmo padrão do cv2.imencode
+JPEG_ENCODERS = ("opencv", "turbojpeg")
+
+
+def parse_size(text, what="preview size"):
+    """'640x480' -> (640, 480). `what` nomeia a opção nas mensagens de erro."""
+    try:
+        width, height = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise ValueError(f"Invalid {what} '{text}': expected WIDTHxHEIGHT") from None
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid {what} '{text}': width and height must be positive")
+    return width, height
+
+
+class JpegEncoder:
+    def __init__(self, quality=DEFAULT_JPEG_QUALITY, encoder="opencv"):
+        if not 1 <= quality <= 100:
+            raise ValueError("--jpeg-quality must be in [1, 100]")
+        self.quality = int(quality)
+        self.turbo = None
+        if encoder == "turbojpeg":
+            try:
+                from turbojpeg import TurboJPEG
+            except ImportError as exc:
+                raise ImportError("--jpeg-encoder turbojpeg requires PyTurboJPEG (pip install PyTurboJPEG)") from exc
+
+            self.turbo = TurboJPEG()
+        elif encoder != "opencv":
+            raise ValueError(f"Unknown JPEG encoder: {encoder}")
+
+    def encode(self, frame):
+        """JPEG do frame BGR (buffer uint8 do cv2 ou bytes do turbojpeg)."""
+        if self.turbo is not None:
+            return self.turbo.encode(frame, quality=self.quality)
+
+        params = [] if self.quality == DEFAULT_JPEG_QUALITY else [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        ret, buf = cv2.imencode(".jpg", frame, params)
+        if not ret:
+            raise RuntimeError("Could not encode frame to JPG")
+        return buf
+
+
+class PreviewSettings:
+    """Decide quais frames ganham prévia e em que tamanho."""
+
+    def __init__(self, max_size=None, max_fps=0.0):
+        self.max_size = max_size
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.last_preview = {}     # fonte -> time_seconds da última prévia
+        self.frames_skipped = 0
+
+    def wants(self, source_id, time_seconds):
+        """True se este frame deve ter prévia (limite de FPS no tempo do vídeo, por fonte)."""
+        last = self.last_preview.get(source_id)
+        # folga de arredondamento: com 30 FPS e --preview-fps 15, sai exatamente um frame sim, um não
+        if last is not None and time_seconds - last < self.min_interval - 1e-6:
+            self.frames_skipped += 1
+            return False
+        self.last_preview[source_id] = time_seconds
+        return True
+
+    def scale(self, frame):
+        """Fator (<= 1) que faz o frame caber em max_size."""
+        if self.max_size is None:
+            return 1.0
+        h, w = frame.shape[:2]
+        return min(1.0, self.max_size[0] / w, self.max_size[1] / h)
+
+    def resize(self, frame):
+        """(imagem da prévia, fator de escala); com fator 1 é uma cópia do frame."""
+        scale = self.scale(frame)
+        if scale >= 1.0:
+            return frame.copy(), 1.0
+        h, w = frame.shape[:2]
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA), scale
+
+
+def create_preview(args):
+    """(PreviewSettings, JpegEncoder) conforme os argumentos; ValueError/ImportError se inválidos."""
+    max_size = parse_size(args.preview_size) if args.preview_size else None
+    if args.preview_fps < 0:
+        raise ValueError("--preview-fps must be >= 0")
+    return PreviewSettings(max_size, args.preview_fps), JpegEncoder(args.jpeg_quality, args.jpeg_encoder)
+
+
+def add_preview_args(parser):
+    """Argumentos de linha de comando da prévia."""
+    parser.add_argument("--preview-size", type=str, default=None, metavar="WxH",
+                        help="Downscale the annotated preview to fit WxH (detections stay at full resolution)")
+    parser.add_argument("--preview-fps", type=float, default=0.0,
+                        help="Send at most N preview images per second of video per source "
+                             "(0 = every frame); detections are still sent for every frame")
+    parser.add_argument("--jpeg-quality", type=int, default=DEFAULT_JPEG_QUALITY,
+                        help="JPEG quality of the preview (1-100)")
+    parser.add_argument("--jpeg-encoder", choices=JPEG_ENCODERS, default="opencv",
+                        help="JPEG encoder: opencv, or turbojpeg (requires PyTurboJPEG and libjpeg-turbo)")
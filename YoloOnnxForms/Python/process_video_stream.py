@@ -6,13 +6,30 @@ process_video_stream.py
 import argparse
 import base64
 import json
+import math
 import os
+import queue
 import sys
+import threading
+import time
 
-import cv2
-import numpy as np
-from ultralytics import YOLO
-import supervision as sv
+_STARTED = time.perf_counter()   # base dos tempos do handshake [READY]
+
+import numpy as np  # noqa: E402
+
+# supervision (e o torch, via ultralytics) só são importados na thread que carrega o modelo;
+# o OpenCV, na primeira fonte aberta, em paralelo com o carregamento
+from lazy_import import lazy_module  # noqa: E402
+from detectors import add_backend_args, load_detector, warm_up  # noqa: E402
+from region_detectors import add_region_args, rect_to_polygon, wrap_detector  # noqa: E402
+from detection_columns import SeenIds, columns_to_records  # noqa: E402
+from stage_metrics import add_metrics_args, create_metrics  # noqa: E402
+from preview import add_preview_args, create_preview  # noqa: E402
+import frame_protocol  # noqa: E402
+import frame_ring  # noqa: E402
+
+cv2 = lazy_module("cv2")
+sv = lazy_module("supervision")
 
 # ============================================================
 # CONFIG
@@ -26,13 +43,29 @@ BYTE_MIN_MATCHING_THRESHOLD = 0.90       # quão exigente é para associar detec
 BYTE_MIN_CONSECUTIVE_FRAMES = 10         # nº mínimo de frames seguidos para considerar o ID estável/válido
 BYTE_FRAME_RATE_FALLBACK = 30.0          # FPS assumido quando o vídeo não informa FPS (fallback p/ ByteTrack)
 
-USE_ROI = False
+USE_ROI = False                  # sem --roi na linha de comando, roda o YOLO só dentro de ROI_RECT
 ROI_RECT = (100, 100, 500, 400)
-FILTER_BY_ROI_CENTER = True
 
 USE_CLASS_FILTER = False
 SELECTED_CLASS_NAMES = ["Cebola"]
 
+PIPELINE_QUEUE_SIZE = 4          # nº máximo de frames esperando entre dois estágios do pipeline
+OUTPUT_POLICIES = ("block", "drop-images", "coalesce")
+OUTPUT_MAX_PENDING = 1000        # limite de frames (já sem imagem) esperando o stdout fora do modo block
+
+DETECTION_STRIDE = "1"           # roda o YOLO a cada N frames ("auto" = N ajustado pela latência medida)
+MAX_DETECTION_STRIDE = 8         # limite do N no modo "auto"
+STRIDE_LATENCY_SMOOTHING = 0.2   # peso da última medida na média móvel da latência do YOLO
+PREDICTED_BOX_COLOR = (0, 255, 255)   # cor das caixas previstas pelo Kalman (frames sem YOLO)
+
+MOTION_GATE_WIDTH = 160          # largura da miniatura em tons de cinza comparada pelo --motion-gate
+MOTION_PIXEL_THRESHOLD = 25      # diferença de cinza (0–255) para um pixel da miniatura contar como mudado
+MOTION_CHANGED_FRACTION = 0.002  # fração de pixels mudados a partir da qual a cena "mexeu"
+MOTION_REFRESH_SECONDS = 5.0     # roda o YOLO pelo menos a cada N s mesmo com a cena parada
+STATIC_BOX_COLOR = (255, 160, 0) # cor das caixas repetidas em frames parados (sem YOLO e sem tracker)
+
+READY_PREFIX = "[READY] "        # linha do stderr com os tempos de inicialização (lida pelo Form1.cs)
+
 
 # ============================================================
 # HELPERS
@@ -40,37 +73,624 @@ SELECTED_CLASS_NAMES = ["Cebola"]
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model", type=str, required=True, help="Path to YOLO .pt model")
-    parser.add_argument("--video", type=str, required=True, help="Path to video or image")
+    parser.add_argument("--model", type=str, required=True, help="Path to YOLO .pt (or exported .onnx) model")
+    parser.add_argument("--video", type=str, nargs="+", required=True,
+                        help="Path to video or image, or camera index; several sources share one "
+                             "model and are batched together (records are tagged with the source id)")
     parser.add_argument("--conf", type=float, default=DEFAULT_CONF, help="YOLO confidence threshold")
-    return parser.parse_args()
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE,
+                        help="Max frames buffered between pipeline stages")
+    parser.add_argument("--output-policy", choices=OUTPUT_POLICIES, default="block",
+                        help="When the stdout reader falls behind: 'block' waits (slows detection down), "
+                             "'drop-images' drops the oldest queued images but keeps their detections, "
+                             "'coalesce' keeps only the newest queued image; detections are always written")
+    parser.add_argument("--protocol", choices=("json", "binary"), default="json",
+                        help="stdout format: one JSON line per frame (base64 image) "
+                             "or length-prefixed binary frames (see frame_protocol.py)")
+    parser.add_argument("--capture", choices=("auto", "all", "latest"), default="auto",
+                        help="'latest' keeps only the newest captured frame and drops the ones the "
+                             "pipeline could not take in time; 'auto' = latest for cameras, all for files")
+    parser.add_argument("--stride", type=str, default=DETECTION_STRIDE,
+                        help="Run detection every N frames, or 'auto' to pick N from inference "
+                             "latency vs source FPS; other frames use ByteTrack's Kalman prediction")
+    parser.add_argument("--max-stride", type=int, default=MAX_DETECTION_STRIDE,
+                        help="Upper bound for N when --stride auto")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="Skip detection and tracking while the scene is static (downscaled frame "
+                             "differencing); static frames repeat the last boxes")
+    parser.add_argument("--motion-threshold", type=float, default=MOTION_CHANGED_FRACTION,
+                        help="Fraction of changed pixels that counts as motion for --motion-gate")
+    parser.add_argument("--motion-refresh", type=float, default=MOTION_REFRESH_SECONDS,
+                        help="Run detection at least every N seconds while static (0 = never)")
+    parser.add_argument("--shm", type=str, default=None,
+                        help="Write annotated frames to this memory-mapped ring buffer file "
+                             "and send only the slot index on stdout (see frame_ring.py); "
+                             "source N > 0 uses '<file>.N'")
+    parser.add_argument("--shm-slots", type=int, default=frame_ring.DEFAULT_SLOTS,
+                        help="Number of slots in the --shm ring buffer")
+    parser.add_argument("--shm-format", choices=tuple(frame_ring.FORMATS), default="raw",
+                        help="Frame format stored in the ring buffer slots")
+    add_backend_args(parser)
+    parser.add_argument("--fast-start", action="store_true",
+                        help="Warm the model up while the sources open and use --model-cache, so the "
+                             "first frame does not pay the backend's lazy initialization")
+    add_region_args(parser)
+    add_preview_args(parser)
+    add_metrics_args(parser)
+    args = parser.parse_args()
+    if args.fast_start:
+        args.model_cache = True
+    return args
+
+
+def detection_columns(detections, seen_tracks):
+    """
+    Campos de saída de todas as detecções do frame como arrays (mesmas chaves
+    do JSON: track_id, class_id, score, x, y, w, h, is_new), sem laço por
+    detecção. Marca os tracks novos em `seen_tracks`.
+    """
+    count = len(detections)
+    xyxy = detections.xyxy
+
+    if detections.tracker_id is None:
+        track_ids = np.full(count, -1, dtype=int)
+    else:
+        track_ids = detections.tracker_id.astype(int)
+
+    return {
+        "track_id": track_ids,
+        "class_id": detections.class_id.astype(int),
+        "score": detections.confidence,
+        "x": xyxy[:, 0],
+        "y": xyxy[:, 1],
+        "w": xyxy[:, 2] - xyxy[:, 0],
+        "h": xyxy[:, 3] - xyxy[:, 1],
+        "is_new": seen_tracks.mark_new(track_ids),
+    }
+
+
+def draw_detections(frame, detections, columns, color, scale=1.0):
+    """
+    Desenha caixas e rótulos: todas as caixas numa única chamada do OpenCV.
+    `scale` leva as caixas (coordenadas do frame original) para a prévia reduzida.
+    """
+    if len(detections) == 0:
+        return
+
+    xyxy = detections.xyxy if scale == 1.0 else detections.xyxy * scale
+    corners = xyxy.astype(np.int32)
+    x1, y1, x2, y2 = corners[:, 0], corners[:, 1], corners[:, 2], corners[:, 3]
+    boxes = np.stack([
+        np.stack([x1, y1], axis=1),
+        np.stack([x2, y1], axis=1),
+        np.stack([x2, y2], axis=1),
+        np.stack([x1, y2], axis=1),
+    ], axis=1)
+    # mesmo resultado de um cv2.rectangle por caixa (o rectangle também desenha uma polilinha fechada)
+    cv2.polylines(frame, list(boxes), True, color, 2)
+
+    for track_id, class_id, score, x, y in zip(
+        columns["track_id"].tolist(),
+        columns["class_id"].tolist(),
+        columns["score"].tolist(),
+        x1.tolist(),
+        y1.tolist(),
+    ):
+        cv2.putText(
+            frame,
+            f"#{track_id} C{class_id} {score:.2f}",
+            (x, y - 5),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            color,
+            1,
+            cv2.LINE_AA,
+        )
+
+
+class DetectionStride:
+    """
+    Decide em quais frames o YOLO roda. Com stride fixo, a cada N frames; no
+    modo "auto", N = latência média do YOLO x FPS da fonte (limitado a
+    `max_stride`), ou seja, só o suficiente para a inferência acompanhar a
+    câmera sem acumular atraso.
+    """
+
+    def __init__(self, stride, fps, max_stride):
+        self.adaptive = str(stride).lower() == "auto"
+        self.stride = 1 if self.adaptive else max(1, int(stride))
+        self.fps = fps
+        self.max_stride = max(1, int(max_stride))
+        self.latency = None
+        self.last_detected = None
+
+    def should_detect(self, index):
+        if self.last_detected is not None and index - self.last_detected < self.stride:
+            return False
+        self.last_detected = index
+        return True
+
+    def record_latency(self, seconds):
+        if not self.adaptive:
+            return
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += STRIDE_LATENCY_SMOOTHING * (seconds - self.latency)
+        self.stride = min(self.max_stride, max(1, math.ceil(self.latency * self.fps)))
+
+
+class MotionGate:
+    """
+    Diz se a cena mudou desde o último frame que passou pelo gate. Compara
+    uma miniatura em cinza (MOTION_GATE_WIDTH px de largura) com a do último
+    frame que "mexeu", e não com a do frame anterior, para que um movimento
+    lento também acumule até passar do limite. Um frame parado é liberado a
+    cada `refresh_frames` para o estado não ficar velho (luz, objeto novo
+    parado na borda etc.).
+    """
+
+    def __init__(self, changed_fraction, refresh_frames):
+        self.changed_fraction = changed_fraction
+        self.refresh_frames = refresh_frames
+        self.reference = None
+        self.static_run = 0
+        self.frames_static = 0
+
+    def thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        size = (MOTION_GATE_WIDTH, max(1, round(h * MOTION_GATE_WIDTH / w)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def changed(self, frame):
+        thumb = self.thumbnail(frame)
+        if self.reference is not None and self.reference.shape == thumb.shape:
+            diff = cv2.absdiff(thumb, self.reference)
+            moved = np.count_nonzero(diff > MOTION_PIXEL_THRESHOLD) > self.changed_fraction * diff.size
+            refresh = self.refresh_frames and self.static_run + 1 >= self.refresh_frames
+            if not moved and not refresh:
+                self.static_run += 1
+                self.frames_static += 1
+                return False
+
+        self.reference = thumb
+        self.static_run = 0
+        return True
+
+
+def predict_tracked(byte_tracker, steps, track_info):
+    """
+    Caixas dos tracks ativos projetadas `steps` atualizações do tracker à
+    frente pelo modelo de velocidade constante do Kalman do ByteTrack, sem
+    alterar o estado do tracker (`steps` pode ser fracionário: com stride N,
+    um frame pulado = 1/N de atualização). `track_info` = {track_id:
+    (class_id, score)} da última detecção.
+    """
+    xyxy = []
+    track_ids = []
+    for track in byte_tracker.tracked_tracks:
+        track_id = int(track.external_track_id)
+        if not track.is_activated or track_id not in track_info:
+            continue
+
+        # estado do Kalman: (cx, cy, aspecto w/h, h) + velocidades
+        cx, cy, aspect, h = track.mean[:4] + steps * track.mean[4:8]
+        w = aspect * h
+        xyxy.append((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2))
+        track_ids.append(track_id)
+
+    if not track_ids:
+        predicted = sv.Detections.empty()
+        predicted.tracker_id = np.array([], dtype=int)
+        return predicted
+
+    info = [track_info[t] for t in track_ids]
+    return sv.Detections(
+        xyxy=np.asarray(xyxy, dtype=np.float32),
+        confidence=np.asarray([score for _, score in info], dtype=np.float32),
+        class_id=np.asarray([class_id for class_id, _ in info], dtype=int),
+        tracker_id=np.asarray(track_ids, dtype=int),
+    )
 
 
-def frame_to_base64_bgr(frame):
-    ret, buf = cv2.imencode(".jpg", frame)
-    if not ret:
-        raise RuntimeError("Could not encode frame to JPG")
-    return base64.b64encode(buf).decode("ascii")
+class StreamSource:
+    """
+    Uma fonte de vídeo (arquivo ou câmera) e o estado que é só dela: cada
+    fonte tem o próprio ByteTrack, os próprios IDs vistos e o próprio stride;
+    só o modelo é compartilhado.
+    """
+
+    def __init__(self, source_id, video_arg, args):
+        self.source_id = source_id
+        self.video_arg = video_arg
+        self.use_camera = video_arg.isdigit()
+        self.cap = None
+        self.fps = BYTE_FRAME_RATE_FALLBACK
+        self.stride_arg = args.stride
+        self.max_stride = args.max_stride
+        self.byte_tracker = None
+        self.seen_tracks = SeenIds()
+        self.stride = None
+        self.last_detected_index = 0
+        self.update_gap = 1    # nº de frames entre as duas últimas atualizações do ByteTrack
+        self.track_info = {}   # track_id -> (class_id, score) do último frame com YOLO
+        self.ring = None       # criado no primeiro frame, quando o tamanho da imagem é conhecido
+        self.frames_written = 0
+        self.frames_detected = 0
+        self.motion_args = (args.motion_threshold, args.motion_refresh) if args.motion_gate else None
+        self.motion_gate = None
+        self.last_output = None   # caixas do último frame escrito, repetidas nos frames parados
+
+    def log(self, message):
+        prefix = f"[DEBUG] [source {self.source_id}]" if self.source_id else "[DEBUG]"
+        print(f"{prefix} {message}", file=sys.stderr, flush=True)
+
+    def open(self):
+        if self.use_camera:
+            self.cap = cv2.VideoCapture(int(self.video_arg))
+        else:
+            self.cap = cv2.VideoCapture(self.video_arg)
+
+        if not self.cap.isOpened():
+            return False
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.log(f"CAP opened. FPS reported = {fps}")
+        if fps <= 0:
+            fps = BYTE_FRAME_RATE_FALLBACK
+            self.log(f"FPS fallback used: {fps}")
+        self.fps = fps
+        return True
+
+    def create_tracker(self):
+        # separado do open(): o supervision pode ainda estar sendo importado pelo ModelLoader
+        self.byte_tracker = sv.ByteTrack(
+            track_activation_threshold=BYTE_TRACK_ACTIVATION_THRESHOLD,
+            lost_track_buffer=BYTE_LOST_TRACK_BUFFER,
+            minimum_matching_threshold=BYTE_MIN_MATCHING_THRESHOLD,
+            frame_rate=self.fps,
+            minimum_consecutive_frames=BYTE_MIN_CONSECUTIVE_FRAMES,
+        )
+        self.byte_tracker.reset()
+        self.stride = DetectionStride(self.stride_arg, self.fps, self.max_stride)
+        if self.motion_args is not None:
+            changed_fraction, refresh_seconds = self.motion_args
+            refresh_frames = max(1, round(refresh_seconds * self.fps)) if refresh_seconds > 0 else 0
+            self.motion_gate = MotionGate(changed_fraction, refresh_frames)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+        if self.ring is not None:
+            self.ring.close()
 
 
-def apply_roi_filter(detections, roi_rect, filter_by_center=True):
-    if detections is None or len(detections) == 0:
-        return detections
+# ============================================================
+# PIPELINE
+# ============================================================
+#
+# leitura (uma thread por fonte) -> inferência -> tracking/desenho -> encode/escrita
+#
+# Cada estágio roda na sua própria thread e conversa com o próximo por uma
+# fila limitada. Como há exatamente uma thread por estágio e as filas são
+# FIFO, os frames de cada fonte chegam ao ByteTrack (e ao stdout) na ordem em
+# que foram lidos. cv2 e o YOLO liberam o GIL nas partes pesadas, então os estágios
+# realmente se sobrepõem e o throughput tende ao do estágio mais lento.
 
-    x_min, y_min, x_max, y_max = roi_rect
+END_OF_STREAM = object()         # sentinela que atravessa o pipeline quando a fonte acaba
 
-    centers = detections.get_anchors_coordinates(sv.Position.CENTER)
-    cx = centers[:, 0]
-    cy = centers[:, 1]
+_POLL_SECONDS = 0.1
 
-    if filter_by_center:
-        mask = (cx >= x_min) & (cx <= x_max) & (cy >= y_min) & (cy <= y_max)
-    else:
-        x1 = detections.xyxy[:, 0]
-        y1 = detections.xyxy[:, 1]
-        mask = (x1 >= x_min) & (x1 <= x_max) & (y1 >= y_min) & (y1 <= y_max)
 
-    return detections[mask]
+class PipelineStopped(Exception):
+    """Levantada dentro de um estágio quando outro estágio pediu parada."""
+
+
+class FramePacket:
+    """Um frame e tudo o que os estágios vão anexando a ele."""
+
+    __slots__ = ("source", "index", "time_seconds", "frame", "detected", "static", "detections", "annotated",
+                 "det_columns")
+
+    def __init__(self, source, index, time_seconds, frame):
+        self.source = source
+        self.index = index
+        self.time_seconds = time_seconds
+        self.frame = frame
+        self.detected = True       # False = frame pulado pelo --stride, caixas previstas pelo tracker
+        self.static = False        # True = cena parada (--motion-gate): sem YOLO e sem tracker
+        self.detections = None
+        self.annotated = None      # None = frame sem prévia (--preview-fps): só as detecções
+        self.det_columns = None
+
+
+def queue_put(q, item, stop_event):
+    while True:
+        if stop_event.is_set():
+            raise PipelineStopped()
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return
+        except queue.Full:
+            continue
+
+
+def queue_put_latest(q, item):
+    """
+    Coloca `item` na fila sem bloquear, descartando o que ainda não foi
+    consumido. Devolve quantos itens foram descartados.
+    """
+    dropped = 0
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+
+class OutputQueue(queue.Queue):
+    """
+    Fila entre o tracking e o escritor do stdout, com a política do
+    --output-policy para quando o leitor (Form1) fica para trás:
+
+        block        fila comum de `image_limit` frames: o tracking (e a
+                     inferência atrás dele) espera o stdout
+        drop-images  no máximo `image_limit` frames com imagem na fila; ao
+                     passar disso, o mais antigo perde a imagem e fica só com
+                     as detecções
+        coalesce     só o frame mais novo da fila tem imagem: cada imagem que
+                     chega tira a dos frames que ainda estão esperando
+
+    Nos dois últimos modos as detecções de todos os frames são escritas, em
+    ordem; a fila só bloqueia com OUTPUT_MAX_PENDING frames parados, ou seja,
+    quando o leitor não dá conta nem das detecções. As imagens descartadas
+    nem chegam a ser codificadas (`images_dropped` conta quantas).
+    """
+
+    def __init__(self, policy, image_limit):
+        super().__init__(maxsize=image_limit if policy == "block" else OUTPUT_MAX_PENDING)
+        self.policy = policy
+        self.image_limit = image_limit
+        self.images = 0
+        self.images_dropped = 0
+
+    # _put/_get são chamados pelo queue.Queue já com o lock da fila
+    def _put(self, item):
+        if isinstance(item, FramePacket) and item.annotated is not None:
+            limit = {"drop-images": self.image_limit - 1, "coalesce": 0}.get(self.policy)
+            if limit is not None:
+                for waiting in self.queue:
+                    if self.images <= limit:
+                        break
+                    if isinstance(waiting, FramePacket) and waiting.annotated is not None:
+                        waiting.annotated = None
+                        self.images -= 1
+                        self.images_dropped += 1
+            self.images += 1
+        self.queue.append(item)
+
+    def _get(self):
+        item = self.queue.popleft()
+        if isinstance(item, FramePacket) and item.annotated is not None:
+            self.images -= 1
+        return item
+
+
+def queue_get(q, stop_event):
+    while True:
+        if stop_event.is_set():
+            raise PipelineStopped()
+        try:
+            return q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+
+
+class PipelineStage(threading.Thread):
+    """
+    Thread genérica de estágio: tira um item de `in_queue`, aplica `fn` e
+    coloca o retorno em `out_queue` (se houver). `fn` pode devolver None para
+    não repassar nada. Qualquer exceção para o pipeline inteiro e fica em
+    `self.error` para o main reportar.
+    """
+
+    def __init__(self, name, fn, in_queue, out_queue, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.fn = fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.stop_event = stop_event
+        self.error = None
+
+    def produce(self):
+        while True:
+            item = queue_get(self.in_queue, self.stop_event)
+            if item is END_OF_STREAM:
+                return
+            result = self.fn(item)
+            if result is not None and self.out_queue is not None:
+                queue_put(self.out_queue, result, self.stop_event)
+
+    def run(self):
+        try:
+            self.produce()
+            if self.out_queue is not None:
+                queue_put(self.out_queue, END_OF_STREAM, self.stop_event)
+        except PipelineStopped:
+            pass
+        except BaseException as exc:
+            self.error = exc
+            self.stop_event.set()
+
+
+class FrameReader(PipelineStage):
+    """
+    Primeiro estágio: lê o VideoCapture de uma fonte e numera os frames.
+
+    Com `latest_only` (câmera), a leitura nunca espera o resto do pipeline:
+    o reader continua esvaziando o buffer do OpenCV e, se a inferência ainda
+    não pegou o frame anterior, ele é trocado pelo mais novo. Assim o YOLO
+    sempre trabalha na imagem mais recente em vez de frames de segundos atrás.
+    Os frames descartados mantêm a numeração (frame_index/tempo continuam
+    sendo os da câmera) e são contados em `frames_dropped`.
+
+    `ready_event` avisa o SourceMultiplexer que a fila tem algo novo.
+    """
+
+    def __init__(self, source, out_queue, stop_event, ready_event, metrics, latest_only=False):
+        super().__init__(f"reader-{source.source_id}", None, None, out_queue, stop_event)
+        self.source = source
+        self.metrics = metrics
+        self.cap = source.cap
+        self.fps = source.fps
+        self.ready_event = ready_event
+        self.latest_only = latest_only
+        self.frames_read = 0
+        self.frames_dropped = 0
+
+    def run(self):
+        super().run()
+        self.ready_event.set()   # END_OF_STREAM (ou parada) também precisa acordar o multiplexer
+
+    def produce(self):
+        while True:
+            if self.stop_event.is_set():
+                raise PipelineStopped()
+
+            with self.metrics.measure("decode"):
+                ret, frame = self.cap.read()
+            if not ret:
+                self.source.log("cap.read() returned False. Ending loop.")
+                return
+
+            self.frames_read += 1
+            packet = FramePacket(self.source.source_id, self.frames_read, self.frames_read / self.fps, frame)
+            if self.latest_only:
+                self.frames_dropped += queue_put_latest(self.out_queue, packet)
+            else:
+                queue_put(self.out_queue, packet, self.stop_event)
+            self.ready_event.set()
+
+
+class SourceMultiplexer(PipelineStage):
+    """
+    Estágio de inferência: cada FrameReader tem a sua fila e, a cada rodada,
+    pega o frame da frente de cada fila que já tem um (sem esperar pelas
+    outras fontes) e passa todos juntos para `fn`, que roda o YOLO num lote
+    só. `fn` devolve os pacotes a repassar, na mesma ordem. Termina quando
+    todas as fontes mandam END_OF_STREAM.
+    """
+
+    def __init__(self, name, fn, in_queues, out_queue, stop_event, ready_event):
+        super().__init__(name, fn, None, out_queue, stop_event)
+        self.in_queues = in_queues
+        self.ready_event = ready_event
+
+    def produce(self):
+        active = list(self.in_queues)
+        while active:
+            if self.stop_event.is_set():
+                raise PipelineStopped()
+
+            # limpa antes de olhar as filas: um put depois disso deixa o evento setado
+            self.ready_event.clear()
+            batch = []
+            for q in list(active):
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    continue
+                if item is END_OF_STREAM:
+                    active.remove(q)
+                else:
+                    batch.append(item)
+
+            if not batch:
+                self.ready_event.wait(_POLL_SECONDS)
+                continue
+
+            for packet in self.fn(batch):
+                queue_put(self.out_queue, packet, self.stop_event)
+
+
+def run_pipeline(stages, stop_event):
+    """Inicia os estágios, espera todos terminarem e devolve o primeiro erro (ou None)."""
+    for stage in stages:
+        stage.start()
+
+    try:
+        for stage in stages:
+            while stage.is_alive():
+                stage.join(timeout=_POLL_SECONDS)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for stage in stages:
+            stage.join()
+
+    for stage in stages:
+        if stage.error is not None:
+            return stage
+    return None
+
+
+class ModelLoader(threading.Thread):
+    """
+    Carrega o modelo numa thread enquanto o main abre as câmeras/vídeos; as
+    duas coisas levam segundos e não dependem uma da outra. Faz também o
+    import do supervision (o mais pesado depois do torch) e, com
+    --fast-start, uma inferência de aquecimento. `timings` guarda os tempos
+    de cada passo para o handshake [READY].
+    """
+
+    def __init__(self, args, conf):
+        super().__init__(name="model-loader", daemon=True)
+        self.args = args
+        self.conf = conf
+        self.detector = None
+        self.error = None
+        self.timings = {}
+
+    def run(self):
+        try:
+            t0 = time.perf_counter()
+            sv.load()
+            t1 = time.perf_counter()
+            args = self.args
+            self.detector = load_detector(args.backend, args.model, args.intra_op_threads,
+                                          args.inter_op_threads, args.model_cache)
+            t2 = time.perf_counter()
+            if args.fast_start:
+                warm_up(self.detector, self.conf)
+            t3 = time.perf_counter()
+            self.timings = {"imports_s": t1 - t0, "model_s": t2 - t1, "warmup_s": t3 - t2}
+        except BaseException as exc:
+            self.error = exc
+
+    def result(self):
+        """Espera o carregamento e devolve o detector (ou levanta o erro da thread)."""
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.detector
+
+
+def emit_ready(args, detector, timings, sources):
+    """Handshake no stderr: tudo pronto para o 1º frame, com os tempos de cada etapa."""
+    record = {
+        "type": "ready",
+        "backend": args.backend,
+        "model_cached": bool(getattr(detector, "cached", False)),
+        "sources": len(sources),
+        **{name: round(seconds, 3) for name, seconds in timings.items()},
+        "total_s": round(time.perf_counter() - _STARTED, 3),
+    }
+    print(READY_PREFIX + json.dumps(record), file=sys.stderr, flush=True)
 
 
 # ============================================================
@@ -81,12 +701,13 @@ def main():
     args = parse_args()
 
     model_path = args.model
-    video_arg = args.video  # pode ser caminho de arquivo ou índice de câmera em texto
     conf = float(args.conf)
+    queue_size = max(1, int(args.queue_size))
+    multi_source = len(args.video) > 1
 
     # DEBUG
     print(f"[DEBUG] model_path = {model_path}", file=sys.stderr, flush=True)
-    print(f"[DEBUG] video_arg = {video_arg}", file=sys.stderr, flush=True)
+    print(f"[DEBUG] video_arg = {' '.join(args.video)}", file=sys.stderr, flush=True)
 
     # --------------------------------------------------------
     # 1) Verifica modelo
@@ -96,178 +717,297 @@ def main():
         sys.exit(1)
 
     # --------------------------------------------------------
-    # 2) Decide se é ARQUIVO ou CÂMERA
+    # 2) Decide se cada fonte é ARQUIVO ou CÂMERA
     #    - se video_arg for '0', '1', '2' etc. -> câmera
     #    - caso contrário, trata como caminho de arquivo
     # --------------------------------------------------------
-    use_camera = False
-    cam_index = 0
-    video_path = video_arg
-
-    if video_arg.isdigit():
-        use_camera = True
-        cam_index = int(video_arg)
-        print(f"[DEBUG] Using CAMERA index {cam_index}", file=sys.stderr, flush=True)
-    else:
-        # arquivo normal
-        if not os.path.isfile(video_path):
-            print(f"ERROR: video/image not found: {video_path}", file=sys.stderr)
-            sys.exit(1)
-        print(f"[DEBUG] Using VIDEO file {video_path}", file=sys.stderr, flush=True)
+    sources = [StreamSource(i, video_arg, args) for i, video_arg in enumerate(args.video)]
+
+    for source in sources:
+        if source.use_camera:
+            source.log(f"Using CAMERA index {int(source.video_arg)}")
+        else:
+            # arquivo normal
+            if not os.path.isfile(source.video_arg):
+                print(f"ERROR: video/image not found: {source.video_arg}", file=sys.stderr)
+                sys.exit(1)
+            source.log(f"Using VIDEO file {source.video_arg}")
 
     # --------------------------------------------------------
-    # 3) Carrega modelo YOLO
+    # 3) Carrega modelo YOLO (um só para todas as fontes), numa thread
+    #    em paralelo com a abertura das fontes (passo 4)
     # --------------------------------------------------------
-    print("[DEBUG] Loading YOLO model...", file=sys.stderr, flush=True)
-    model = YOLO(model_path)
+    print(f"[DEBUG] Loading YOLO model ({args.backend})...", file=sys.stderr, flush=True)
+    loader = ModelLoader(args, conf)
+    loader.start()
+
+    # --------------------------------------------------------
+    # 4) Abre vídeos/câmeras e cria um ByteTrack por fonte
+    # --------------------------------------------------------
+    t0 = time.perf_counter()
+    for source in sources:
+        if not source.open():
+            print(f"ERROR: could not open media (video/camera): {source.video_arg}", file=sys.stderr)
+            for opened in sources:
+                opened.release()
+            sys.exit(1)
+    capture_seconds = time.perf_counter() - t0
+
+    detector = loader.result()
     print("[DEBUG] YOLO model loaded.", file=sys.stderr, flush=True)
+    for source in sources:
+        source.create_tracker()
+    print("[DEBUG] ByteTrack created.", file=sys.stderr, flush=True)
+
+    # ROI: o YOLO roda só nos recortes e as caixas voltam em coordenadas do frame
+    try:
+        detector = wrap_detector(detector, args, [rect_to_polygon(*ROI_RECT)] if USE_ROI else None)
+    except ValueError as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        sys.exit(1)
 
     # filtro opcional de classes (se você estiver usando USE_CLASS_FILTER etc.)
     selected_class_ids = None
     if USE_CLASS_FILTER:
-        class_names_dict = model.model.names
+        class_names_dict = detector.names
         name_to_id = {v: k for k, v in class_names_dict.items()}
         selected_class_ids = []
         for cname in SELECTED_CLASS_NAMES:
             if cname in name_to_id:
                 selected_class_ids.append(name_to_id[cname])
             else:
-                print(f"WARNING: class name '{cname}' not found in model.model.names", file=sys.stderr)
-
-    # --------------------------------------------------------
-    # 4) Abre vídeo ou câmera
-    # --------------------------------------------------------
-    if use_camera:
-        cap = cv2.VideoCapture(cam_index)
-    else:
-        cap = cv2.VideoCapture(video_path)
+                print(f"WARNING: class name '{cname}' not found in model names", file=sys.stderr)
 
-    if not cap.isOpened():
-        print("ERROR: could not open media (video/camera).", file=sys.stderr)
+    try:
+        preview, jpeg = create_preview(args)
+    except (ValueError, ImportError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
         sys.exit(1)
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    print(f"[DEBUG] CAP opened. FPS reported = {fps}", file=sys.stderr, flush=True)
-    if fps <= 0:
-        fps = BYTE_FRAME_RATE_FALLBACK
-        print(f"[DEBUG] FPS fallback used: {fps}", file=sys.stderr, flush=True)
+    metrics = create_metrics(args)
 
     # --------------------------------------------------------
-    # 5) Cria ByteTrack
+    # 5) Estágios do pipeline (arquivo ou câmera, é igual)
     # --------------------------------------------------------
-    byte_tracker = sv.ByteTrack(
-        track_activation_threshold=BYTE_TRACK_ACTIVATION_THRESHOLD,
-        lost_track_buffer=BYTE_LOST_TRACK_BUFFER,
-        minimum_matching_threshold=BYTE_MIN_MATCHING_THRESHOLD,
-        frame_rate=fps,
-        minimum_consecutive_frames=BYTE_MIN_CONSECUTIVE_FRAMES,
-    )
-    byte_tracker.reset()
-    print("[DEBUG] ByteTrack created.", file=sys.stderr, flush=True)
-
-    seen_tracks = set()
-    frame_index = 0
-
-    # --------------------------------------------------------
-    # 6) Loop de frames (arquivo ou câmera, é igual)
-    # --------------------------------------------------------
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("[DEBUG] cap.read() returned False. Ending loop.", file=sys.stderr, flush=True)
-            break
-
-        frame_index += 1
-        t_seconds = frame_index / fps
-
-        # YOLO
-        results = model(frame, conf=conf, verbose=False)[0]
-        detections = sv.Detections.from_ultralytics(results)
-
-        # filtro de classes, se estiver ligado
-        if USE_CLASS_FILTER and selected_class_ids:
-            detections = detections[np.isin(detections.class_id, selected_class_ids)]
-
-        # ROI opcional
-        if USE_ROI:
-            detections = apply_roi_filter(detections, ROI_RECT, FILTER_BY_ROI_CENTER)
-
-        # tracking
-        detections = byte_tracker.update_with_detections(detections)
-
-        det_list = []
-        annotated_frame = frame.copy()
-
-        for i in range(len(detections)):
-            x1, y1, x2, y2 = detections.xyxy[i]
-            class_id = int(detections.class_id[i])
-            score = float(detections.confidence[i])
-            track_id = detections.tracker_id[i]
-
-            if track_id is None:
-                track_id_int = -1
+    def infer(packets):
+        # decide o gate de movimento e o stride antes: só os frames que vão pro YOLO entram no lote
+        batch = []
+        for packet in packets:
+            source = sources[packet.source]
+            if source.motion_gate is not None:
+                with metrics.measure("motion"):
+                    moved = source.motion_gate.changed(packet.frame)
+                if not moved:
+                    packet.detected = False
+                    packet.static = True
+                    continue
+            if source.stride.should_detect(packet.index):
+                batch.append(packet)
             else:
-                track_id_int = int(track_id)
-
-            w = float(x2 - x1)
-            h = float(y2 - y1)
-
-            is_new = False
-            if track_id_int >= 0 and track_id_int not in seen_tracks:
-                seen_tracks.add(track_id_int)
-                is_new = True
-
-            cv2.rectangle(
-                annotated_frame,
-                (int(x1), int(y1)),
-                (int(x2), int(y2)),
-                (0, 255, 0),
-                2,
-            )
-            label = f"#{track_id_int} C{class_id} {score:.2f}"
-            cv2.putText(
-                annotated_frame,
-                label,
-                (int(x1), int(y1) - 5),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (0, 255, 0),
-                1,
-                cv2.LINE_AA,
-            )
-
-            det_list.append(
-                {
-                    "track_id": track_id_int,
-                    "class_id": class_id,
-                    "score": score,
-                    "x": float(x1),
-                    "y": float(y1),
-                    "w": w,
-                    "h": h,
-                    "is_new": bool(is_new),
+                packet.detected = False
+        if not batch:
+            return packets
+
+        # YOLO: um lote com um frame de cada fonte que tinha frame pronto
+        t0 = time.perf_counter()
+        results = detector.detect_batch([packet.frame for packet in batch], conf)
+        latency = time.perf_counter() - t0
+        metrics.record_detector(detector, len(batch))
+
+        for packet, detections in zip(batch, results):
+            source = sources[packet.source]
+            source.stride.record_latency(latency)
+            source.frames_detected += 1
+
+            # filtro de classes, se estiver ligado
+            if USE_CLASS_FILTER and selected_class_ids:
+                detections = detections[np.isin(detections.class_id, selected_class_ids)]
+
+            packet.detections = detections
+        return packets
+
+    def track_and_annotate(packet):
+        source = sources[packet.source]
+        byte_tracker = source.byte_tracker
+
+        # tracking (só esta thread mexe nos ByteTracks / seen_tracks, sempre em ordem de frame)
+        with metrics.measure("track"):
+            if packet.static:
+                # cena parada: mesmas caixas e mesmo estado do tracker; o relógio do Kalman
+                # também para, senão a próxima previsão andaria pelo tempo parado
+                detections = source.last_output if source.last_output is not None else sv.Detections.empty()
+                if detections.tracker_id is None:
+                    detections.tracker_id = np.array([], dtype=int)
+                source.last_detected_index = packet.index
+                box_color = STATIC_BOX_COLOR
+            elif packet.detected:
+                detections = byte_tracker.update_with_detections(packet.detections)
+                if source.last_detected_index > 0:
+                    source.update_gap = packet.index - source.last_detected_index
+                source.last_detected_index = packet.index
+                source.track_info = {
+                    int(t): (int(c), float(s))
+                    for t, c, s in zip(detections.tracker_id, detections.class_id, detections.confidence)
                 }
-            )
-
-        # Encode frame + manda JSON para o C#
-        img_b64 = frame_to_base64_bgr(annotated_frame)
-        out_obj = {
-            "frame_index": frame_index,
-            "time_seconds": float(t_seconds),
-            "detections": det_list,
-            "image": img_b64,
-        }
-        print(json.dumps(out_obj), flush=True)
-
-    cap.release()
+                box_color = (0, 255, 0)
+            else:
+                steps = (packet.index - source.last_detected_index) / source.update_gap
+                detections = predict_tracked(byte_tracker, steps, source.track_info)
+                box_color = PREDICTED_BOX_COLOR
+
+            det_columns = detection_columns(detections, source.seen_tracks)
+            source.last_output = detections
+
+        # prévia: só nos frames que vão ser exibidos, já no tamanho da exibição
+        if preview.wants(packet.source, packet.time_seconds):
+            with metrics.measure("annotate"):
+                annotated_frame, scale = preview.resize(packet.frame)
+                draw_detections(annotated_frame, detections, det_columns, box_color, scale)
+            packet.annotated = annotated_frame
+
+        packet.detections = detections
+        packet.det_columns = det_columns
+        packet.frame = None  # libera o frame original o quanto antes
+        return packet
+
+    def write_to_ring(packet):
+        """
+        Grava a prévia no ring buffer e devolve (slot, None); com --shm-format
+        jpeg, um JPEG que não cabe no slot volta como (-1, bytes) para ir pelo
+        stdout, como sem --shm.
+        """
+        source = sources[packet.source]
+        annotated = packet.annotated
+        fmt = frame_ring.FORMATS[args.shm_format]
+        if source.ring is None:
+            path = args.shm if source.source_id == 0 else f"{args.shm}.{source.source_id}"
+            source.ring = frame_ring.FrameRingBuffer.create(path, max(2, args.shm_slots),
+                                                            frame_ring.slot_capacity(annotated.shape, fmt))
+            source.log(f"Frame ring buffer: {path} ({source.ring.slot_count} slots)")
+
+        ring = source.ring
+        if fmt == frame_ring.FORMAT_JPEG:
+            data = jpeg.encode(annotated)
+            if len(data) > ring.slot_capacity:
+                return -1, data
+            return ring.write(packet.index, data, fmt, annotated.shape), None
+        return ring.write(packet.index, annotated), None
+
+    def encode_and_write(packet):
+        binary = args.protocol == "binary"
+
+        # com --shm a imagem vai para o ring buffer e o stdout leva só o slot
+        slot = -1
+        image = b"" if binary else ""
+        if packet.annotated is not None:
+            with metrics.measure("encode"):
+                data = None
+                if args.shm:
+                    slot, data = write_to_ring(packet)
+                else:
+                    data = jpeg.encode(packet.annotated)
+                if data is not None:
+                    image = bytes(data) if binary else base64.b64encode(data).decode("ascii")
+
+        with metrics.measure("write"):
+            if binary:
+                # header + detecções float32 + JPEG cru, sem base64/JSON
+                flags = packet.source << frame_protocol.FLAG_SOURCE_SHIFT
+                if not packet.detected:
+                    flags |= frame_protocol.FLAG_PREDICTED
+                if packet.static:
+                    flags |= frame_protocol.FLAG_STATIC
+                frame_protocol.write_frame(
+                    sys.stdout.buffer,
+                    packet.index,
+                    float(packet.time_seconds),
+                    frame_protocol.detections_to_records(packet.det_columns),
+                    image,
+                    slot,
+                    flags,
+                )
+            else:
+                # manda JSON para o C#
+                out_obj = {
+                    "frame_index": packet.index,
+                    "time_seconds": float(packet.time_seconds),
+                    "detected": packet.detected,
+                    "detections": columns_to_records(packet.det_columns),
+                }
+                if multi_source:
+                    out_obj["source"] = packet.source
+                if args.motion_gate:
+                    out_obj["static"] = packet.static
+                out_obj["image"] = image
+                if args.shm:
+                    out_obj["slot"] = slot
+                print(json.dumps(out_obj), flush=True)
+
+        sources[packet.source].frames_written += 1
+        metrics.frame_done()
+        return None
+
+    stop_event = threading.Event()
+    frames_ready = threading.Event()
+
+    readers = []
+    q_sources = []
+    for source in sources:
+        latest_only = args.capture == "latest" or (args.capture == "auto" and source.use_camera)
+        # no modo latest só existe um frame esperando pela inferência: o mais novo
+        q_frames = queue.Queue(maxsize=1 if latest_only else queue_size)
+        q_sources.append(q_frames)
+        readers.append(FrameReader(source, q_frames, stop_event, frames_ready, metrics, latest_only))
+
+    q_detected = queue.Queue(maxsize=queue_size * len(sources))
+    q_annotated = OutputQueue(args.output_policy, queue_size)
+
+    stages = readers + [
+        SourceMultiplexer("infer", infer, q_sources, q_detected, stop_event, frames_ready),
+        PipelineStage("track", track_and_annotate, q_detected, q_annotated, stop_event),
+        PipelineStage("write", encode_and_write, q_annotated, None, stop_event),
+    ]
+
+    captures = ", ".join("latest" if reader.latest_only else "all" for reader in readers)
+    print(f"[DEBUG] Pipeline started (sources = {len(sources)}, queue size = {queue_size}, "
+          f"stride = {args.stride}, capture = {captures}, motion gate = {args.motion_gate}, "
+          f"preview = {args.preview_size or 'full'} @ {args.preview_fps or 'all'} fps, "
+          f"output policy = {args.output_policy}).",
+          file=sys.stderr, flush=True)
+    emit_ready(args, detector, {**loader.timings, "capture_s": capture_seconds}, sources)
+    failed = run_pipeline(stages, stop_event)
+    metrics.close()
+
+    for source in sources:
+        source.release()
+
+    if failed is not None:
+        if isinstance(failed.error, BrokenPipeError):
+            # o C# fechou o stdout (ex.: câmera encerrada) -> não é erro
+            print("[DEBUG] stdout closed by reader. Stopping.", file=sys.stderr, flush=True)
+            return
+        print(f"ERROR: pipeline stage '{failed.name}' failed: {failed.error!r}", file=sys.stderr)
+        sys.exit(1)
 
     # para câmera, é normal sair com frame_index grande;
     # para vídeo, se frame_index == 0, algo deu errado
-    if not use_camera and frame_index == 0:
-        print("ERROR: no frames were read from the video.", file=sys.stderr)
-        sys.exit(1)
-    else:
-        print(f"[DEBUG] Finished. Total frames processed = {frame_index}", file=sys.stderr, flush=True)
+    for reader in readers:
+        if not reader.source.use_camera and reader.frames_read == 0:
+            print(f"ERROR: no frames were read from the video: {reader.source.video_arg}", file=sys.stderr)
+            sys.exit(1)
+
+    for reader in readers:
+        source = reader.source
+        static = source.motion_gate.frames_static if source.motion_gate is not None else 0
+        source.log(f"Finished. Total frames processed = {source.frames_written} "
+                   f"(detected = {source.frames_detected}, "
+                   f"predicted = {source.frames_written - source.frames_detected - static}, "
+                   f"static = {static}, dropped stale = {reader.frames_dropped})")
+    if preview.frames_skipped:
+        print(f"[DEBUG] Frames sent without preview image = {preview.frames_skipped}", file=sys.stderr, flush=True)
+    if q_annotated.images_dropped:
+        print(f"[DEBUG] Preview images dropped by output policy '{args.output_policy}' = "
+              f"{q_annotated.images_dropped} (detections kept)", file=sys.stderr, flush=True)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+region_detectors.py
+
+Detectores que rodam o modelo em pedaços do frame em vez do frame inteiro.
+Embrulham qualquer detector de detectors.py e expõem a mesma interface
+(names, detect, detect_batch, last_timings), devolvendo as caixas já em
+coordenadas do frame completo; o ByteTrack não percebe a diferença.
+
+- RoiDetector (--roi): recorta uma ou mais regiões de interesse (retângulos
+  ou polígonos) antes da inferência. Cada recorte entra no modelo na mesma
+  escala que o frame inteiro entraria (imgsz proporcional ao recorte), então
+  o custo cai na proporção da área. Em .onnx com entrada fixa o recorte é
+  ampliado até a entrada: não economiza, mas os objetos ficam maiores.
+- TiledDetector (--tiles): fatia o frame em tiles sobrepostos do tamanho da
+  entrada do modelo, sem reduzir a resolução; objetos pequenos em câmeras 4K
+  deixam de sumir no letterbox para 640px. O custo é fixo por frame (nº de
+  tiles x inferência de um tile), então dá para dimensionar a máquina.
+
+Os dois podem ser combinados: com --roi e --tiles, cada ROI é fatiada.
+
+- RescaledDetector: o detector recebe frames já reduzidos pela captura
+  (video_capture.py, --decode-size) e as caixas voltam para a resolução
+  original do vídeo. As ROIs continuam em coordenadas do vídeo original.
+"""
+
+import math
+import sys
+
+import numpy as np
+
+from detectors import NMS_CLASS_OFFSET, ONNX_DEFAULT_IOU, nms
+from lazy_import import lazy_module
+
+sv = lazy_module("supervision")
+
+MODEL_STRIDE = 32                # imgsz precisa ser múltiplo do stride do YOLO
+
+DEFAULT_TILE_OVERLAP = 0.2       # fração do tile repetida no vizinho (>= tamanho do maior objeto)
+DEFAULT_TILE_MATCH = 0.5         # sobreposição (IoS) a partir da qual caixas de tiles vizinhos são a mesma
+DEFAULT_TILE_BATCH = 16          # máximo de tiles por chamada do modelo (limita a memória)
+
+
+def rect_to_polygon(x1, y1, x2, y2):
+    return np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float64)
+
+
+def parse_region(text):
+    """
+    "x1,y1,x2,y2"               -> retângulo
+    "x1,y1;x2,y2;x3,y3[;...]"   -> polígono (3 pontos ou mais)
+    Devolve um array [n, 2] de vértices (um retângulo vira 4 vértices).
+    """
+    groups = [g for g in text.replace(" ", "").split(";") if g]
+    try:
+        values = [[float(v) for v in g.split(",")] for g in groups]
+    except ValueError:
+        raise ValueError(f"Invalid region '{text}': expected numbers") from None
+
+    if len(values) == 1 and len(values[0]) == 4:
+        x1, y1, x2, y2 = values[0]
+        if x2 <= x1 or y2 <= y1:
+            raise ValueError(f"Invalid region '{text}': expected x1,y1,x2,y2 with x2 > x1 and y2 > y1")
+        return rect_to_polygon(x1, y1, x2, y2)
+
+    if len(values) < 3 or any(len(v) != 2 for v in values):
+        raise ValueError(f"Invalid region '{text}': expected 'x1,y1,x2,y2' or at least 3 'x,y' points "
+                         "separated by ';'")
+    return np.array(values, dtype=np.float64)
+
+
+def points_in_polygon(points, polygon):
+    """Máscara dos pontos [n, 2] dentro do polígono [m, 2] (ray casting, vetorizado)."""
+    x, y = points[:, 0:1], points[:, 1:2]
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at_y = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return ((crosses & (x < x_at_y)).sum(axis=1) % 2) == 1
+
+
+def merge_detections(parts, iou=ONNX_DEFAULT_IOU):
+    """Junta as detecções dos pedaços de um frame e remove as duplicadas (NMS por classe)."""
+    parts = [p for p in parts if len(p) > 0]
+    if not parts:
+        return sv.Detections.empty()
+    if len(parts) == 1:
+        return parts[0]
+
+    merged = sv.Detections.merge(parts)
+    keep = nms(merged.xyxy + (merged.class_id * NMS_CLASS_OFFSET)[:, None], merged.confidence, iou)
+    return merged[np.sort(keep)]
+
+
+def cross_tile_nms(xyxy, scores, groups, threshold):
+    """
+    NMS entre pedaços diferentes (dentro de um pedaço o modelo já fez o seu).
+    Usa a interseção sobre a menor caixa (IoS): um objeto cortado na borda de
+    um tile vira uma caixa parcial contida na caixa inteira do vizinho, com
+    IoU baixo mas IoS perto de 1.
+    """
+    x1, y1, x2, y2 = xyxy[:, 0], xyxy[:, 1], xyxy[:, 2], xyxy[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        ios = inter / (np.minimum(areas[i], areas[rest]) + 1e-7)
+
+        order = rest[(ios <= threshold) | (groups[rest] == groups[i])]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def merge_tiles(parts, threshold=DEFAULT_TILE_MATCH):
+    """Junta as detecções dos tiles de um frame (cross_tile_nms por classe)."""
+    parts = [p for p in parts if len(p) > 0]
+    if not parts:
+        return sv.Detections.empty()
+    if len(parts) == 1:
+        return parts[0]
+
+    merged = sv.Detections.merge(parts)
+    groups = np.repeat(np.arange(len(parts)), [len(p) for p in parts])
+    keep = cross_tile_nms(merged.xyxy + (merged.class_id * NMS_CLASS_OFFSET)[:, None],
+                          merged.confidence, groups, threshold)
+    return merged[np.sort(keep)]
+
+
+def tile_starts(length, tile, overlap):
+    """Início de cada tile num eixo; o último encosta na borda, então todos têm o tamanho cheio."""
+    if length <= tile:
+        return [0]
+    step = max(1, int(tile * (1 - overlap)))
+    starts = list(range(0, length - tile, step))
+    starts.append(length - tile)
+    return starts
+
+
+class RegionDetector:
+    """
+    Base: `crops(frame)` define os pedaços [(x1, y1, x2, y2), ...] de cada
+    frame; todos os pedaços de todos os frames vão numa única chamada de
+    detect_batch do detector original.
+    """
+
+    max_batch = None    # pedaços por chamada do detector (None = todos de uma vez)
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.names = detector.names
+        self.imgsz = detector.imgsz
+        self.last_timings = {}
+
+    def crops(self, frame):
+        raise NotImplementedError
+
+    def accept(self, detections, crop_index):
+        """Filtro por pedaço, já em coordenadas do frame (padrão: aceita tudo)."""
+        return detections
+
+    def merge(self, parts):
+        return merge_detections(parts)
+
+    def batch_imgsz(self, frames, owners, images):
+        """imgsz para o lote de recortes (None = padrão do detector)."""
+        return None
+
+    def detect(self, frame, conf, imgsz=None):
+        return self.detect_batch([frame], conf)[0]
+
+    def detect_batch(self, frames, conf, imgsz=None):
+        images = []
+        owners = []     # (frame, índice do pedaço, offset x, offset y)
+        for i, frame in enumerate(frames):
+            for crop_index, (x1, y1, x2, y2) in enumerate(self.crops(frame)):
+                if x2 <= x1 or y2 <= y1:
+                    continue    # região fora do frame (ex.: câmera com resolução menor)
+                images.append(frame[y1:y2, x1:x2])
+                owners.append((i, crop_index, x1, y1))
+
+        imgsz = self.batch_imgsz(frames, owners, images) if images else None
+        chunk = self.max_batch or max(1, len(images))
+        results = []
+        timings = {}
+        for start in range(0, len(images), chunk):
+            results.extend(self.detector.detect_batch(images[start:start + chunk], conf, imgsz))
+            for stage, seconds in getattr(self.detector, "last_timings", {}).items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+        self.last_timings = timings
+
+        parts = [[] for _ in frames]
+        for (i, crop_index, x1, y1), detections in zip(owners, results):
+            if len(detections) == 0:
+                continue
+            detections.xyxy = detections.xyxy + np.array([x1, y1, x1, y1], dtype=detections.xyxy.dtype)
+            parts[i].append(self.accept(detections, crop_index))
+
+        return [self.merge(p) for p in parts]
+
+
+class RoiDetector(RegionDetector):
+    """
+    Inferência só dentro das regiões de interesse. Cada região é recortada
+    pelo seu retângulo envolvente; em polígonos ficam só as detecções com o
+    centro dentro do polígono. Regiões sobrepostas são deduplicadas por NMS.
+    """
+
+    def __init__(self, detector, regions):
+        super().__init__(detector)
+        self.regions = [np.asarray(r, dtype=np.float64) for r in regions]
+        self.is_rect = [_is_axis_aligned_rect(r) for r in self.regions]
+
+    def crops(self, frame):
+        h, w = frame.shape[:2]
+        boxes = []
+        for polygon in self.regions:
+            x1, y1 = np.floor(polygon.min(axis=0)).astype(int)
+            x2, y2 = np.ceil(polygon.max(axis=0)).astype(int)
+            boxes.append((min(max(x1, 0), w), min(max(y1, 0), h), min(max(x2, 0), w), min(max(y2, 0), h)))
+        return boxes
+
+    def batch_imgsz(self, frames, owners, images):
+        # mesma escala que o frame inteiro teria: lado do recorte x (imgsz / lado do frame)
+        nominal = self.detector.imgsz
+        size = 0
+        for (i, _, _, _), image in zip(owners, images):
+            scale = nominal / max(frames[i].shape[:2])
+            size = max(size, max(image.shape[:2]) * scale)
+        return min(nominal, max(MODEL_STRIDE, math.ceil(size / MODEL_STRIDE) * MODEL_STRIDE))
+
+    def accept(self, detections, crop_index):
+        if self.is_rect[crop_index]:
+            return detections
+        centers = detections.get_anchors_coordinates(sv.Position.CENTER)
+        return detections[points_in_polygon(centers, self.regions[crop_index])]
+
+
+class TiledDetector(RegionDetector):
+    """
+    Inferência fatiada: tiles de `tile_size` px (padrão: a entrada do modelo)
+    com `overlap` de sobreposição, todos os tiles do lote em chamadas de até
+    `max_batch` tiles. Com `full_frame` o frame inteiro entra como mais um
+    pedaço, para objetos maiores que um tile.
+    """
+
+    def __init__(self, detector, tile_size=None, overlap=DEFAULT_TILE_OVERLAP, full_frame=False,
+                 match_threshold=DEFAULT_TILE_MATCH, max_batch=DEFAULT_TILE_BATCH):
+        super().__init__(detector)
+        self.tile_size = tile_size or detector.imgsz
+        self.overlap = overlap
+        self.full_frame = full_frame
+        self.match_threshold = match_threshold
+        self.max_batch = max_batch
+        self.grids = {}     # (h, w) -> tiles, calculado uma vez por resolução
+
+    def crops(self, frame):
+        h, w = frame.shape[:2]
+        tiles = self.grids.get((h, w))
+        if tiles is None:
+            xs = tile_starts(w, self.tile_size, self.overlap)
+            ys = tile_starts(h, self.tile_size, self.overlap)
+            tiles = [(x, y, min(x + self.tile_size, w), min(y + self.tile_size, h)) for y in ys for x in xs]
+            if self.full_frame and len(tiles) > 1:
+                tiles.append((0, 0, w, h))
+            self.grids[(h, w)] = tiles
+            print(f"[DEBUG] Tiled inference: {w}x{h} -> {len(xs)} x {len(ys)} tiles of {self.tile_size}px "
+                  f"(overlap {self.overlap:.2f}), {len(tiles)} inferences per frame", file=sys.stderr, flush=True)
+        return tiles
+
+    def merge(self, parts):
+        return merge_tiles(parts, self.match_threshold)
+
+
+class RescaledDetector:
+    """
+    Para frames reduzidos na decodificação: `scale` = (largura reduzida /
+    original, altura reduzida / original). As caixas saem divididas pela
+    escala, em coordenadas do frame original.
+    """
+
+    def __init__(self, detector, scale):
+        self.detector = detector
+        self.names = detector.names
+        self.imgsz = detector.imgsz
+        self.inverse = np.array([1 / scale[0], 1 / scale[1], 1 / scale[0], 1 / scale[1]])
+
+    @property
+    def last_timings(self):
+        return getattr(self.detector, "last_timings", {})
+
+    def detect(self, frame, conf, imgsz=None):
+        return self.detect_batch([frame], conf, imgsz)[0]
+
+    def detect_batch(self, frames, conf, imgsz=None):
+        results = self.detector.detect_batch(frames, conf, imgsz)
+        for detections in results:
+            if len(detections):
+                detections.xyxy = (detections.xyxy * self.inverse).astype(detections.xyxy.dtype)
+        return results
+
+
+def _is_axis_aligned_rect(polygon):
+    if len(polygon) != 4:
+        return False
+    xs, ys = np.unique(polygon[:, 0]), np.unique(polygon[:, 1])
+    return len(xs) == 2 and len(ys) == 2
+
+
+def add_region_args(parser):
+    """Argumentos de linha de comando comuns aos scripts."""
+    parser.add_argument("--roi", action="append", default=None, metavar="REGION",
+                        help="Run the model only on this region: 'x1,y1,x2,y2' (rectangle) or "
+                             "'x1,y1;x2,y2;x3,y3;...' (polygon, boxes kept when their center is inside). "
+                             "Repeat for several regions; crops are batched in one inference call")
+    parser.add_argument("--tiles", action="store_true",
+                        help="Sliced inference: run the model on overlapping full-resolution tiles and merge "
+                             "them with cross-tile NMS (small objects on high-resolution cameras)")
+    parser.add_argument("--tile-size", type=int, default=0,
+                        help="Tile side in pixels (0 = model input size)")
+    parser.add_argument("--tile-overlap", type=float, default=DEFAULT_TILE_OVERLAP,
+                        help="Fraction of each tile shared with its neighbour; should cover the largest object")
+    parser.add_argument("--tile-full-frame", action="store_true",
+                        help="Also run the whole (downscaled) frame, for objects larger than a tile")
+    parser.add_argument("--tile-batch", type=int, default=DEFAULT_TILE_BATCH,
+                        help="Maximum tiles per inference call")
+
+
+def check_region_args(args):
+    """Valida os argumentos de região; ValueError com a mensagem para o usuário."""
+    for region in args.roi or []:
+        parse_region(region)
+    if args.tiles:
+        if args.tile_size < 0 or 0 < args.tile_size < MODEL_STRIDE:
+            raise ValueError(f"--tile-size must be 0 or at least {MODEL_STRIDE}")
+        if not 0 <= args.tile_overlap < 1:
+            raise ValueError("--tile-overlap must be in [0, 1)")
+        if args.tile_batch < 1:
+            raise ValueError("--tile-batch must be at least 1")
+
+
+def wrap_detector(detector, args, default_regions=None, scale=(1.0, 1.0)):
+    """
+    Aplica os modos de região pedidos na linha de comando ao detector
+    carregado. `scale` é a redução dos frames na captura
+    (video_capture.capture_scale): as ROIs são levadas para o frame reduzido
+    e as caixas trazidas de volta.
+    """
+    check_region_args(args)
+    if args.tiles:
+        detector = TiledDetector(detector, args.tile_size or None, args.tile_overlap,
+                                 args.tile_full_frame, max_batch=args.tile_batch)
+
+    # ROI por fora: cada recorte é fatiado pelo TiledDetector
+    regions = [parse_region(r) for r in args.roi] if args.roi else default_regions
+    if regions:
+        if tuple(scale) != (1.0, 1.0):
+            regions = [np.asarray(r, dtype=np.float64) * scale for r in regions]
+        detector = RoiDetector(detector, regions)
+
+    if tuple(scale) != (1.0, 1.0):
+        detector = RescaledDetector(detector, scale)
+    return detector
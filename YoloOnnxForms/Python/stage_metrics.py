@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+stage_metrics.py
+
+Instrumentação opcional (--metrics) dos scripts de vídeo: tempo de cada
+estágio por frame, para saber se a máquina está limitada pela inferência ou
+pelo encode/escrita antes de trocar hardware.
+
+    decode       cap.read()
+    motion       gate de movimento (--motion-gate)
+    preprocess   letterbox/normalização do detector
+    infer        execução do modelo
+    postprocess  NMS e conversão das caixas
+    track        ByteTrack (atualização ou previsão)
+    annotate     cópia do frame + desenho das caixas
+    encode       JPEG/base64 ou cópia para o ring buffer
+    write        serialização e escrita no stdout/arquivo
+
+Para cada estágio são mantidos uma janela com as últimas amostras (p50/p95/p99
+"recentes", que mudam junto com a cena) e um histograma cumulativo em escala
+logarítmica (resumo final com memória constante). A cada `interval` segundos
+sai um registro {"type": "metrics", ...} e, no close(), um {"type": "summary",
+...}; os dois no mesmo formato:
+
+    {"type": "metrics", "elapsed": s, "frames": n, "fps": fps da janela,
+     "fps_total": fps desde o início, "bottleneck": estágio com maior média,
+     "stages": {"infer": {"count": n, "mean_ms": .., "p50_ms": .., "p95_ms": ..,
+                          "p99_ms": ..}, ...}}
+
+Os registros vão para o stderr numa linha "[METRICS] {json}" (o Form1.cs
+mostra essas linhas) ou, com --metrics-file, para um arquivo NDJSON.
+"""
+
+import contextlib
+import json
+import sys
+import threading
+import time
+
+import numpy as np
+
+STAGES = ("decode", "motion", "preprocess", "infer", "postprocess", "track", "annotate", "encode", "write")
+
+DEFAULT_INTERVAL = 2.0          # segundos entre registros periódicos
+DEFAULT_WINDOW = 300            # amostras por estágio na janela "recente"
+STDERR_PREFIX = "[METRICS] "
+
+# histograma cumulativo: 8 baldes por oitava, de 1 µs até ~67 s
+_BUCKETS_PER_OCTAVE = 8
+_BUCKET_EDGES = 1e-6 * 2.0 ** (np.arange(26 * _BUCKETS_PER_OCTAVE + 1) / _BUCKETS_PER_OCTAVE)
+_PERCENTILES = (50, 95, 99)
+
+
+class _StageStats:
+    def __init__(self, window):
+        self.window = np.zeros(window, dtype=np.float64)
+        self.window_count = 0
+        self.histogram = np.zeros(len(_BUCKET_EDGES) + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds, frames):
+        per_frame = seconds / frames
+        self.window[(self.window_count + np.arange(frames)) % len(self.window)] = per_frame
+        self.window_count += frames
+        self.histogram[np.searchsorted(_BUCKET_EDGES, per_frame)] += frames
+        self.count += frames
+        self.total += seconds
+
+    def recent(self):
+        samples = self.window[:min(self.window_count, len(self.window))]
+        values = np.percentile(samples, _PERCENTILES)
+        return _stage_record(len(samples), samples.mean(), values)
+
+    def cumulative(self):
+        # percentil = borda superior do balde onde cai a amostra de ordem p
+        ranks = np.ceil(np.asarray(_PERCENTILES) / 100 * self.count)
+        buckets = np.searchsorted(np.cumsum(self.histogram), ranks)
+        values = _BUCKET_EDGES[np.minimum(buckets, len(_BUCKET_EDGES) - 1)]
+        return _stage_record(self.count, self.total / self.count, values)
+
+
+def _stage_record(count, mean, percentiles):
+    record = {"count": int(count), "mean_ms": round(float(mean) * 1000, 3)}
+    for p, value in zip(_PERCENTILES, percentiles):
+        record[f"p{p}_ms"] = round(float(value) * 1000, 3)
+    return record
+
+
+class StageMetrics:
+    """
+    Acumula os tempos por estágio (thread-safe: cada estágio do pipeline
+    registra da sua thread) e chama `emit(record)` periodicamente.
+    """
+
+    def __init__(self, emit, interval=DEFAULT_INTERVAL, window=DEFAULT_WINDOW):
+        self.emit = emit
+        self.interval = interval
+        self.window = window
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.frames = 0
+        self.last_emit = self.started
+        self.last_emit_frames = 0
+
+    def record(self, stage, seconds, frames=1):
+        """Registra `seconds` gastos em `stage` para `frames` frames (lote = tempo dividido igualmente)."""
+        if frames <= 0:
+            return
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = _StageStats(self.window)
+            stats.add(seconds, frames)
+
+    @contextlib.contextmanager
+    def measure(self, stage, frames=1):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - t0, frames)
+
+    def record_detector(self, detector, frames):
+        """Tempos da última chamada do detector (detector.last_timings)."""
+        for stage, seconds in getattr(detector, "last_timings", {}).items():
+            self.record(stage, seconds, frames)
+
+    def frame_done(self, frames=1):
+        """Conta frames concluídos (para o FPS) e emite o registro periódico quando for a hora."""
+        with self.lock:
+            self.frames += frames
+            now = time.perf_counter()
+            if now - self.last_emit < self.interval:
+                return
+            record = self._snapshot("metrics", now, recent=True)
+            self.last_emit = now
+            self.last_emit_frames = self.frames
+        self.emit(record)
+
+    def _snapshot(self, kind, now, recent):
+        elapsed = now - self.started
+        fps_total = self.frames / elapsed if elapsed > 0 else 0.0
+        fps = fps_total
+        if recent and now > self.last_emit:
+            fps = (self.frames - self.last_emit_frames) / (now - self.last_emit)
+
+        stages = {}
+        for stage in sorted(self.stages, key=_stage_order):
+            stats = self.stages[stage]
+            stages[stage] = stats.recent() if recent else stats.cumulative()
+
+        return {
+            "type": kind,
+            "elapsed": round(elapsed, 3),
+            "frames": self.frames,
+            "fps": round(fps, 2),
+            "fps_total": round(fps_total, 2),
+            "bottleneck": max(stages, key=lambda s: stages[s]["mean_ms"]) if stages else None,
+            "stages": stages,
+        }
+
+    def summary(self):
+        with self.lock:
+            return self._snapshot("summary", time.perf_counter(), recent=False)
+
+    def close(self):
+        """Emite o resumo final (histograma cumulativo de toda a execução)."""
+        self.emit(self.summary())
+
+
+class NullMetrics:
+    """Mesma interface, sem custo: usado quando --metrics está desligado."""
+
+    def record(self, stage, seconds, frames=1):
+        pass
+
+    def measure(self, stage, frames=1):
+        return contextlib.nullcontext()
+
+    def record_detector(self, detector, frames):
+        pass
+
+    def frame_done(self, frames=1):
+        pass
+
+    def close(self):
+        pass
+
+
+def _stage_order(stage):
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
+
+
+def stderr_emitter(record):
+    print(STDERR_PREFIX + json.dumps(record), file=sys.stderr, flush=True)
+
+
+def file_emitter(path):
+    f = open(path, "w", encoding="utf-8", newline="\n")
+
+    def emit(record):
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+        if record["type"] == "summary":
+            f.close()
+
+    return emit
+
+
+def create_metrics(args):
+    """StageMetrics conforme --metrics / --metrics-file / --metrics-interval (NullMetrics se desligado)."""
+    if not args.metrics and not args.metrics_file:
+        return NullMetrics()
+    emit = file_emitter(args.metrics_file) if args.metrics_file else stderr_emitter
+    return StageMetrics(emit, args.metrics_interval)
+
+
+def add_metrics_args(parser):
+    """Argumentos de linha de comando comuns aos scripts."""
+    parser.add_argument("--metrics", action="store_true",
+                        help="Per-stage timing: periodic '[METRICS] {json}' lines on stderr plus a final summary")
+    parser.add_argument("--metrics-file", type=str, default=None,
+                        help="Write the metrics records to this NDJSON file instead of stderr (implies --metrics)")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_INTERVAL,
+                        help="Seconds between periodic metrics records")
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+tracker_config.py
+
+Parâmetros do ByteTrack do process_video.py, configuráveis pela linha de
+comando. Os padrões são os do sv.ByteTrack(), então sem nenhum argumento a
+saída é a mesma de antes. Os parâmetros também entram na chave do cache de
+resultados (detection_cache.py): mudar só o tracking reaproveita as
+detecções do YOLO já gravadas.
+"""
+
+from lazy_import import lazy_module
+
+sv = lazy_module("supervision")
+
+# mesmos nomes e padrões do sv.ByteTrack()
+TRACKER_DEFAULTS = {
+    "track_activation_threshold": 0.25,
+    "lost_track_buffer": 30,
+    "minimum_matching_threshold": 0.8,
+    "minimum_consecutive_frames": 1,
+    "frame_rate": 30,
+}
+
+
+def create_tracker(params=None):
+    """sv.ByteTrack com `params` (dict parcial; o que faltar usa TRACKER_DEFAULTS)."""
+    return sv.ByteTrack(**{**TRACKER_DEFAULTS, **(params or {})})
+
+
+def tracker_params(args):
+    """Parâmetros do ByteTrack a partir dos argumentos de linha de comando."""
+    params = {
+        "track_activation_threshold": args.track_activation_threshold,
+        "lost_track_buffer": args.lost_track_buffer,
+        "minimum_matching_threshold": args.min_matching_threshold,
+        "minimum_consecutive_frames": args.min_consecutive_frames,
+        "frame_rate": args.track_frame_rate,
+    }
+    if not 0.0 <= params["minimum_matching_threshold"] <= 1.0:
+        raise ValueError("--min-matching-threshold must be in [0, 1]")
+    if params["lost_track_buffer"] < 0 or params["minimum_consecutive_frames"] < 1 or params["frame_rate"] <= 0:
+        raise ValueError("--lost-track-buffer must be >= 0, --min-consecutive-frames >= 1 "
+                         "and --track-frame-rate > 0")
+    return params
+
+
+def add_tracker_args(parser):
+    """Argumentos de linha de comando do ByteTrack."""
+    parser.add_argument("--track-activation-threshold", type=float,
+                        default=TRACKER_DEFAULTS["track_activation_threshold"],
+                        help="ByteTrack: minimum confidence to start a new track")
+    parser.add_argument("--lost-track-buffer", type=int, default=TRACKER_DEFAULTS["lost_track_buffer"],
+                        help="ByteTrack: frames a lost track is kept before it is removed")
+    parser.add_argument("--min-matching-threshold", type=float,
+                        default=TRACKER_DEFAULTS["minimum_matching_threshold"],
+                        help="ByteTrack: matching threshold between detections and tracks (0-1)")
+    parser.add_argument("--min-consecutive-frames", type=int,
+                        default=TRACKER_DEFAULTS["minimum_consecutive_frames"],
+                        help="ByteTrack: consecutive frames before a track gets an ID")
+    parser.add_argument("--track-frame-rate", type=int, default=TRACKER_DEFAULTS["frame_rate"],
+                        help="ByteTrack: frame rate used to scale --lost-track-buffer")
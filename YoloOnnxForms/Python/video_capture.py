@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+video_capture.py
+
+Camada de captura do process_video.py: substitui o cv2.VideoCapture com a
+mesma interface (read, grab, get, set, release, isOpened) e decide onde e
+em que resolução o vídeo é decodificado.
+
+    --decoder opencv    cv2.VideoCapture (padrão)
+    --decoder ffmpeg    processo ffmpeg que manda frames BGR crus por um
+                        pipe; a redução de resolução (--decode-size) é
+                        feita pelo próprio ffmpeg, em C e multithread
+    --decode-size WxH   reduz os frames para caber em WxH (nunca amplia)
+    --hwaccel NOME      decodificação na GPU: nome do -hwaccel do ffmpeg
+                        (auto, cuda, qsv, d3d11va, dxva2...) ou, no opencv,
+                        any/d3d11/vaapi/mfx (CAP_PROP_HW_ACCELERATION)
+
+Nos dois decodificadores read() devolve sempre um dos `buffers` arrays
+pré-alocados (anel): nenhum frame novo é alocado por leitura, então a
+memória do processo fica estável mesmo em vídeos 4K. Em compensação um
+frame só continua válido pelas próximas `buffers - 1` leituras; quem
+guarda frames por mais tempo precisa copiá-los ou pedir mais buffers.
+
+Com --decode-size o detector recebe o frame reduzido; `scale` (largura e
+altura reduzidas / originais) é usada pelo region_detectors.RescaledDetector
+para devolver as caixas em coordenadas do vídeo original. No opencv o frame
+ainda é decodificado inteiro e só depois reduzido; só o ffmpeg (e a GPU
+com --hwaccel) tira o custo da decodificação em resolução cheia.
+"""
+
+import subprocess
+
+import numpy as np
+
+from lazy_import import lazy_module
+from preview import parse_size
+
+cv2 = lazy_module("cv2")
+
+DECODERS = ("opencv", "ffmpeg")
+DEFAULT_CAPTURE_BUFFERS = 2
+
+
+class CaptureSettings:
+    """Decodificador, tamanho máximo dos frames (None = original) e aceleração."""
+
+    def __init__(self, decoder="opencv", max_size=None, hwaccel=None, ffmpeg="ffmpeg"):
+        if decoder not in DECODERS:
+            raise ValueError(f"Unknown decoder: {decoder}")
+        if hwaccel and decoder == "opencv":
+            _opencv_hwaccel(hwaccel)
+        self.decoder = decoder
+        self.max_size = max_size
+        self.hwaccel = hwaccel
+        self.ffmpeg = ffmpeg
+
+    def key(self):
+        """O que muda os pixels dos frames (entra na chave do cache de detecções)."""
+        return {"decoder": self.decoder, "max_size": self.max_size, "hwaccel": self.hwaccel}
+
+
+def decode_size(width, height, max_size):
+    """Tamanho dos frames decodificados: (width, height) reduzido para caber em max_size."""
+    if max_size is None or width <= 0 or height <= 0:
+        return width, height
+    scale = min(1.0, max_size[0] / width, max_size[1] / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def probe_video(video_path):
+    """(largura, altura, fps, nº de frames) do vídeo, só pelo cabeçalho (sem decodificar)."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    info = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    cap.release()
+    return info
+
+
+def _scale(source_size, size):
+    return (size[0] / source_size[0], size[1] / source_size[1]) if min(source_size) > 0 else (1.0, 1.0)
+
+
+def _opencv_hwaccel(name):
+    value = getattr(cv2, f"VIDEO_ACCELERATION_{name.upper()}", None)
+    if value is None:
+        raise ValueError(f"Unknown OpenCV --hwaccel '{name}' (expected any, d3d11, vaapi or mfx)")
+    return value
+
+
+class FrameBuffers:
+    """Anel de `count` frames pré-alocados; next() devolve o próximo, reaproveitado a cada volta."""
+
+    def __init__(self, count=DEFAULT_CAPTURE_BUFFERS):
+        self.count = max(1, count)
+        self.arrays = []
+        self.index = 0
+
+    def next(self, shape):
+        if not self.arrays or self.arrays[0].shape != shape:
+            self.arrays = [np.empty(shape, dtype=np.uint8) for _ in range(self.count)]
+        frame = self.arrays[self.index]
+        self.index = (self.index + 1) % self.count
+        return frame
+
+
+class OpencvCapture:
+    """cv2.VideoCapture decodificando nos buffers do anel; com max_size reduz com INTER_LINEAR."""
+
+    def __init__(self, video_path, max_size=None, hwaccel=None, buffers=DEFAULT_CAPTURE_BUFFERS):
+        if hwaccel:
+            self.cap = cv2.VideoCapture(video_path, cv2.CAP_ANY,
+                                        [cv2.CAP_PROP_HW_ACCELERATION, _opencv_hwaccel(hwaccel)])
+        else:
+            self.cap = cv2.VideoCapture(video_path)
+        self.source_size = (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                            int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.size = decode_size(*self.source_size, max_size)
+        self.scale = _scale(self.source_size, self.size)
+        self.buffers = FrameBuffers(buffers)
+        self.decoded = None     # frame em resolução cheia, antes da redução (um só, reaproveitado)
+
+    def read(self):
+        if self.size == self.source_size:
+            # sem o tamanho no cabeçalho o OpenCV aloca o frame como de costume
+            frame = self.buffers.next((self.size[1], self.size[0], 3)) if min(self.size) > 0 else None
+            ret, frame = self.cap.read(frame)
+            return ret, frame if ret else None
+
+        ret, self.decoded = self.cap.read(self.decoded)
+        if not ret:
+            return False, None
+        frame = self.buffers.next((self.size[1], self.size[0], 3))
+        return True, cv2.resize(self.decoded, self.size, dst=frame, interpolation=cv2.INTER_LINEAR)
+
+    def grab(self):
+        return self.cap.grab()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.size[0])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.size[1])
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class FfmpegCapture:
+    """
+    Frames de um processo ffmpeg (rawvideo BGR no stdout), lidos direto nos
+    buffers do anel com readinto. set(CAP_PROP_POS_FRAMES) reinicia o ffmpeg
+    com -ss; o seek é por tempo, então quem precisa de exatidão confere o
+    frame (ver video_checkpoint.seek_capture).
+    """
+
+    def __init__(self, video_path, max_size=None, hwaccel=None, ffmpeg="ffmpeg",
+                 buffers=DEFAULT_CAPTURE_BUFFERS):
+        width, height, fps, self.frame_count = probe_video(video_path)
+        self.video_path = video_path
+        self.hwaccel = hwaccel
+        self.ffmpeg = ffmpeg
+        self.fps = fps if fps > 0 else 30.0
+        self.source_size = (width, height)
+        self.size = decode_size(width, height, max_size)
+        self.scale = _scale(self.source_size, self.size)
+        self.shape = (self.size[1], self.size[0], 3)
+        self.buffers = FrameBuffers(buffers)
+        self.scratch = None     # destino do grab()
+        self.proc = None
+        self.position = 0
+        self._start(0)
+
+    def _start(self, frame):
+        self._stop()
+        cmd = [self.ffmpeg, "-v", "error", "-nostdin"]
+        if self.hwaccel:
+            cmd += ["-hwaccel", self.hwaccel]
+        if frame > 0:
+            cmd += ["-ss", f"{frame / self.fps:.6f}"]
+        # -vsync 0: um frame na saída para cada frame do vídeo, como o OpenCV (sem duplicar em FPS variável)
+        cmd += ["-i", self.video_path, "-map", "0:v:0", "-vsync", "0"]
+        if self.size != self.source_size:
+            cmd += ["-vf", f"scale={self.size[0]}:{self.size[1]}:flags=area"]
+        cmd += ["-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+        try:
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+        except FileNotFoundError:
+            raise ValueError(f"ffmpeg not found: '{self.ffmpeg}' (install it or pass --ffmpeg PATH)") from None
+        self.position = frame
+
+    def _stop(self):
+        if self.proc is None:
+            return
+        # mata antes de fechar o pipe: senão o ffmpeg ainda reclama de "Broken pipe" no stderr
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+        self.proc = None
+
+    def _fill(self, frame):
+        view = memoryview(frame.reshape(-1))
+        filled = 0
+        while filled < len(view):
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        self.position += 1
+        return True
+
+    def read(self):
+        if self.proc is None:
+            return False, None
+        frame = self.buffers.next(self.shape)
+        if not self._fill(frame):
+            return False, None
+        return True, frame
+
+    def grab(self):
+        if self.proc is None:
+            return False
+        if self.scratch is None:
+            self.scratch = np.empty(self.shape, dtype=np.uint8)
+        return self._fill(self.scratch)
+
+    def get(self, prop):
+        values = {
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_COUNT: self.frame_count,
+            cv2.CAP_PROP_FRAME_WIDTH: self.size[0],
+            cv2.CAP_PROP_FRAME_HEIGHT: self.size[1],
+            cv2.CAP_PROP_POS_FRAMES: self.position,
+        }
+        return float(values.get(prop, 0.0))
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self._start(max(0, int(value)))
+        return True
+
+    def isOpened(self):
+        return self.proc is not None
+
+    def release(self):
+        self._stop()
+
+
+def open_video(video_path, settings=None, buffers=DEFAULT_CAPTURE_BUFFERS):
+    """Captura de `video_path` conforme `settings` (None = OpenCV em resolução cheia)."""
+    if settings is None:
+        settings = CaptureSettings()
+    if settings.decoder == "ffmpeg":
+        return FfmpegCapture(video_path, settings.max_size, settings.hwaccel, settings.ffmpeg, buffers)
+    return OpencvCapture(video_path, settings.max_size, settings.hwaccel, buffers)
+
+
+def capture_scale(video_path, settings=None):
+    """(escala x, escala y) que open_video vai usar neste vídeo, sem abrir a captura de verdade."""
+    if settings is None or settings.max_size is None:
+        return 1.0, 1.0
+    width, height, _, _ = probe_video(video_path)
+    return _scale((width, height), decode_size(width, height, settings.max_size))
+
+
+def capture_settings(args):
+    """CaptureSettings a partir dos argumentos; ValueError se inválidos."""
+    max_size = parse_size(args.decode_size, "decode size") if args.decode_size else None
+    return CaptureSettings(args.decoder, max_size, args.hwaccel, args.ffmpeg)
+
+
+def add_capture_args(parser):
+    """Argumentos de linha de comando da captura."""
+    parser.add_argument("--decoder", choices=DECODERS, default="opencv",
+                        help="Video decoder: opencv (cv2.VideoCapture) or ffmpeg (raw frames through a pipe; "
+                             "requires the ffmpeg executable)")
+    parser.add_argument("--decode-size", default=None, metavar="WxH",
+                        help="Downscale frames to fit WxH before detection; boxes are mapped back to the "
+                             "original resolution (with --decoder ffmpeg the scaling happens in ffmpeg)")
+    parser.add_argument("--hwaccel", default=None,
+                        help="Hardware decoding: an ffmpeg -hwaccel name (auto, cuda, qsv, d3d11va...) "
+                             "or, with --decoder opencv, any/d3d11/vaapi/mfx")
+    parser.add_argument("--ffmpeg", default="ffmpeg", help="ffmpeg executable for --decoder ffmpeg")
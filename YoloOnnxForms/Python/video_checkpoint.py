@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+video_checkpoint.py
+
+Checkpoints do process_video.py (--checkpoint-every / --resume), para um
+vídeo de horas não ser perdido inteiro numa queda de energia.
+
+    <saída>.ckpt            estado no último checkpoint: nº de frames já
+                            processados, ByteTrack e IDs vistos (pickle),
+                            impressão digital do último frame, tamanho do
+                            journal e os parâmetros da execução
+    <saída>.ckpt.journal    colunas de cada frame com detecções, na ordem,
+                            um registro pickle por frame
+
+No --resume o journal é cortado no tamanho gravado no checkpoint e
+reproduzido num writer novo (sem inferência), o vídeo é posicionado logo
+depois do último frame do checkpoint e o ByteTrack continua de onde parou:
+a saída final é idêntica à de uma execução sem interrupção, em qualquer
+formato. Os checkpoints caem sempre entre dois lotes, então os lotes do
+detector continuam com os mesmos frames. No fim da execução os dois
+arquivos são apagados.
+"""
+
+import hashlib
+import os
+import pickle
+
+from lazy_import import lazy_module
+
+cv2 = lazy_module("cv2")
+
+CHECKPOINT_VERSION = 1
+DEFAULT_CHECKPOINT_EVERY = 1000     # frames entre checkpoints quando só --resume é passado
+_FINGERPRINT_SIZE = (32, 32)
+
+
+def frame_fingerprint(frame):
+    """Hash de uma miniatura do frame: confirma que o vídeo foi posicionado no frame certo."""
+    thumb = cv2.resize(frame, _FINGERPRINT_SIZE, interpolation=cv2.INTER_AREA)
+    return hashlib.sha1(thumb.tobytes()).hexdigest()
+
+
+def seek_capture(cap, video_path, frames, fingerprint, reopen=None):
+    """
+    Devolve um VideoCapture posicionado depois dos `frames` primeiros frames.
+    Tenta o seek do OpenCV e confere o último frame pela impressão digital;
+    se o seek não for exato (keyframes, FPS variável), reabre o vídeo com
+    `reopen(video_path)` (padrão cv2.VideoCapture) e descarta os frames com
+    grab(), que só decodifica.
+    """
+    if frames == 0:
+        return cap
+    if reopen is None:
+        reopen = cv2.VideoCapture
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frames - 1)
+    ret, frame = cap.read()
+    if ret and frame_fingerprint(frame) == fingerprint:
+        return cap
+
+    cap.release()
+    cap = reopen(video_path)
+    for _ in range(frames - 1):
+        if not cap.grab():
+            break
+    ret, frame = cap.read()
+    if not ret or frame_fingerprint(frame) != fingerprint:
+        cap.release()
+        raise ValueError(f"Video does not match the checkpoint at frame {frames}: {video_path}")
+    return cap
+
+
+class VideoCheckpoint:
+    """
+    `params` identifica a execução (vídeo, modelo, conf, formato...): um
+    checkpoint com parâmetros diferentes não é retomado. `every` = frames
+    entre checkpoints; com `resume`, restore() continua do checkpoint
+    existente.
+    """
+
+    def __init__(self, output_path, params, every=DEFAULT_CHECKPOINT_EVERY, resume=False):
+        self.path = output_path + ".ckpt"
+        self.journal_path = self.path + ".journal"
+        self.params = params
+        self.every = max(1, int(every))
+        self.resume = resume
+        self.journal = None
+        self.seen = None
+        self.last_saved = 0
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != CHECKPOINT_VERSION or state.get("params") != self.params:
+            raise ValueError(f"Checkpoint {self.path} was created with different settings; "
+                             "delete it or run without --resume")
+        return state
+
+    def restore(self, writer, seen):
+        """
+        Abre o journal. Com --resume e um checkpoint válido, reproduz o
+        journal em `writer` e devolve o estado salvo ({"frames", "tracker",
+        "seen", "fingerprint"}); senão começa do zero e devolve None.
+        """
+        state = None
+        if self.resume and os.path.isfile(self.path):
+            state = self._load()
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(state["journal_size"])
+                f.seek(0)
+                while f.tell() < state["journal_size"]:
+                    writer.write_frame(pickle.load(f))
+            self.journal = open(self.journal_path, "ab")
+            self.seen = state["seen"]
+            self.last_saved = state["frames"]
+        else:
+            self.journal = open(self.journal_path, "wb")
+            self.seen = seen
+        return state
+
+    def record(self, columns):
+        """Anota as colunas de um frame no journal (frames sem detecção não entram)."""
+        if len(columns["TrackId"]):
+            pickle.dump(columns, self.journal, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def maybe_save(self, frames, tracker, last_frame):
+        """Chamado entre dois lotes: grava o checkpoint a cada `every` frames."""
+        if frames - self.last_saved < self.every:
+            return
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "params": self.params,
+            "frames": frames,
+            "tracker": tracker,
+            "seen": self.seen,
+            "fingerprint": frame_fingerprint(last_frame),
+            "journal_size": self.journal.tell(),
+        }
+        # grava ao lado e troca: um checkpoint pela metade nunca substitui o anterior
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.last_saved = frames
+
+    def remove(self):
+        """Execução concluída: apaga o checkpoint e o journal."""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        for path in (self.path, self.journal_path):
+            if os.path.isfile(path):
+                os.remove(path)
+
+
+def add_checkpoint_args(parser):
+    """Argumentos de linha de comando dos checkpoints."""
+    parser.add_argument("--checkpoint-every", type=int, default=0,
+                        help="Save a resumable checkpoint ('<output>.ckpt') every N frames (0 = off)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from '<output>.ckpt' if it exists; the output is identical to an "
+                             f"uninterrupted run (checkpoints every {DEFAULT_CHECKPOINT_EVERY} frames "
+                             "unless --checkpoint-every is given)")
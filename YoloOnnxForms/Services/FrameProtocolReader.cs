@@ -0,0 +1,119 @@
+﻿using System;
+using System.Buffers.Binary;
+using System.Collections.Generic;
+using System.IO;
+
+namespace YoloOnnxForms
+{
+    // Leitor do protocolo binário do process_video_stream.py (--protocol binary).
+    // O formato está descrito em Python/frame_protocol.py.
+    public class FrameProtocolReader
+    {
+        private const uint Magic = 0x31464F59;   // "YOF1" em little-endian
+        private const int HeaderSize = 32;
+        private const uint FlagPredicted = 0x1;
+        private const uint FlagStatic = 0x2;
+        private const int FlagSourceShift = 16;
+        private const int DetectionFields = 8;
+        private const int DetectionRecordSize = DetectionFields * sizeof(float);
+
+        private readonly Stream _stream;
+        private readonly byte[] _header = new byte[HeaderSize];
+        private byte[] _records = new byte[0];
+
+        public FrameProtocolReader(Stream stream)
+        {
+            _stream = stream;
+        }
+
+        // Retorna null quando o Python fecha o stdout.
+        public BinaryFrame? ReadFrame()
+        {
+            if (!ReadExact(_header, HeaderSize))
+                return null;
+
+            var header = _header.AsSpan();
+            if (BinaryPrimitives.ReadUInt32LittleEndian(header) != Magic)
+                throw new InvalidDataException("Cabeçalho de frame inválido no stdout do Python.");
+
+            uint flags = BinaryPrimitives.ReadUInt32LittleEndian(header.Slice(28));
+            var frame = new BinaryFrame
+            {
+                FrameIndex = (int)BinaryPrimitives.ReadUInt32LittleEndian(header.Slice(4)),
+                TimeSeconds = BinaryPrimitives.ReadDoubleLittleEndian(header.Slice(8)),
+                Slot = BinaryPrimitives.ReadInt32LittleEndian(header.Slice(24)),
+                Detected = (flags & FlagPredicted) == 0,
+                Static = (flags & FlagStatic) != 0,
+                Source = (int)(flags >> FlagSourceShift)
+            };
+            int count = (int)BinaryPrimitives.ReadUInt32LittleEndian(header.Slice(16));
+            int jpegSize = (int)BinaryPrimitives.ReadUInt32LittleEndian(header.Slice(20));
+
+            int recordsSize = count * DetectionRecordSize;
+            if (_records.Length < recordsSize)
+                _records = new byte[recordsSize];
+
+            if (!ReadExact(_records, recordsSize))
+                throw new EndOfStreamException("Stream do Python terminou no meio de um frame.");
+
+            for (int i = 0; i < count; i++)
+            {
+                var r = _records.AsSpan(i * DetectionRecordSize, DetectionRecordSize);
+                frame.Detections.Add(new BinaryDetection
+                {
+                    TrackId = (int)BinaryPrimitives.ReadSingleLittleEndian(r),
+                    ClassId = (int)BinaryPrimitives.ReadSingleLittleEndian(r.Slice(4)),
+                    Score = BinaryPrimitives.ReadSingleLittleEndian(r.Slice(8)),
+                    X = BinaryPrimitives.ReadSingleLittleEndian(r.Slice(12)),
+                    Y = BinaryPrimitives.ReadSingleLittleEndian(r.Slice(16)),
+                    W = BinaryPrimitives.ReadSingleLittleEndian(r.Slice(20)),
+                    H = BinaryPrimitives.ReadSingleLittleEndian(r.Slice(24)),
+                    IsNew = BinaryPrimitives.ReadSingleLittleEndian(r.Slice(28)) != 0f
+                });
+            }
+
+            frame.Jpeg = new byte[jpegSize];
+            if (!ReadExact(frame.Jpeg, jpegSize))
+                throw new EndOfStreamException("Stream do Python terminou no meio de um frame.");
+
+            return frame;
+        }
+
+        private bool ReadExact(byte[] buffer, int count)
+        {
+            int offset = 0;
+            while (offset < count)
+            {
+                int n = _stream.Read(buffer, offset, count - offset);
+                if (n == 0)
+                    return false;
+                offset += n;
+            }
+            return true;
+        }
+    }
+
+    public class BinaryFrame
+    {
+        public int FrameIndex { get; set; }
+        public double TimeSeconds { get; set; }
+        public int Slot { get; set; } = -1;   // slot do ring buffer (--shm), -1 = imagem em Jpeg
+        public bool Detected { get; set; } = true;   // false = caixas previstas pelo tracker (--stride)
+        public bool Static { get; set; }   // true = cena parada, caixas repetidas (--motion-gate)
+        public int Source { get; set; }   // índice da fonte (várias --video), 0 com uma só
+        public List<BinaryDetection> Detections { get; set; } = new List<BinaryDetection>();
+        public byte[] Jpeg { get; set; } = Array.Empty<byte>();
+    }
+
+    public class BinaryDetection
+    {
+        public int TrackId { get; set; }
+        public int ClassId { get; set; }
+        public float Score { get; set; }
+        public float X { get; set; }
+        public float Y { get; set; }
+        public float W { get; set; }
+        public float H { get; set; }
+        public bool IsNew { get; set; }
+    }
+}
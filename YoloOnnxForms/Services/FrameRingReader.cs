@@ -0,0 +1,110 @@
+﻿using System;
+using System.Drawing;
+using System.Drawing.Imaging;
+using System.IO;
+using System.IO.MemoryMappedFiles;
+using System.Runtime.InteropServices;
+
+namespace YoloOnnxForms
+{
+    // Lê frames do ring buffer em memória compartilhada escrito pelo
+    // process_video_stream.py (--shm). O layout está descrito em Python/frame_ring.py.
+    public class FrameRingReader : IDisposable
+    {
+        private const uint Magic = 0x52464F59;   // "YOFR" em little-endian
+        private const int FileHeaderSize = 64;
+        private const int SlotHeaderSize = 32;
+        private const int FormatBgr = 0;
+        private const int FormatJpeg = 1;
+
+        private readonly MemoryMappedFile _mmf;
+        private readonly MemoryMappedViewAccessor _view;
+        private readonly int _slotCount;
+        private readonly long _slotStride;
+        private byte[] _buffer = new byte[0];
+
+        public FrameRingReader(string path)
+        {
+            // o Python continua escrevendo no arquivo -> FileShare.ReadWrite
+            var fs = new FileStream(path, FileMode.Open, FileAccess.Read, FileShare.ReadWrite | FileShare.Delete);
+            _mmf = MemoryMappedFile.CreateFromFile(
+                fs, null, 0, MemoryMappedFileAccess.Read, HandleInheritability.None, false);
+            _view = _mmf.CreateViewAccessor(0, 0, MemoryMappedFileAccess.Read);
+
+            if (_view.ReadUInt32(0) != Magic)
+                throw new InvalidDataException($"Arquivo não é um ring buffer de frames: {path}");
+
+            _slotCount = (int)_view.ReadUInt32(8);
+            long slotCapacity = _view.ReadUInt32(12);
+            _slotStride = SlotHeaderSize + slotCapacity;
+        }
+
+        // Retorna null se o slot já foi sobrescrito por um frame mais novo (ou está sendo escrito).
+        public Bitmap? ReadFrame(int slot, int frameIndex)
+        {
+            if (slot < 0 || slot >= _slotCount)
+                return null;
+
+            long offset = FileHeaderSize + slot * _slotStride;
+
+            ulong seq = _view.ReadUInt64(offset);
+            if ((seq & 1) != 0 || _view.ReadUInt32(offset + 8) != (uint)frameIndex)
+                return null;
+
+            int width = (int)_view.ReadUInt32(offset + 12);
+            int height = (int)_view.ReadUInt32(offset + 16);
+            int channels = (int)_view.ReadUInt32(offset + 20);
+            int format = (int)_view.ReadUInt32(offset + 24);
+            int size = (int)_view.ReadUInt32(offset + 28);
+
+            if (_buffer.Length < size)
+                _buffer = new byte[size];
+            _view.ReadArray(offset + SlotHeaderSize, _buffer, 0, size);
+
+            // seqlock: se o Python mexeu no slot durante a cópia, descarta
+            if (_view.ReadUInt64(offset) != seq)
+                return null;
+
+            if (format == FormatJpeg)
+            {
+                using (var ms = new MemoryStream(_buffer, 0, size))
+                {
+                    return new Bitmap(ms);
+                }
+            }
+
+            if (format != FormatBgr || channels != 3)
+                return null;
+
+            return BgrParaBitmap(_buffer, width, height);
+        }
+
+        // Format24bppRgb do GDI já guarda os pixels como B,G,R -> cópia direta linha a linha
+        private static Bitmap BgrParaBitmap(byte[] bgr, int width, int height)
+        {
+            var bmp = new Bitmap(width, height, PixelFormat.Format24bppRgb);
+            var data = bmp.LockBits(
+                new Rectangle(0, 0, width, height), ImageLockMode.WriteOnly, PixelFormat.Format24bppRgb);
+            try
+            {
+                int rowBytes = width * 3;
+                for (int y = 0; y < height; y++)
+                {
+                    Marshal.Copy(bgr, y * rowBytes, data.Scan0 + y * data.Stride, rowBytes);
+                }
+            }
+            finally
+            {
+                bmp.UnlockBits(data);
+            }
+
+            return bmp;
+        }
+
+        public void Dispose()
+        {
+            _view.Dispose();
+            _mmf.Dispose();
+        }
+    }
+}
@@ -3,16 +3,32 @@ using System.Collections.Generic;
 using System.Diagnostics;
 using System.Globalization;
 using System.IO;
+using System.Text;
 using System.Text.Json;
 
 namespace YoloOnnxForms
 {
-    public class PythonDetectorService
+    public class PythonDetectorService : IDisposable
     {
+        private const int WorkerStderrLines = 200;   // últimas linhas de stderr do worker guardadas p/ erros
+
         private readonly string _pythonExePath;
         private readonly string _scriptPath;
         private readonly string _modelPath;
 
+        // Worker persistente (process_video.py --serve), opcional
+        private Process? _worker;
+        private readonly object _workerLock = new();
+        private readonly Queue<string> _workerStderr = new();
+        private int _nextJobId;
+
+        // Cache do process_video.py (--cache-dir): o mesmo vídeo com o mesmo modelo
+        // e conf volta na hora, e mudar só o ByteTrack não roda o YOLO de novo.
+        // Cada execução lê o vídeo inteiro para calcular o hash e grava as detecções
+        // no disco, então é opcional: null = desligado (padrão). Não vale para o
+        // ProcessVideoStreaming.
+        public string? CacheDir { get; set; }
+
         public PythonDetectorService(string pythonExePath, string scriptPath, string modelPath)
         {
             _pythonExePath = pythonExePath; // ex: C:\Python311\python.exe
@@ -25,6 +41,12 @@ namespace YoloOnnxForms
             // arquivo temporário para o JSON
             string tempJson = Path.GetTempFileName();
 
+            if (_worker != null)
+            {
+                EnviarJobWorker(videoPath, confThreshold, tempJson);
+                return LerResultadosJson(tempJson);
+            }
+
             var psi = new ProcessStartInfo
             {
                 FileName = _pythonExePath,
@@ -32,7 +54,8 @@ namespace YoloOnnxForms
                             $"--model \"{_modelPath}\" " +
                             $"--video \"{videoPath}\" " +
                             $"--conf {confThreshold.ToString(CultureInfo.InvariantCulture)} " +
-                            $"--output \"{tempJson}\"",
+                            $"--output \"{tempJson}\"" +
+                            ArgumentosCache(),
                 UseShellExecute = false,
                 RedirectStandardOutput = true,
                 RedirectStandardError = true,
@@ -55,6 +78,165 @@ namespace YoloOnnxForms
                 }
             }
 
+            return LerResultadosJson(tempJson);
+        }
+
+        // =========================================================
+        // WORKER PERSISTENTE
+        // =========================================================
+
+        // Sobe o process_video.py em modo --serve: Python, YOLO e modelo são
+        // carregados uma vez só e os próximos ProcessVideo() viram jobs para esse
+        // mesmo processo, em vez de um processo novo por vídeo.
+        public void StartWorker()
+        {
+            lock (_workerLock)
+            {
+                if (_worker != null && !_worker.HasExited)
+                    return;
+
+                var psi = new ProcessStartInfo
+                {
+                    FileName = _pythonExePath,
+                    Arguments = $"-u \"{_scriptPath}\" " +
+                                $"--model \"{_modelPath}\" " +
+                                "--serve" +
+                                ArgumentosCache(),
+                    UseShellExecute = false,
+                    RedirectStandardInput = true,
+                    RedirectStandardOutput = true,
+                    RedirectStandardError = true,
+                    CreateNoWindow = true,
+                    StandardOutputEncoding = Encoding.UTF8,
+                    StandardErrorEncoding = Encoding.UTF8
+                };
+
+                var proc = Process.Start(psi);
+                if (proc == null)
+                    throw new Exception("Não foi possível iniciar o worker Python.");
+
+                _workerStderr.Clear();
+                proc.ErrorDataReceived += (s, e) =>
+                {
+                    if (e.Data == null)
+                        return;
+                    lock (_workerStderr)
+                    {
+                        _workerStderr.Enqueue(e.Data);
+                        if (_workerStderr.Count > WorkerStderrLines)
+                            _workerStderr.Dequeue();
+                    }
+                };
+                proc.BeginErrorReadLine();
+                _worker = proc;
+
+                // espera o modelo carregar ({"event": "ready"})
+                LerRespostaWorker(null);
+            }
+        }
+
+        public void StopWorker()
+        {
+            lock (_workerLock)
+            {
+                if (_worker == null)
+                    return;
+
+                try
+                {
+                    if (!_worker.HasExited)
+                    {
+                        _worker.StandardInput.WriteLine("{\"cmd\": \"quit\"}");
+                        _worker.StandardInput.Flush();
+                        if (!_worker.WaitForExit(5000))
+                            _worker.Kill();
+                    }
+                }
+                catch
+                {
+                }
+                finally
+                {
+                    _worker.Dispose();
+                    _worker = null;
+                }
+            }
+        }
+
+        public void Dispose()
+        {
+            StopWorker();
+        }
+
+        private void EnviarJobWorker(string videoPath, float confThreshold, string outputPath)
+        {
+            lock (_workerLock)
+            {
+                if (_worker == null || _worker.HasExited)
+                    throw new Exception("Worker Python não está rodando:\n" + StderrWorker());
+
+                int id = ++_nextJobId;
+                var job = new Dictionary<string, object>
+                {
+                    ["id"] = id,
+                    ["video"] = videoPath,
+                    ["conf"] = confThreshold,
+                    ["output"] = outputPath
+                };
+                _worker.StandardInput.WriteLine(JsonSerializer.Serialize(job));
+                _worker.StandardInput.Flush();
+
+                var reply = LerRespostaWorker(id);
+                if (reply.status != "ok")
+                    throw new Exception($"Worker Python falhou no vídeo {videoPath}:\n{reply.error}");
+            }
+        }
+
+        // Lê o stdout do worker até a resposta do job `id` (ou o "ready", se id == null).
+        private WorkerReplyDto LerRespostaWorker(int? id)
+        {
+            while (true)
+            {
+                string? line = _worker!.StandardOutput.ReadLine();
+                if (line == null)
+                    throw new Exception("Worker Python encerrou inesperadamente:\n" + StderrWorker());
+
+                WorkerReplyDto? reply;
+                try
+                {
+                    reply = JsonSerializer.Deserialize<WorkerReplyDto>(line);
+                }
+                catch (JsonException)
+                {
+                    continue;
+                }
+
+                if (reply == null)
+                    continue;
+
+                if (id == null && reply.@event == "ready")
+                    return reply;
+
+                if (id != null && reply.id == id)
+                    return reply;
+            }
+        }
+
+        private string ArgumentosCache()
+        {
+            return string.IsNullOrEmpty(CacheDir) ? "" : $" --cache-dir \"{CacheDir}\"";
+        }
+
+        private string StderrWorker()
+        {
+            lock (_workerStderr)
+            {
+                return string.Join(Environment.NewLine, _workerStderr);
+            }
+        }
+
+        private static List<DetectionResult> LerResultadosJson(string tempJson)
+        {
             // lê o JSON gerado pelo Python
             var json = File.ReadAllText(tempJson);
             var results = JsonSerializer.Deserialize<List<DetectionResultDto>>(json);
@@ -65,21 +247,117 @@ namespace YoloOnnxForms
 
             foreach (var r in results)
             {
-                list.Add(new DetectionResult
-                {
-                    FrameIndex = r.FrameIndex,
-                    Timestamp = TimeSpan.FromSeconds(r.TimeSeconds),
-                    TrackId = r.TrackId,
-                    ClassId = r.ClassId,
-                    Score = r.Score,
-                    Box = new System.Drawing.RectangleF(r.X, r.Y, r.W, r.H),
-                    IsNewObject = r.IsNewObject
-                });
+                list.Add(ToDetectionResult(r));
             }
 
             return list;
         }
 
+        // Versão em streaming: o Python grava NDJSON no stdout (--format ndjson --output -)
+        // e cada detecção é devolvida assim que o frame correspondente é processado,
+        // sem esperar o vídeo inteiro nem guardar tudo em memória.
+        public IEnumerable<DetectionResult> ProcessVideoStreaming(string videoPath, float confThreshold)
+        {
+            var psi = new ProcessStartInfo
+            {
+                FileName = _pythonExePath,
+                Arguments = $"-u \"{_scriptPath}\" " +
+                            $"--model \"{_modelPath}\" " +
+                            $"--video \"{videoPath}\" " +
+                            $"--conf {confThreshold.ToString(CultureInfo.InvariantCulture)} " +
+                            "--format ndjson --output -",
+                UseShellExecute = false,
+                RedirectStandardOutput = true,
+                RedirectStandardError = true,
+                CreateNoWindow = true,
+                StandardOutputEncoding = Encoding.UTF8,
+                StandardErrorEncoding = Encoding.UTF8
+            };
+
+            using (var proc = Process.Start(psi))
+            {
+                if (proc == null)
+                    throw new Exception("Não foi possível iniciar o processo Python.");
+
+                // stderr lido em paralelo para o Python não travar com o buffer cheio
+                var stderr = new StringBuilder();
+                proc.ErrorDataReceived += (s, e) =>
+                {
+                    if (e.Data != null)
+                        lock (stderr) stderr.AppendLine(e.Data);
+                };
+                proc.BeginErrorReadLine();
+
+                bool completed = false;
+                try
+                {
+                    string? line;
+                    while ((line = proc.StandardOutput.ReadLine()) != null)
+                    {
+                        if (string.IsNullOrWhiteSpace(line))
+                            continue;
+
+                        DetectionResultDto? r;
+                        try
+                        {
+                            r = JsonSerializer.Deserialize<DetectionResultDto>(line);
+                        }
+                        catch (JsonException)
+                        {
+                            continue; // linha que não é detecção (ex.: print de alguma biblioteca)
+                        }
+
+                        if (r != null)
+                            yield return ToDetectionResult(r);
+                    }
+
+                    proc.WaitForExit();
+                    completed = true;
+                }
+                finally
+                {
+                    // consumidor parou no meio (break/Dispose) -> não deixa o Python rodando
+                    if (!completed && !proc.HasExited)
+                    {
+                        try { proc.Kill(); } catch { }
+                    }
+                }
+
+                if (proc.ExitCode != 0)
+                {
+                    string err;
+                    lock (stderr) err = stderr.ToString();
+                    throw new Exception(
+                        $"Python retornou código {proc.ExitCode}.\nSTDERR:\n{err}");
+                }
+            }
+        }
+
+        private static DetectionResult ToDetectionResult(DetectionResultDto r)
+        {
+            return new DetectionResult
+            {
+                FrameIndex = r.FrameIndex,
+                Timestamp = TimeSpan.FromSeconds(r.TimeSeconds),
+                TrackId = r.TrackId,
+                ClassId = r.ClassId,
+                Score = r.Score,
+                Box = new System.Drawing.RectangleF(r.X, r.Y, r.W, r.H),
+                IsNewObject = r.IsNewObject
+            };
+        }
+
+        // Resposta do worker (--serve), uma linha JSON por job
+        private class WorkerReplyDto
+        {
+            public int? id { get; set; }
+            public string? @event { get; set; }
+            public string? status { get; set; }
+            public string? error { get; set; }
+            public int frames { get; set; }
+            public double seconds { get; set; }
+        }
+
         // DTO que mapeia o JSON gerado pelo Python
         private class DetectionResultDto
         {
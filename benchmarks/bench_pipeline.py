@@ -0,0 +1,420 @@
+"""
+bench_pipeline.py
+
+Benchmark reproduzível do pipeline de detecção, sem GPU e sem rede:
+
+1. gera um vídeo sintético (retângulos/círculos claros se movendo sobre um
+   fundo texturizado) com resolução, FPS, duração e nº de objetos
+   configuráveis e semente fixa;
+2. usa um modelo ONNX minúsculo gerado na hora (brilho médio de cada célula
+   de 32x32 px vira o score de uma caixa, no layout de saída do YOLOv8) ou,
+   sem o pacote `onnx`, um detector stub em OpenCV;
+3. roda process_video() em cada formato de saída e o main() do
+   process_video_stream.py em cada protocolo, cada caso num processo
+   separado (o pico de RSS é só daquele caso);
+4. reporta frames/s, latência por estágio (p50/p95, via stage_metrics),
+   pico de RSS e tamanho da saída.
+
+    python benchmarks/bench_pipeline.py --width 1280 --height 720 --seconds 10
+    python benchmarks/bench_pipeline.py --save results.json
+    python benchmarks/bench_pipeline.py --baseline results.json --max-regression 0.15
+
+Com --baseline o script sai com código 1 se algum caso ficar mais de
+--max-regression abaixo do FPS de referência.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import supervision as sv
+
+try:
+    import resource   # pico de RSS; só existe em Unix
+except ImportError:
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "YoloOnnxForms", "Python"))
+
+import process_video  # noqa: E402
+import process_video_stream  # noqa: E402
+from stage_metrics import StageMetrics  # noqa: E402
+
+OFFLINE_FORMATS = tuple(process_video.OUTPUT_WRITERS)
+STREAM_PROTOCOLS = ("json", "binary", "binary-shm")
+
+BENCH_CONF = 0.5                 # acima do cinza do letterbox (114/255) para o modelo sintético
+MODEL_CELL = 32                  # lado da célula do modelo sintético, em px na entrada de 640
+MODEL_IMGSZ = 640
+
+
+# ============================================================
+# DADOS SINTÉTICOS
+# ============================================================
+
+def make_synthetic_video(path, width, height, fps, seconds, objects, seed):
+    """Grava um .avi (MJPG) com `objects` formas claras quicando nas bordas."""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 60, size=(height, width, 3), dtype=np.uint8)
+
+    size = max(16, min(width, height) // 10)
+    pos = rng.uniform([0, 0], [width - size, height - size], size=(objects, 2))
+    vel = rng.uniform(-1, 1, size=(objects, 2)) * size / 6
+    shapes = rng.integers(0, 2, size=objects)
+    colors = rng.integers(200, 256, size=(objects, 3)).tolist()
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open video writer for {path}")
+
+    for _ in range(int(round(fps * seconds))):
+        frame = background.copy()
+        for (x, y), shape, color in zip(pos.astype(int).tolist(), shapes.tolist(), colors):
+            if shape == 0:
+                cv2.rectangle(frame, (x, y), (x + size, y + size), color, -1)
+            else:
+                cv2.circle(frame, (x + size // 2, y + size // 2), size // 2, color, -1)
+        writer.write(frame)
+
+        pos += vel
+        bounce = (pos < 0) | (pos > [width - size, height - size])
+        vel[bounce] *= -1
+        pos = np.clip(pos, 0, [width - size, height - size])
+
+    writer.release()
+
+
+def make_tiny_onnx(path):
+    """
+    Modelo de brinquedo com a mesma interface de um YOLOv8 exportado (entrada
+    [batch, 3, 640, 640], saída [batch, 4 + 1, âncoras]): cada célula de 32x32
+    é uma âncora com caixa fixa e score = brilho médio da célula. Devolve
+    False se o pacote `onnx` não estiver instalado.
+    """
+    try:
+        import onnx
+        from onnx import TensorProto, helper, numpy_helper
+    except ImportError:
+        return False
+
+    grid = MODEL_IMGSZ // MODEL_CELL
+    centers = (np.arange(grid, dtype=np.float32) + 0.5) * MODEL_CELL
+    cy, cx = np.meshgrid(centers, centers, indexing="ij")
+    boxes = np.stack([
+        cx.ravel(), cy.ravel(),
+        np.full(grid * grid, 2 * MODEL_CELL, np.float32), np.full(grid * grid, 2 * MODEL_CELL, np.float32),
+    ])[None]                                                     # [1, 4, âncoras]
+
+    nodes = [
+        helper.make_node("ReduceMean", ["images"], ["gray"], axes=[1], keepdims=1),
+        helper.make_node("AveragePool", ["gray"], ["cells"],
+                         kernel_shape=[MODEL_CELL, MODEL_CELL], strides=[MODEL_CELL, MODEL_CELL]),
+        helper.make_node("Reshape", ["cells", "score_shape"], ["scores"]),
+        helper.make_node("Mul", ["scores", "zero"], ["zeros"]),
+        helper.make_node("Add", ["boxes", "zeros"], ["batch_boxes"]),     # broadcast das caixas p/ o lote
+        helper.make_node("Concat", ["batch_boxes", "scores"], ["output0"], axis=1),
+    ]
+    graph = helper.make_graph(
+        nodes, "bench",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, MODEL_IMGSZ, MODEL_IMGSZ])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, ["batch", 5, grid * grid])],
+        [
+            numpy_helper.from_array(boxes, "boxes"),
+            numpy_helper.from_array(np.zeros(1, np.float32), "zero"),
+            numpy_helper.from_array(np.array([0, 1, grid * grid], np.int64), "score_shape"),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    helper.set_model_props(model, {"names": "{0: 'blob'}"})
+    onnx.save(model, path)
+    return True
+
+
+class StubDetector:
+    """Detector sem modelo: componentes conexos claros do frame viram caixas."""
+
+    names = {0: "blob"}
+    imgsz = MODEL_IMGSZ
+
+    def __init__(self):
+        self.last_timings = {}
+
+    def detect(self, frame, conf, imgsz=None):
+        t0 = time.perf_counter()
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, 128, 255, cv2.THRESH_BINARY)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        stats = stats[1:count]
+        self.last_timings = {"infer": time.perf_counter() - t0}
+
+        if len(stats) == 0:
+            return sv.Detections.empty()
+        x, y, w, h = stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3]
+        return sv.Detections(
+            xyxy=np.stack([x, y, x + w, y + h], axis=1).astype(np.float32),
+            confidence=np.full(len(stats), 0.9, dtype=np.float32),
+            class_id=np.zeros(len(stats), dtype=int),
+        )
+
+    def detect_batch(self, frames, conf, imgsz=None):
+        results = []
+        total = 0.0
+        for frame in frames:
+            results.append(self.detect(frame, conf))
+            total += self.last_timings["infer"]
+        self.last_timings = {"infer": total}
+        return results
+
+
+# ============================================================
+# CASOS (cada um roda num processo próprio: python bench_pipeline.py --case ...)
+# ============================================================
+
+def _load_detector(case):
+    if case["detector"] == "stub":
+        return StubDetector()
+    return process_video.load_detector("onnxruntime", case["model"], case["threads"])
+
+
+def _collect_summary(records):
+    def emit(record):
+        if record["type"] == "summary":
+            records.append(record)
+    return emit
+
+
+def run_offline_case(case):
+    t0 = time.perf_counter()
+    detector = _load_detector(case)
+    load_seconds = time.perf_counter() - t0
+
+    summaries = []
+    metrics = StageMetrics(_collect_summary(summaries), interval=float("inf"))
+    frames = process_video.process_video(
+        case["model"], case["video"], BENCH_CONF, case["output"], case["batch_size"],
+        output_format=case["variant"], detector=detector, metrics=metrics,
+    )
+    metrics.close()
+    return frames, load_seconds, summaries[0]
+
+
+def run_stream_case(case):
+    metrics_path = case["output"] + ".metrics"
+    argv = ["process_video_stream.py", "--model", case["model"], "--video", case["video"],
+            "--conf", str(BENCH_CONF), "--backend", "onnxruntime",
+            "--intra-op-threads", str(case["threads"]), "--metrics-file", metrics_path]
+    if case["variant"] != "json":
+        argv += ["--protocol", "binary"]
+    if case["variant"] == "binary-shm":
+        argv += ["--shm", case["output"] + ".ring"]
+
+    if case["detector"] == "stub":
+        process_video_stream.load_detector = lambda *args: StubDetector()
+
+    t0 = time.perf_counter()
+    stdout = sys.stdout
+    sys.argv = argv
+    with open(case["output"], "w", encoding="utf-8", newline="\n") as out:
+        sys.stdout = out
+        try:
+            process_video_stream.main()
+        finally:
+            sys.stdout = stdout
+
+    with open(metrics_path, encoding="utf-8") as f:
+        summary = [json.loads(line) for line in f][-1]
+    # o stream carrega o modelo dentro do main(): o que não é processamento conta como carga
+    load_seconds = time.perf_counter() - t0 - summary["elapsed"]
+    return summary["frames"], load_seconds, summary
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)   # KiB no Linux
+
+
+def run_case(case):
+    t0 = time.perf_counter()
+    if case["mode"] == "offline":
+        frames, load_seconds, summary = run_offline_case(case)
+    else:
+        frames, load_seconds, summary = run_stream_case(case)
+    wall = time.perf_counter() - t0
+
+    return {
+        "name": case["name"],
+        "frames": frames,
+        "fps": summary["fps_total"],
+        "wall_s": round(wall, 3),
+        "load_s": round(load_seconds, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "output_bytes": os.path.getsize(case["output"]),
+        "bottleneck": summary["bottleneck"],
+        "stages": {stage: {"p50_ms": s["p50_ms"], "p95_ms": s["p95_ms"]} for stage, s in summary["stages"].items()},
+    }
+
+
+# ============================================================
+# DRIVER
+# ============================================================
+
+def build_cases(args, work_dir, video, model, detector):
+    cases = []
+    for mode in args.modes:
+        variants = args.formats if mode == "offline" else args.protocols
+        for variant in variants:
+            batches = args.batch_sizes if mode == "offline" else [1]
+            for batch_size in batches:
+                name = f"{mode}/{variant}" + (f"/b{batch_size}" if mode == "offline" else "")
+                cases.append({
+                    "name": name,
+                    "mode": mode,
+                    "variant": variant,
+                    "batch_size": batch_size,
+                    "video": video,
+                    "model": model,
+                    "detector": detector,
+                    "threads": args.threads,
+                    "output": os.path.join(work_dir, name.replace("/", "_") + ".out"),
+                })
+    return cases
+
+
+def run_in_subprocess(case, verbose):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--case", json.dumps(case)],
+        stdout=subprocess.PIPE,
+        stderr=None if verbose else subprocess.DEVNULL,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark case {case['name']} failed (exit code {proc.returncode})")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def print_report(results):
+    print(f"{'case':<24}{'fps':>9}{'wall s':>9}{'load s':>9}{'peak RSS':>11}{'output':>11}  bottleneck")
+    for r in results:
+        rss = "-" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.1f} MB"
+        print(f"{r['name']:<24}{r['fps']:>9.1f}{r['wall_s']:>9.2f}{r['load_s']:>9.2f}"
+              f"{rss:>11}{format_bytes(r['output_bytes']):>11}  {r['bottleneck']}")
+
+    stages = [s for s in ("decode", "preprocess", "infer", "postprocess", "track", "annotate", "encode", "write")
+              if any(s in r["stages"] for r in results)]
+    print()
+    print(f"{'p50 / p95 ms':<24}" + "".join(f"{s:>16}" for s in stages))
+    for r in results:
+        cells = []
+        for s in stages:
+            st = r["stages"].get(s)
+            cells.append(f"{st['p50_ms']:.2f} / {st['p95_ms']:.2f}" if st else "-")
+        print(f"{r['name']:<24}" + "".join(f"{c:>16}" for c in cells))
+
+
+def compare_baseline(results, settings, baseline_path, max_regression):
+    with open(baseline_path, encoding="utf-8") as f:
+        saved = json.load(f)
+    baseline = {r["name"]: r for r in saved["results"]}
+
+    changed = [k for k in ("width", "height", "fps", "seconds", "objects", "seed", "detector", "threads")
+               if saved["settings"].get(k) != settings.get(k)]
+    if changed:
+        print(f"\nWARNING: baseline was recorded with different settings ({', '.join(changed)}); "
+              "fps is not directly comparable.")
+
+    regressions = []
+    for r in results:
+        ref = baseline.get(r["name"])
+        if ref is None or ref["fps"] <= 0:
+            continue
+        change = r["fps"] / ref["fps"] - 1
+        if change < -max_regression:
+            regressions.append(f"{r['name']}: {ref['fps']:.1f} -> {r['fps']:.1f} fps ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--case", help=argparse.SUPPRESS)   # uso interno: roda um caso e imprime o JSON
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--objects", type=int, default=8, help="Moving objects in the synthetic video")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--detector", choices=("auto", "onnx", "stub"), default="auto",
+                        help="Tiny generated ONNX model (needs the 'onnx' package) or an OpenCV stub; "
+                             "auto = onnx when available")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads for ONNX Runtime")
+    parser.add_argument("--modes", nargs="+", choices=("offline", "stream"), default=["offline", "stream"])
+    parser.add_argument("--formats", nargs="+", choices=OFFLINE_FORMATS, default=list(OFFLINE_FORMATS))
+    parser.add_argument("--protocols", nargs="+", choices=STREAM_PROTOCOLS, default=list(STREAM_PROTOCOLS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1])
+    parser.add_argument("--save", help="Write the results (and settings) to this JSON file")
+    parser.add_argument("--baseline", help="Results JSON from a previous --save to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Fail when fps drops more than this fraction below the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show the scripts' stderr")
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="yolo_bench_") as work_dir:
+        video = os.path.join(work_dir, "synthetic.avi")
+        make_synthetic_video(video, args.width, args.height, args.fps, args.seconds, args.objects, args.seed)
+
+        detector = "stub" if args.detector == "stub" else "onnx"
+        model = os.path.join(work_dir, "bench.onnx")
+        if detector == "onnx" and not make_tiny_onnx(model):
+            if args.detector == "onnx":
+                parser.error("--detector onnx needs the 'onnx' package")
+            detector = "stub"
+        if detector == "stub":
+            open(model, "wb").close()   # o stream exige que o arquivo do modelo exista
+
+        print(f"synthetic video: {args.width}x{args.height} @ {args.fps:g} fps, {args.seconds:g} s, "
+              f"{args.objects} objects, {format_bytes(os.path.getsize(video))}; detector = {detector}")
+        print()
+
+        results = [run_in_subprocess(case, args.verbose)
+                   for case in build_cases(args, work_dir, video, model, detector)]
+
+    print_report(results)
+
+    settings = {k: v for k, v in vars(args).items() if k not in ("case", "save", "baseline", "verbose")}
+    settings["detector"] = detector
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "results": results}, f, indent=2)
+
+    if args.baseline:
+        regressions = compare_baseline(results, settings, args.baseline, args.max_regression)
+        if regressions:
+            print("\nThroughput regressions:")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\nNo case regressed more than {args.max_regression:.0%} against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,81 +1,516 @@
 import argparse
 import json
+import os
+import sys
+import time
 
-import cv2
-from ultralytics import YOLO
-import supervision as sv
+import numpy as np
 
+# módulos compartilhados com o process_video_stream.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "YoloOnnxForms", "Python"))
 
-def process_video(model_path, video_path, conf, output_path):
-    model = YOLO(model_path)
-    tracker = sv.ByteTrack()
+from lazy_import import lazy_module  # noqa: E402
+from detectors import add_backend_args, load_detector  # noqa: E402
+from detection_cache import RecordingDetector, ResultRecorder, add_cache_args, create_cache  # noqa: E402
+from detection_columns import ColumnarWriter, SeenPairs, columns_to_records  # noqa: E402
+from region_detectors import RescaledDetector, add_region_args, check_region_args, wrap_detector  # noqa: E402
+from stage_metrics import NullMetrics, add_metrics_args, create_metrics  # noqa: E402
+from tracker_config import add_tracker_args, create_tracker, tracker_params  # noqa: E402
+from video_capture import add_capture_args, capture_scale, capture_settings, open_video  # noqa: E402
+from video_checkpoint import (  # noqa: E402
+    DEFAULT_CHECKPOINT_EVERY, VideoCheckpoint, add_checkpoint_args, seek_capture,
+)
 
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    if fps <= 0:
-        fps = 30.0
+# o OpenCV só é importado quando o vídeo é aberto: um acerto no cache de resultados nem chega a isso
+cv2 = lazy_module("cv2")
 
-    frame_idx = 0
 
-    seen = set()  # (class_id, track_id)
-    results = []
+def read_batches(cap, batch_size, max_frames=None):
+    """
+    Lê o vídeo em lotes de até `batch_size` frames (o último pode ser menor).
+    Com `max_frames`, para depois de ler essa quantidade de frames.
+    """
+    batch = []
+    remaining = max_frames
+    while remaining is None or remaining > 0:
+        if remaining is not None:
+            remaining -= 1
 
-    while True:
         ret, frame = cap.read()
         if not ret:
             break
 
-        frame_idx += 1
+        batch.append(frame)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+class JsonArrayWriter:
+    """Formato original: um único array JSON indentado, gravado no final."""
+
+    def __init__(self, path, fps):
+        self.path = path
+        self.results = []
+
+    def write_frame(self, columns):
+        self.results.extend(columns_to_records(columns))
+
+    def close(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.results, f, ensure_ascii=False, indent=2)
+
+    def abort(self):
+        self.results = []
+
+
+class JsonStreamWriter:
+    """
+    Mesmo array JSON (compacto, um objeto por linha), mas gravado à medida
+    que os frames são processados: memória constante e o arquivo continua
+    sendo lido por quem espera o formato "json".
+    """
+
+    def __init__(self, path, fps):
+        self.file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="\n")
+        self.count = 0
+        self.file.write("[")
+
+    def write_frame(self, columns):
+        records = columns_to_records(columns)
+        if not records:
+            return
+        for r in records:
+            self.file.write(",\n" if self.count else "\n")
+            self.file.write(json.dumps(r, ensure_ascii=False))
+            self.count += 1
+        self.file.flush()
+
+    def close(self):
+        self.file.write("\n]\n")
+        self.file.flush()
+        if self.file is not sys.stdout:
+            self.file.close()
+
+    def abort(self):
+        # o que já saiu fica (array sem o "]"), como numa queda do processo
+        if self.file is not sys.stdout:
+            self.file.close()
+
 
-        yolo_results = model(frame, conf=conf, verbose=False)[0]
-        detections = sv.Detections.from_ultralytics(yolo_results)
-        tracked = tracker.update_with_detections(detections)
+class NdjsonWriter:
+    """Um objeto JSON por linha (NDJSON), descarregado a cada frame; "-" = stdout."""
 
-        time_sec = (frame_idx - 1) / fps
+    def __init__(self, path, fps):
+        self.file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="\n")
 
-        for i in range(len(tracked)):
-            class_id = int(tracked.class_id[i])
-            score = float(tracked.confidence[i])
-            track_id = tracked.tracker_id[i]
+    def write_frame(self, columns):
+        records = columns_to_records(columns)
+        if not records:
+            return
+        self.file.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        self.file.flush()
 
-            if track_id is None:
-                continue
-            track_id = int(track_id)
+    def close(self):
+        self.file.flush()
+        if self.file is not sys.stdout:
+            self.file.close()
 
-            x1, y1, x2, y2 = tracked.xyxy[i]
-            w = float(x2 - x1)
-            h = float(y2 - y1)
+    def abort(self):
+        self.close()
 
-            key = (class_id, track_id)
-            is_new = key not in seen
-            if is_new:
-                seen.add(key)
 
-            results.append({
-                "FrameIndex": frame_idx,
-                "TimeSeconds": float(time_sec),
-                "TrackId": track_id,
-                "ClassId": class_id,
-                "Score": score,
-                "X": float(x1),
-                "Y": float(y1),
-                "W": w,
-                "H": h,
-                "IsNewObject": is_new,
-            })
+OUTPUT_WRITERS = {
+    "json": JsonArrayWriter,
+    "json-stream": JsonStreamWriter,
+    "ndjson": NdjsonWriter,
+    "npz": ColumnarWriter,
+}
 
-    cap.release()
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+def tracked_columns(tracked, frame_idx, time_sec, seen):
+    """
+    Detecções rastreadas de um frame como colunas (mesmas chaves do JSON de
+    saída), calculadas sobre os arrays do sv.Detections de uma vez. Com
+    `seen` None a coluna IsNewObject fica de fora (calculada depois).
+    """
+    if tracked.tracker_id is None:
+        # sem track IDs nenhuma detecção sai (o slice vazio continua com tracker_id None)
+        tracked = tracked[np.zeros(len(tracked), dtype=bool)]
+        track_ids = np.empty(0, dtype=int)
+    else:
+        track_ids = tracked.tracker_id.astype(int)
+
+    count = len(tracked)
+    xyxy = tracked.xyxy
+    class_ids = tracked.class_id.astype(int) if tracked.class_id is not None else np.zeros(count, dtype=int)
+    scores = tracked.confidence if tracked.confidence is not None else np.zeros(count, dtype=np.float32)
+
+    columns = {
+        "FrameIndex": np.full(count, frame_idx),
+        "TimeSeconds": np.full(count, float(time_sec)),
+        "TrackId": track_ids,
+        "ClassId": class_ids,
+        "Score": scores,
+        "X": xyxy[:, 0],
+        "Y": xyxy[:, 1],
+        "W": xyxy[:, 2] - xyxy[:, 0],
+        "H": xyxy[:, 3] - xyxy[:, 1],
+    }
+    if seen is not None:
+        columns["IsNewObject"] = seen.mark_new(class_ids, track_ids)
+    return columns
+
+
+def track_frames(detector, cap, conf, batch_size=1, max_frames=None, metrics=None,
+                 tracker=None, start=0, between_batches=None):
+    """
+    Roda o detector e um ByteTrack (novo, ou `tracker` para continuar um
+    checkpoint) sobre os frames de `cap`, a partir da posição atual. Gera
+    (nº do frame lido, começando em `start` + 1, sv.Detections rastreadas).
+    `between_batches(nº do frame, tracker, último frame)` é chamado depois
+    que todos os frames de um lote foram consumidos, antes de ler o próximo.
+    """
+    if metrics is None:
+        metrics = NullMetrics()
+    if tracker is None:
+        tracker = create_tracker()
+    count = start
+    frames = None
+
+    batches = read_batches(cap, max(1, batch_size), max_frames)
+    while True:
+        if between_batches is not None and frames:
+            between_batches(count, tracker, frames[-1])
+
+        t0 = time.perf_counter()
+        frames = next(batches, None)
+        if frames is None:
+            break
+        metrics.record("decode", time.perf_counter() - t0, len(frames))
+
+        results = detector.detect_batch(frames, conf)
+        metrics.record_detector(detector, len(frames))
+
+        # o ByteTrack continua recebendo um frame por vez, na ordem do vídeo
+        for detections in results:
+            count += 1
+            with metrics.measure("track"):
+                tracked = tracker.update_with_detections(detections)
+            yield count, tracked
+
+
+def retrack_frames(detections, tracker, metrics=None):
+    """
+    Como track_frames, mas sobre as detecções já prontas de cada frame (cache
+    do YOLO): só o ByteTrack roda, sem decodificar o vídeo.
+    """
+    if metrics is None:
+        metrics = NullMetrics()
+    for count, frame_detections in enumerate(detections, 1):
+        with metrics.measure("track"):
+            tracked = tracker.update_with_detections(frame_detections)
+        yield count, tracked
+
+
+def process_video(model_path, video_path, conf, output_path, batch_size=1,
+                  backend="ultralytics", intra_op_threads=0, inter_op_threads=0,
+                  output_format="json", detector=None, metrics=None, checkpoint=None,
+                  tracker_params=None, cache=None, capture=None):
+    """
+    Processa um vídeo e grava as detecções em `output_path`. `detector` permite
+    reaproveitar um modelo já carregado (modo --serve); sem ele o modelo é
+    carregado aqui. `metrics` (stage_metrics.StageMetrics) recebe o tempo de
+    cada estágio. `checkpoint` (video_checkpoint.VideoCheckpoint) grava o
+    progresso periodicamente e, com --resume, continua do último checkpoint.
+    `tracker_params` configura o ByteTrack (tracker_config.TRACKER_DEFAULTS).
+    `cache` (detection_cache.CacheEntry, depois do lookup()) fornece a saída
+    ou as detecções do YOLO guardadas e recebe as desta execução.
+    `capture` (video_capture.CaptureSettings) escolhe o decodificador e a
+    resolução dos frames; o `detector` recebido já deve devolver as caixas
+    na resolução original (wrap_detector com a capture_scale do vídeo).
+    Devolve o nº de frames processados.
+    """
+    if metrics is None:
+        metrics = NullMetrics()
+
+    if cache is not None and cache.results is not None:
+        frames, cached_columns = cache.result_frames()
+        print("Using cached results", file=sys.stderr, flush=True)
+        writer = OUTPUT_WRITERS[output_format](output_path, cache.fps)
+        for columns in cached_columns:
+            writer.write_frame(columns)
+        writer.close()
+        return frames
+
+    frame_idx = 0
+
+    seen = SeenPairs()  # (class_id, track_id)
+    tracker = create_tracker(tracker_params)
+    cap = None
+    recorder = None
+    state = None
+
+    if cache is not None and cache.detections is not None:
+        # mesmas detecções do YOLO, outro tracking: só o ByteTrack roda de novo
+        print("Using cached detections (tracking only)", file=sys.stderr, flush=True)
+        checkpoint = None   # o ByteTrack sozinho leva segundos: não há o que retomar
+        fps = cache.fps
+        writer = OUTPUT_WRITERS[output_format](output_path, fps)
+        tracked_frames = retrack_frames(cache.detection_frames(), tracker, metrics)
+    else:
+        # frames do lote + o último do lote anterior (checkpoint): nenhum buffer é reescrito em uso
+        cap = open_video(video_path, capture, max(1, batch_size) + 1)
+        if detector is None:
+            detector = load_detector(backend, model_path, intra_op_threads, inter_op_threads)
+            if cap.scale != (1.0, 1.0):
+                detector = RescaledDetector(detector, cap.scale)
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps <= 0:
+            fps = 30.0
+        writer = OUTPUT_WRITERS[output_format](output_path, fps)
+
+        between_batches = None
+        if checkpoint is not None:
+            state = checkpoint.restore(writer, seen)
+            if state is not None:
+                frame_idx = state["frames"]
+                tracker = state["tracker"]
+                seen = state["seen"]
+                cap = seek_capture(cap, video_path, frame_idx, state["fingerprint"],
+                                   lambda path: open_video(path, capture, max(1, batch_size) + 1))
+                print(f"Resuming from checkpoint at frame {frame_idx}", file=sys.stderr, flush=True)
+            between_batches = checkpoint.maybe_save
+
+        # execução retomada de um checkpoint não vê o vídeo inteiro: não vai para o cache
+        if cache is not None and state is None:
+            detector = recorder = RecordingDetector(detector)
+        tracked_frames = track_frames(detector, cap, conf, batch_size, metrics=metrics, tracker=tracker,
+                                      start=frame_idx, between_batches=between_batches)
+
+    results = ResultRecorder() if cache is not None and state is None else None
+
+    try:
+        for frame_idx, tracked in tracked_frames:
+            time_sec = (frame_idx - 1) / fps
+
+            with metrics.measure("write"):
+                columns = tracked_columns(tracked, frame_idx, time_sec, seen)
+                writer.write_frame(columns)
+                if checkpoint is not None:
+                    checkpoint.record(columns)
+                if results is not None:
+                    results.record(columns)
+            metrics.frame_done()
+    except BaseException:
+        # erro ou Ctrl+C: libera os temporários do writer e do cache (o checkpoint, se houver, fica para o --resume)
+        writer.abort()
+        for partial in (recorder, results):
+            if partial is not None:
+                partial.abort()
+        raise
+    finally:
+        if cap is not None:
+            cap.release()
+    try:
+        writer.close()
+        if checkpoint is not None:
+            checkpoint.remove()
+        if results is not None:
+            if recorder is not None:
+                cache.store_detections(fps, recorder)
+            cache.store_results(fps, frame_idx, results)
+    finally:
+        # o store já apagou os temporários; aqui só sobra o que um erro deixou
+        for partial in (recorder, results):
+            if partial is not None:
+                partial.abort()
+    return frame_idx
+
+
+def detection_settings(args, conf):
+    """Opções que mudam as detecções do YOLO (entram na chave do cache, junto com vídeo e modelo)."""
+    return {
+        "conf": conf,
+        "backend": args.backend,
+        "roi": args.roi,
+        "tiles": args.tiles,
+        "tile_size": args.tile_size,
+        "tile_overlap": args.tile_overlap,
+        "tile_full_frame": args.tile_full_frame,
+        "capture": capture_settings(args).key(),
+    }
+
+
+def checkpoint_params(args):
+    """O que precisa ser igual para um checkpoint ser retomado: vídeo, modelo e opções que mudam a saída."""
+    ignored = {"resume", "checkpoint_every", "metrics", "metrics_file", "metrics_interval", "serve",
+               "cache_dir", "cache_max_mb"}
+    params = {k: v for k, v in vars(args).items() if k not in ignored}
+    for key in ("video", "model"):
+        stat = os.stat(params[key])
+        params[key] = (os.path.abspath(params[key]), stat.st_size, stat.st_mtime_ns)
+    return params
+
+
+def serve(args):
+    """
+    Worker persistente: carrega o modelo uma vez e processa vários vídeos em
+    sequência, sem pagar de novo a subida do Python e o import/carga do YOLO.
+
+    Cada linha do stdin é um job JSON:
+        {"id": ..., "video": "...", "output": "...",
+         "conf": 0.25, "format": "json", "batch_size": 1, "model": "...",
+         "tracker": {"minimum_matching_threshold": 0.9, ...}}
+    (só "video" e "output" são obrigatórios; o resto usa os argumentos da
+    linha de comando; "tracker" sobrescreve só os parâmetros do ByteTrack
+    informados). {"cmd": "quit"} ou o fim do stdin encerram. Com
+    --cache-dir os jobs usam o cache (detection_cache.py).
+
+    Cada job gera exatamente uma linha JSON no stdout:
+        {"id": ..., "status": "ok", "frames": N, "seconds": t}
+        {"id": ..., "status": "error", "error": "..."}
+    Antes do primeiro job sai {"event": "ready", "load_seconds": t}.
+    """
+    detectors = {}   # (backend, caminho do modelo) -> detector já carregado
+    cache = create_cache(args)
+    default_tracker = tracker_params(args)
+    capture = capture_settings(args)
+
+    def get_detector(model_path):
+        key = (args.backend, os.path.abspath(model_path))
+        if key not in detectors:
+            detectors[key] = load_detector(args.backend, model_path, args.intra_op_threads,
+                                           args.inter_op_threads, args.model_cache)
+        return detectors[key]
+
+    def reply(obj):
+        sys.stdout.write(json.dumps(obj) + "\n")
+        sys.stdout.flush()
+
+    t0 = time.perf_counter()
+    get_detector(args.model)
+    reply({"event": "ready", "load_seconds": round(time.perf_counter() - t0, 3)})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get("id")
+            if job.get("cmd") == "quit":
+                break
+
+            output_format = job.get("format", args.format)
+            if output_format not in OUTPUT_WRITERS:
+                raise ValueError(f"unknown format: {output_format}")
+            if job["output"] == "-":
+                raise ValueError("output '-' is not allowed in --serve mode (stdout carries the replies)")
+            if not os.path.isfile(job["video"]):
+                raise FileNotFoundError(f"video not found: {job['video']}")
+
+            model_path = job.get("model", args.model)
+            conf = float(job.get("conf", args.conf))
+            params = {**default_tracker, **job.get("tracker", {})}
+            t0 = time.perf_counter()
+            entry = None
+            if cache is not None:
+                entry = cache.entry(job["video"], model_path, detection_settings(args, conf), params).lookup()
+            detector = None
+            if entry is None or entry.needs_detector:
+                # ROI/tiles e a escala da captura dependem do vídeo; só o modelo carregado é reaproveitado
+                detector = wrap_detector(get_detector(model_path), args,
+                                         scale=capture_scale(job["video"], capture))
+            frames = process_video(
+                model_path,
+                job["video"],
+                conf,
+                job["output"],
+                int(job.get("batch_size", args.batch_size)),
+                output_format=output_format,
+                detector=detector,
+                tracker_params=params,
+                cache=entry,
+                capture=capture,
+            )
+            reply({"id": job_id, "status": "ok", "frames": frames,
+                   "seconds": round(time.perf_counter() - t0, 3)})
+        except Exception as exc:
+            # um job ruim não derruba o worker
+            reply({"id": job_id, "status": "error", "error": f"{type(exc).__name__}: {exc}"})
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--model", required=True, help="Caminho para best.pt")
-    parser.add_argument("--video", required=True, help="Caminho do vdeo")
+    parser.add_argument("--model", required=True, help="Caminho para best.pt (ou best.onnx)")
+    parser.add_argument("--video", help="Caminho do vídeo")
     parser.add_argument("--conf", type=float, default=0.25)
-    parser.add_argument("--output", required=True, help="Caminho do JSON de sada")
+    parser.add_argument("--output", help="Caminho do JSON de saída (\"-\" = stdout)")
+    parser.add_argument("--format", choices=tuple(OUTPUT_WRITERS), default="json",
+                        help="json = array indentado gravado no final; json-stream = mesmo array, "
+                             "gravado frame a frame; ndjson = um objeto por linha, frame a frame; "
+                             "npz = colunas tipadas (ver detection_columns.load_detections)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Frames por chamada do YOLO (1 = frame a frame)")
+    parser.add_argument("--serve", action="store_true",
+                        help="Worker persistente: lê jobs JSON do stdin (ver serve())")
+    add_backend_args(parser)
+    add_region_args(parser)
+    add_capture_args(parser)
+    add_tracker_args(parser)
+    add_cache_args(parser)
+    add_checkpoint_args(parser)
+    add_metrics_args(parser)
     args = parser.parse_args()
 
-    process_video(args.model, args.video, args.conf, args.output)
+    if args.serve:
+        serve(args)
+        sys.exit(0)
+
+    if not args.video or not args.output:
+        parser.error("--video and --output are required (unless --serve)")
+
+    try:
+        check_region_args(args)
+        params = tracker_params(args)
+        capture = capture_settings(args)
+        cache = create_cache(args)
+        entry = None
+        if cache is not None:
+            entry = cache.entry(args.video, args.model, detection_settings(args, args.conf), params).lookup()
+
+        # com o resultado (ou as detecções) em cache o modelo nem é carregado
+        detector = None
+        if entry is None or entry.needs_detector:
+            detector = wrap_detector(
+                load_detector(args.backend, args.model, args.intra_op_threads, args.inter_op_threads,
+                              args.model_cache), args, scale=capture_scale(args.video, capture))
+    except (ValueError, OSError) as exc:
+        parser.error(str(exc))
+
+    checkpoint = None
+    if args.checkpoint_every > 0 or args.resume:
+        if args.output == "-":
+            parser.error("--checkpoint-every/--resume need an output file, not stdout")
+        checkpoint = VideoCheckpoint(args.output, checkpoint_params(args),
+                                     args.checkpoint_every or DEFAULT_CHECKPOINT_EVERY, args.resume)
+
+    metrics = create_metrics(args)
+    try:
+        process_video(args.model, args.video, args.conf, args.output, args.batch_size,
+                      output_format=args.format, detector=detector, metrics=metrics, checkpoint=checkpoint,
+                      tracker_params=params, cache=entry, capture=capture)
+    except ValueError as exc:
+        # checkpoint de outra execução ou vídeo que não bate com ele
+        print(f"ERROR: {exc}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        # resumo final e --metrics-file fechado mesmo com erro ou Ctrl+C
+        metrics.close()
@@ -0,0 +1,513 @@
+"""
+process_video_batch.py
+
+Processa vários vídeos, ou um vídeo longo dividido em segmentos, em paralelo
+num pool de processos. Cada worker carrega o próprio modelo uma vez (no
+initializer) e cada segmento roda com um ByteTrack próprio, usando as mesmas
+funções do process_video.py.
+
+Segmentos (--segments N):
+- As fronteiras caem em keyframes quando o ffprobe está disponível (o seek do
+  OpenCV num keyframe é exato); sem ele o vídeo é dividido em partes iguais e
+  o seek fica por conta do CAP_PROP_POS_FRAMES. A posição é conferida depois
+  do seek (se o OpenCV parou em outro frame, o segmento reabre o vídeo e
+  avança com grab()) e, no fim, o 1º frame de cada segmento é comparado com
+  o mesmo frame visto pelo segmento anterior no overlap; se não bater, o
+  vídeo falha em vez de sair com FrameIndex errados.
+- Cada segmento (menos o primeiro) começa a decodificar --overlap-seconds
+  antes da sua fronteira. Esses frames só aquecem o tracker: as detecções
+  deles são comparadas (IoU, mesma classe) com as do segmento anterior nos
+  mesmos frames para costurar os track IDs, e depois descartadas.
+
+Na saída, FrameIndex/TimeSeconds são os do vídeo inteiro, os TrackId são
+únicos no vídeo (um track que atravessa a fronteira mantém o ID) e
+IsNewObject é recalculado na ordem dos frames. Com --segments 1 a saída é
+idêntica à do process_video.py.
+
+Com --segments > 1 a saída não é idêntica: cada segmento começa com um
+ByteTrack novo, que só conhece o que viu no overlap. Um objeto perdido de
+vista antes do overlap e que reaparece depois da fronteira ganharia um ID
+novo; match_lost_tracks costura esses casos pela última caixa do track
+antigo. O que sobra é o desvio normal de um tracker com outro histórico
+(IDs trocados ou detecções que o vídeo inteiro descartaria), que aparece no
+meio dos segmentos e não só nas fronteiras. No vídeo sintético do
+bench_pipeline.py, com 3 segmentos, a contagem de IsNewObject ficou dentro
+de ±2% da do vídeo inteiro com o overlap padrão; overlaps curtos (< 1 s)
+aumentam o desvio.
+
+Um vídeo que falha (erro em qualquer segmento) fica sem saída, o erro vai
+para o stderr e os outros vídeos continuam; no fim o código de saída é 1.
+
+    python process_video_batch.py --model best.onnx --backend onnxruntime \\
+        --videos a.mp4 b.mp4 --output-dir saida --workers 4
+    python process_video_batch.py --model best.pt --videos longo.mp4 \\
+        --output longo.json --segments 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+import supervision as sv
+
+from process_video import OUTPUT_WRITERS, track_frames, tracked_columns
+from detectors import add_backend_args, load_detector
+from region_detectors import add_region_args, check_region_args, wrap_detector
+from detection_columns import SeenPairs
+from video_checkpoint import frame_fingerprint
+
+DEFAULT_OVERLAP_SECONDS = 2.0
+STITCH_IOU = 0.5
+STITCH_LOST_IOU = 0.3       # última caixa de um track perdido x 1ª caixa do track novo (o objeto andou no intervalo)
+STITCH_LOST_FRAMES = 30     # mesmo padrão do lost_track_buffer do ByteTrack
+
+OUTPUT_EXTENSIONS = {"json": ".json", "json-stream": ".json", "ndjson": ".ndjson", "npz": ".npz"}
+
+
+# ============================================================
+# SEGMENTOS
+# ============================================================
+
+def probe_frames(video_path):
+    """
+    Lista os pacotes de vídeo com o ffprobe (só demux, sem decodificar) e
+    devolve (nº de frames, índices dos keyframes em ordem de apresentação).
+    None se o ffprobe não estiver disponível ou falhar.
+    """
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None:
+        return None
+
+    cmd = [ffprobe, "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "packet=pts,flags", "-of", "csv=p=0", video_path]
+    try:
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    packets = []
+    for line in out.splitlines():
+        pts, _, flags = line.partition(",")
+        if pts.strip().lstrip("-").isdigit():
+            packets.append((int(pts), "K" in flags))
+    if not packets:
+        return None
+
+    # os pacotes vêm em ordem de decodificação; o índice do frame é a ordem do pts
+    packets.sort()
+    keyframes = [i for i, (_, key) in enumerate(packets) if key]
+    return len(packets), keyframes
+
+
+def plan_segments(frame_count, segments, overlap_frames, keyframes=None):
+    """
+    Divide [0, frame_count) em até `segments` partes. Devolve uma lista de
+    (início da decodificação, início, fim) com índices base 0; o fim do último
+    segmento é None (lê até o fim, mesmo se frame_count for aproximado).
+    """
+    if segments <= 1 or frame_count <= 1:
+        return [(0, 0, None)]
+
+    bounds = []
+    for k in range(1, segments):
+        target = frame_count * k // segments
+        if keyframes:
+            target = min(keyframes, key=lambda f: abs(f - target))
+        if 0 < target < frame_count and (not bounds or target > bounds[-1]):
+            bounds.append(target)
+
+    plan = []
+    for start, end in zip([0] + bounds, bounds + [None]):
+        decode_start = max(0, start - overlap_frames)
+        if keyframes and start > 0:
+            decode_start = max([f for f in keyframes if f <= decode_start] or [0])
+        plan.append((decode_start, start, end))
+    return plan
+
+
+# ============================================================
+# WORKER
+# ============================================================
+
+_detector = None
+
+
+def _init_worker(args, intra_op_threads):
+    global _detector
+    detector = load_detector(args.backend, args.model, intra_op_threads, args.inter_op_threads, args.model_cache)
+    _detector = wrap_detector(detector, args)
+
+
+class _FingerprintCapture:
+    """
+    Repassa o read() de `cap` (posicionado no frame `position`, base 0) e
+    guarda a impressão digital dos frames em `positions` quando passa por eles.
+    """
+
+    def __init__(self, cap, position, positions):
+        self.cap = cap
+        self.position = position
+        self.positions = set(positions)
+        self.fingerprints = {}
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if ret:
+            if self.position in self.positions:
+                self.fingerprints[self.position] = frame_fingerprint(frame)
+            self.position += 1
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+def _open_at(video_path, frame):
+    """
+    VideoCapture posicionado no frame `frame` (base 0). Confere a posição
+    depois do seek; se o OpenCV parou em outro frame (keyframe de H.264/HEVC),
+    reabre o vídeo e descarta os frames com grab(), que é exato.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if frame == 0:
+        return cap
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame:
+        return cap
+
+    cap.release()
+    cap = cv2.VideoCapture(video_path)
+    for _ in range(frame):
+        if not cap.grab():
+            cap.release()
+            raise ValueError(f"Video ended before frame {frame + 1}: {video_path}")
+    return cap
+
+
+def _track_segment(video_path, decode_start, end, conf, batch_size, fps, check_frames=()):
+    """
+    Roda um segmento no worker e devolve (colunas, impressões digitais). As
+    colunas (sem IsNewObject) são as de todos os frames a partir de
+    `decode_start`, com FrameIndex do vídeo inteiro e os track IDs locais do
+    ByteTrack do segmento; as impressões digitais são as dos frames de
+    `check_frames` (base 0) que o segmento decodificou, para check_seeks.
+    """
+    cap = _FingerprintCapture(_open_at(video_path, decode_start), decode_start,
+                              [decode_start, *check_frames])
+
+    max_frames = None if end is None else end - decode_start
+    chunks = []
+    for n, tracked in track_frames(_detector, cap, conf, batch_size, max_frames):
+        frame_idx = decode_start + n
+        chunks.append(tracked_columns(tracked, frame_idx, (frame_idx - 1) / fps, None))
+
+    cap.release()
+    if not chunks:
+        return None, cap.fingerprints
+    return {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}, cap.fingerprints
+
+
+# ============================================================
+# MERGE
+# ============================================================
+
+def _take(columns, rows):
+    return {key: values[rows] for key, values in columns.items()}
+
+
+def _boxes(columns, rows):
+    x, y = columns["X"][rows], columns["Y"][rows]
+    return np.stack([x, y, x + columns["W"][rows], y + columns["H"][rows]], axis=1)
+
+
+def match_tracks(previous, current, first_frame, last_frame):
+    """
+    Associa os track IDs de `current` aos de `previous` pelos frames
+    [first_frame, last_frame] que os dois segmentos processaram: em cada frame
+    as caixas de mesma classe são pareadas pelo maior IoU e cada par vale um
+    voto. Devolve {id local em current: id em previous}, um para um.
+    """
+    votes = {}
+    for frame_idx in range(first_frame, last_frame + 1):
+        prev_rows = np.flatnonzero(previous["FrameIndex"] == frame_idx)
+        cur_rows = np.flatnonzero(current["FrameIndex"] == frame_idx)
+        if len(prev_rows) == 0 or len(cur_rows) == 0:
+            continue
+
+        iou = sv.box_iou_batch(_boxes(current, cur_rows), _boxes(previous, prev_rows))
+        iou[current["ClassId"][cur_rows][:, None] != previous["ClassId"][prev_rows][None, :]] = 0
+
+        paired_cur, paired_prev = set(), set()
+        for i, j in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+            if iou[i, j] < STITCH_IOU:
+                break
+            if i in paired_cur or j in paired_prev:
+                continue
+            paired_cur.add(i)
+            paired_prev.add(j)
+            key = (int(current["TrackId"][cur_rows[i]]), int(previous["TrackId"][prev_rows[j]]))
+            votes[key] = votes.get(key, 0) + 1
+
+    mapping = {}
+    used = set()
+    for (cur_id, prev_id), _ in sorted(votes.items(), key=lambda kv: -kv[1]):
+        if cur_id not in mapping and prev_id not in used:
+            mapping[cur_id] = prev_id
+            used.add(prev_id)
+    return mapping
+
+
+def _track_ends(columns, rows, ids, last):
+    """{track ID: (frame, classe, caixa)} da última (last=True) ou primeira aparição de cada ID."""
+    order = rows[::-1] if last else rows
+    ends = {}
+    for row in order.tolist():
+        track_id = int(columns["TrackId"][row])
+        if track_id in ids and track_id not in ends:
+            ends[track_id] = (int(columns["FrameIndex"][row]), int(columns["ClassId"][row]),
+                              _boxes(columns, [row])[0])
+    return ends
+
+
+def match_lost_tracks(previous, current, mapping, boundary, window=STITCH_LOST_FRAMES):
+    """
+    Segundo passe depois de match_tracks, para o que a votação no overlap não
+    pega: um objeto que o segmento anterior perdeu de vista até `window`
+    frames antes da fronteira e que reaparece, no segmento atual, até
+    `window` frames depois dela. No vídeo inteiro o ByteTrack recuperaria o
+    ID do buffer de tracks perdidos; aqui a última caixa do track antigo é
+    comparada (IoU, mesma classe) com a primeira do track novo, que precisa
+    começar depois que o antigo sumiu. Completa `mapping` e o devolve.
+    """
+    used = set(mapping.values())
+    prev_rows = np.flatnonzero((previous["FrameIndex"] >= boundary - window)
+                               & (previous["FrameIndex"] <= boundary))
+    cur_rows = np.flatnonzero(current["FrameIndex"] <= boundary + window)
+    lost = _track_ends(previous, prev_rows,
+                       set(np.unique(previous["TrackId"][prev_rows]).tolist()) - used, last=True)
+    # o track antigo precisa ter sumido: a última aparição dele no segmento anterior é antes da fronteira
+    lost = {i: end for i, end in lost.items() if end[0] < boundary}
+    new = _track_ends(current, cur_rows,
+                      set(np.unique(current["TrackId"][cur_rows]).tolist()) - set(mapping), last=False)
+
+    pairs = []
+    for cur_id, (cur_frame, cur_class, cur_box) in new.items():
+        for prev_id, (prev_frame, prev_class, prev_box) in lost.items():
+            if cur_class != prev_class or cur_frame <= prev_frame:
+                continue
+            iou = float(sv.box_iou_batch(cur_box[None], prev_box[None])[0, 0])
+            if iou >= STITCH_LOST_IOU:
+                pairs.append((iou, cur_id, prev_id))
+
+    for _, cur_id, prev_id in sorted(pairs, reverse=True):
+        if cur_id not in mapping and prev_id not in used:
+            mapping[cur_id] = prev_id
+            used.add(prev_id)
+    return mapping
+
+
+def check_seeks(plan, fingerprints):
+    """
+    Confere que cada segmento começou no frame certo: o 1º frame decodificado
+    por ele tem que ser o mesmo que o segmento anterior (posicionado pelo
+    mesmo critério, e o primeiro começa do início) viu naquela posição do
+    overlap. ValueError se não for: os FrameIndex desse segmento estariam
+    errados, então o vídeo não é dividido.
+    """
+    for k in range(1, len(plan)):
+        decode_start = plan[k][0]
+        expected = fingerprints[k - 1].get(decode_start)
+        actual = fingerprints[k].get(decode_start)
+        if expected is not None and actual is not None and expected != actual:
+            raise ValueError(f"segment {k + 1} did not start at frame {decode_start + 1} (inexact seek); "
+                             "run it with --segments 1 or install ffprobe")
+
+
+def merge_segments(plan, results):
+    """
+    Junta as colunas dos segmentos de um vídeo (na ordem de `plan`): descarta
+    os frames de aquecimento, costura os track IDs na fronteira e dá IDs
+    novos, acima dos já usados, aos tracks que não continuam do segmento
+    anterior. Recalcula IsNewObject no final.
+    """
+    merged = []
+    previous = None
+    next_id = 1
+
+    for (decode_start, start, _), columns in zip(plan, results):
+        if columns is None:
+            previous = None
+            continue
+
+        if previous is None:
+            mapping = {}
+        else:
+            mapping = match_tracks(previous, columns, decode_start + 1, start)
+            mapping = match_lost_tracks(previous, columns, mapping, start)
+
+        local_ids = columns["TrackId"]
+        if not merged:
+            # o primeiro segmento mantém os IDs do ByteTrack (igual ao process_video)
+            mapping.update({int(i): int(i) for i in np.unique(local_ids)})
+        for local_id in np.unique(local_ids).tolist():
+            if local_id not in mapping:
+                mapping[local_id] = next_id
+                next_id += 1
+
+        columns["TrackId"] = np.array([mapping[i] for i in local_ids.tolist()], dtype=local_ids.dtype)
+        if len(local_ids):
+            next_id = max(next_id, int(columns["TrackId"].max()) + 1)
+
+        previous = columns
+        merged.append(_take(columns, columns["FrameIndex"] > start))
+
+    if not merged:
+        return None
+
+    columns = {key: np.concatenate([c[key] for c in merged]) for key in merged[0]}
+    # linhas em ordem de frame: a 1ª ocorrência de cada par é a do frame em que ele apareceu
+    columns["IsNewObject"] = SeenPairs().mark_new(columns["ClassId"], columns["TrackId"])
+    return columns
+
+
+# ============================================================
+# MAIN
+# ============================================================
+
+def output_path_for(args, video_path):
+    if args.output:
+        return args.output
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(args.output_dir, stem + OUTPUT_EXTENSIONS[args.format])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True, help="Caminho para best.pt (ou best.onnx)")
+    parser.add_argument("--videos", nargs="+", required=True, help="Vídeos a processar")
+    parser.add_argument("--output", help="Arquivo de saída (só com um vídeo)")
+    parser.add_argument("--output-dir", help="Pasta de saída: um arquivo por vídeo, com o nome do vídeo")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--format", choices=tuple(OUTPUT_WRITERS), default="json",
+                        help="Mesmos formatos do process_video.py")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Frames por chamada do YOLO em cada worker")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processos no pool (cada um carrega o modelo)")
+    parser.add_argument("--segments", type=int, default=1,
+                        help="Divide cada vídeo em até N segmentos processados em paralelo "
+                             "(os track IDs podem divergir um pouco do vídeo inteiro)")
+    parser.add_argument("--overlap-seconds", type=float, default=DEFAULT_OVERLAP_SECONDS,
+                        help="Frames antes de cada fronteira usados para aquecer o tracker "
+                             "e costurar os track IDs")
+    add_backend_args(parser)
+    add_region_args(parser)
+    args = parser.parse_args()
+
+    if bool(args.output) == bool(args.output_dir):
+        parser.error("use either --output (single video) or --output-dir")
+    if args.output and len(args.videos) > 1:
+        parser.error("--output accepts a single video; use --output-dir")
+    if args.output == "-":
+        parser.error("--output '-' is not supported")
+    for video in args.videos:
+        if not os.path.isfile(video):
+            parser.error(f"video not found: {video}")
+    try:
+        check_region_args(args)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    workers = max(1, args.workers)
+    intra_op_threads = args.intra_op_threads
+    if intra_op_threads == 0:
+        # sem isso cada worker abre um thread por núcleo e eles brigam pela CPU
+        intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    jobs = {}   # vídeo -> (fps, plano, resultados por segmento)
+    t0 = time.perf_counter()
+    # spawn também no Linux: fork depois de carregar torch/onnxruntime não é seguro
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(args, intra_op_threads)) as pool:
+        futures = {}
+        for video in args.videos:
+            cap = cv2.VideoCapture(video)
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            if fps <= 0:
+                fps = 30.0
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+
+            keyframes = None
+            if args.segments > 1:
+                probed = probe_frames(video)
+                if probed is not None:
+                    frame_count, keyframes = probed
+
+            plan = plan_segments(frame_count, args.segments,
+                                 int(round(args.overlap_seconds * fps)), keyframes)
+            jobs[video] = (fps, plan, [None] * len(plan))
+            for i, (decode_start, _, end) in enumerate(plan):
+                # o 1º frame do próximo segmento, visto daqui pelo overlap, confere o seek dele
+                check_frames = [plan[i + 1][0]] if i + 1 < len(plan) else []
+                future = pool.submit(_track_segment, video, decode_start, end,
+                                     args.conf, args.batch_size, fps, check_frames)
+                futures[future] = (video, i)
+
+        pending = {video: len(plan) for video, (_, plan, _) in jobs.items()}
+        failed = []
+        for future in as_completed(futures):
+            video, i = futures[future]
+            if video in failed:
+                continue
+            fps, plan, results = jobs[video]
+            try:
+                results[i] = future.result()
+            except Exception as exc:
+                # um vídeo com erro não derruba os outros: fica sem saída e o código de saída vira 1
+                print(f"[BATCH] {video}: segment {i + 1}/{len(plan)} failed: {exc!r}", file=sys.stderr)
+                failed.append(video)
+                jobs[video] = None
+                continue
+            pending[video] -= 1
+            if pending[video]:
+                continue
+
+            # todos os segmentos do vídeo prontos: grava a saída
+            try:
+                check_seeks(plan, [fingerprints for _, fingerprints in results])
+            except ValueError as exc:
+                print(f"[BATCH] {video}: {exc}", file=sys.stderr)
+                failed.append(video)
+                jobs[video] = None
+                continue
+            columns = merge_segments(plan, [columns for columns, _ in results])
+            output_path = output_path_for(args, video)
+            writer = OUTPUT_WRITERS[args.format](output_path, fps)
+            if columns is not None:
+                writer.write_frame(columns)
+            writer.close()
+            jobs[video] = None
+
+            print(f"[BATCH] {video}: {len(plan)} segment(s) -> {output_path} "
+                  f"({time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+
+    if failed:
+        print(f"[BATCH] {len(failed)} of {len(args.videos)} video(s) failed: {', '.join(failed)}",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
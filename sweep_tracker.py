@@ -0,0 +1,256 @@
+"""
+sweep_tracker.py
+
+Varredura dos parâmetros do ByteTrack sobre um vídeo: o YOLO roda uma vez
+só, as detecções brutas de cada frame ficam no cache de detecções
+(detection_cache.py, det-*.npz, o mesmo do process_video.py --cache-dir) e
+cada combinação de parâmetros refaz só o tracking, em paralelo num pool de
+processos. Refazer o tracking custa uma fração mínima da inferência, então
+dá para testar dezenas de combinações no tempo de uma execução normal.
+
+Cada opção do ByteTrack aceita vários valores e todas as combinações são
+testadas. Por combinação sai:
+
+    objects       objetos únicos (pares classe + track ID), o que o
+                  IsNewObject conta
+    short         tracks vistos em menos de --short-track-frames frames
+                  (IDs que piscam e somem: fragmentação)
+    mean_frames   média de frames em que cada track foi visto
+    coverage      média, por track, de frames vistos / frames entre a 1ª e a
+                  última aparição (1.0 = nunca perdido no meio do caminho)
+    tracked       fração das detecções do YOLO que saíram com track ID
+
+Os valores escolhidos vão para as constantes BYTE_* do
+process_video_stream.py (que usa o FPS do vídeo como frame_rate: passe o
+mesmo em --track-frame-rate) ou para as opções do process_video.py.
+
+    python sweep_tracker.py --model best.onnx --backend onnxruntime \\
+        --video clip.mp4 --conf 0.25 \\
+        --min-matching-threshold 0.7 0.8 0.9 --min-consecutive-frames 1 3 10 \\
+        --output sweep.json
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from process_video import detection_settings, read_batches
+from detection_cache import DEFAULT_CACHE_MAX_MB, DetectionCache, RecordingDetector, detection_frames
+from detectors import add_backend_args, load_detector
+from region_detectors import add_region_args, check_region_args, wrap_detector
+from tracker_config import TRACKER_DEFAULTS, create_tracker
+from video_capture import add_capture_args, capture_scale, capture_settings, open_video
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "yolo_detection_cache")
+DEFAULT_SHORT_TRACK_FRAMES = 5
+
+# opção de linha de comando -> parâmetro do sv.ByteTrack
+SWEEP_OPTIONS = (
+    ("track_activation_threshold", "track_activation_threshold", float),
+    ("lost_track_buffer", "lost_track_buffer", int),
+    ("min_matching_threshold", "minimum_matching_threshold", float),
+    ("min_consecutive_frames", "minimum_consecutive_frames", int),
+    ("track_frame_rate", "frame_rate", int),
+)
+
+
+# ============================================================
+# DETECÇÕES
+# ============================================================
+
+def detect_video(detector, video_path, conf, batch_size, capture=None):
+    """
+    Roda o YOLO em todos os frames. Devolve (fps, RecordingDetector), com as
+    detecções de cada frame já em disco, prontas para o store_detections.
+    """
+    cap = open_video(video_path, capture, max(1, batch_size))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps <= 0:
+        fps = 30.0
+
+    recorder = RecordingDetector(detector)
+    try:
+        for frames in read_batches(cap, max(1, batch_size)):
+            recorder.detect_batch(frames, conf)
+    except BaseException:
+        recorder.abort()
+        raise
+    finally:
+        cap.release()
+    return fps, recorder
+
+
+def load_or_detect(args):
+    """
+    Arrays do det-*.npz do vídeo (ver detection_cache.py). Se ainda não
+    estiverem no cache, roda o YOLO agora e grava.
+    """
+    cache = DetectionCache(args.cache_dir, args.cache_max_mb)
+    entry = cache.entry(args.video, args.model, detection_settings(args, args.conf), {})
+    arrays = cache.load("det", entry.detection_key)
+    if arrays is not None:
+        print(f"Using cached detections from {args.cache_dir}", file=sys.stderr, flush=True)
+        return arrays
+
+    t0 = time.perf_counter()
+    capture = capture_settings(args)
+    detector = wrap_detector(
+        load_detector(args.backend, args.model, args.intra_op_threads, args.inter_op_threads,
+                      args.model_cache), args, scale=capture_scale(args.video, capture))
+    fps, recorder = detect_video(detector, args.video, args.conf, args.batch_size, capture)
+    print(f"Detection pass: {recorder.spool.frames} frames in {time.perf_counter() - t0:.1f}s",
+          file=sys.stderr, flush=True)
+
+    entry.store_detections(fps, recorder)
+    arrays = cache.load("det", entry.detection_key)
+    if arrays is None:
+        raise ValueError("the detections do not fit in the cache; raise --cache-max-mb")
+    return arrays
+
+
+# ============================================================
+# TRACKING
+# ============================================================
+
+def track_stats(arrays, params, short_track_frames=DEFAULT_SHORT_TRACK_FRAMES):
+    """Refaz o tracking das detecções `arrays` com `params` e devolve as métricas da combinação."""
+    t0 = time.perf_counter()
+    tracker = create_tracker(params)
+    first, last, observed = {}, {}, {}     # (classe, track ID) -> frame / nº de frames
+    tracked_count = 0
+
+    for frame_idx, detections in enumerate(detection_frames(arrays), 1):
+        tracked = tracker.update_with_detections(detections)
+        if tracked.tracker_id is None or len(tracked) == 0:
+            continue
+        tracked_count += len(tracked)
+        for key in zip(tracked.class_id.tolist(), tracked.tracker_id.tolist()):
+            first.setdefault(key, frame_idx)
+            last[key] = frame_idx
+            observed[key] = observed.get(key, 0) + 1
+
+    keys = list(observed)
+    lengths = np.array([observed[k] for k in keys], dtype=np.float64)
+    spans = np.array([last[k] - first[k] + 1 for k in keys], dtype=np.float64)
+    per_class = {}
+    for class_id, _ in keys:
+        per_class[str(class_id)] = per_class.get(str(class_id), 0) + 1
+    raw_count = len(arrays["confidence"])
+
+    return {
+        "params": params,
+        "objects": len(keys),
+        "objects_per_class": per_class,
+        "short": int((lengths < short_track_frames).sum()),
+        "mean_frames": round(float(lengths.mean()), 2) if keys else 0.0,
+        "coverage": round(float((lengths / spans).mean()), 4) if keys else 0.0,
+        "tracked": round(tracked_count / raw_count, 4) if raw_count else 0.0,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+_arrays = None
+_short_track_frames = DEFAULT_SHORT_TRACK_FRAMES
+
+
+def _init_worker(arrays, short_track_frames):
+    # as detecções vão uma vez para cada worker, não a cada combinação
+    global _arrays, _short_track_frames
+    _arrays = arrays
+    _short_track_frames = short_track_frames
+
+
+def _run_config(params):
+    return track_stats(_arrays, params, _short_track_frames)
+
+
+def sweep_configs(args):
+    """Todas as combinações dos valores passados, como dicts de parâmetros do sv.ByteTrack."""
+    names = [param for _, param, _ in SWEEP_OPTIONS]
+    values = [getattr(args, option) for option, _, _ in SWEEP_OPTIONS]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+# ============================================================
+# MAIN
+# ============================================================
+
+def print_table(results):
+    header = ("act", "lost", "match", "consec", "fps", "objects", "short", "mean_frames", "coverage",
+              "tracked", "s")
+    rows = []
+    for r in results:
+        p = r["params"]
+        rows.append((p["track_activation_threshold"], p["lost_track_buffer"], p["minimum_matching_threshold"],
+                     p["minimum_consecutive_frames"], p["frame_rate"], r["objects"], r["short"],
+                     r["mean_frames"], r["coverage"], r["tracked"], r["seconds"]))
+    widths = [max(len(str(v)) for v in column) for column in zip(header, *rows)]
+    for row in [header] + rows:
+        print("  ".join(str(v).rjust(w) for v, w in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True, help="Caminho para best.pt (ou best.onnx)")
+    parser.add_argument("--video", required=True, help="Vídeo usado na varredura")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Frames por chamada do YOLO na passada de detecção")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processos que refazem o tracking em paralelo")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Detection cache (same as process_video.py --cache-dir); the YOLO pass "
+                             "only runs when the video/model/conf are not cached yet")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_MAX_MB,
+                        help="Cache size limit in MB")
+    parser.add_argument("--short-track-frames", type=int, default=DEFAULT_SHORT_TRACK_FRAMES,
+                        help="Tracks seen in fewer frames than this count as 'short' (fragmented)")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    for option, param, kind in SWEEP_OPTIONS:
+        parser.add_argument("--" + option.replace("_", "-"), type=kind, nargs="+",
+                            default=[TRACKER_DEFAULTS[param]],
+                            help=f"ByteTrack {param} values to try (default: {TRACKER_DEFAULTS[param]})")
+    add_backend_args(parser)
+    add_region_args(parser)
+    add_capture_args(parser)
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.video):
+        parser.error(f"video not found: {args.video}")
+    try:
+        check_region_args(args)
+        arrays = load_or_detect(args)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    configs = sweep_configs(args)
+    workers = max(1, min(args.workers, len(configs)))
+    t0 = time.perf_counter()
+    if workers == 1:
+        results = [track_stats(arrays, params, args.short_track_frames) for params in configs]
+    else:
+        # spawn também no Linux, como no process_video_batch.py
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(arrays, args.short_track_frames)) as pool:
+            results = list(pool.map(_run_config, configs))
+    print(f"{len(configs)} tracker configurations in {time.perf_counter() - t0:.1f}s "
+          f"({workers} workers)", file=sys.stderr, flush=True)
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()